@@ -0,0 +1,255 @@
+"""
+Pass Analytics Reports
+Builds the admin insight reports from the Parquet snapshot (pass_snapshots.py)
+with vectorized pandas/NumPy group-bys, so they cost no Firestore reads beyond
+the names of the approvers and applicants listed.
+
+Sections of a report:
+- volume: passes per month, by status and by pass type
+- turnaround: minutes from an approval step being requested to its decision,
+  per approver (the busiest TOP_APPROVERS) and per role
+- rejections: rejection rate by department, over decided passes
+- heatmap: passes by local weekday (Monday first) and hour
+- repeat_applicants: applicants with far more passes than others of their type
+  (robust z-score over the median absolute deviation)
+
+A report covers a period: 'year' (the twelve months up to the snapshot watermark),
+a calendar year 'YYYY' or a month 'YYYY-MM'. Only that period's partitions are read.
+Reports are cached per snapshot version and period, so a new export invalidates them.
+"""
+
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+
+from db import get_db
+from pass_snapshots import read_approvals, read_manifest, read_passes
+
+logger = logging.getLogger(__name__)
+
+TOP_APPROVERS = 50
+TOP_OUTLIERS = 25
+# Robust z-score above which an applicant counts as an outlier
+OUTLIER_Z = 3.5
+DECIDED_STATUSES = ['approved', 'auto_approved', 'rejected', 'revoked']
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+# Snapshot columns the reports use; the rest are never read
+PASS_COLUMNS = ['applicant_id', 'applicant_type', 'pass_type', 'status', 'date', 'late_return', 'month', 'department']
+APPROVAL_COLUMNS = ['role', 'status', 'approved_by', 'requested_at', 'decided_at']
+# Reports kept in memory; older snapshot versions are dropped first
+CACHE_SIZE = 16
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def valid_period(period):
+    """True for 'year', 'YYYY' and 'YYYY-MM'."""
+    return period == 'year' or bool(re.fullmatch(r'\d{4}(-(0[1-9]|1[0-2]))?', period or ''))
+
+
+def report_months(period, watermark=None):
+    """Returns the 'YYYY-MM' partitions a period covers."""
+    if re.fullmatch(r'\d{4}-\d{2}', period or ''):
+        return [period]
+    if re.fullmatch(r'\d{4}', period or ''):
+        return [f"{period}-{month:02d}" for month in range(1, 13)]
+    end = datetime.fromisoformat(watermark) if watermark else datetime.now()
+    months = []
+    year, month = end.year, end.month
+    for _ in range(12):
+        months.append(f"{year}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return months[::-1]
+
+
+def _round(series, digits=1):
+    """Rounded floats with missing values as None, ready for JSON."""
+    return [None if value != value else round(float(value), digits) for value in series.to_numpy()]
+
+
+def _volume(passes):
+    months = sorted(passes['month'].astype(str).unique())
+    by_status = passes.groupby([passes['month'].astype(str), 'status'], observed=True).size() \
+        .unstack(fill_value=0).reindex(months, fill_value=0)
+    by_type = passes.groupby([passes['month'].astype(str), 'pass_type'], observed=True).size() \
+        .unstack(fill_value=0).reindex(months, fill_value=0)
+    return {
+        'months': months,
+        'total': int(len(passes)),
+        'by_month': by_status.sum(axis=1).astype(int).tolist(),
+        'by_status': {str(status): by_status[status].astype(int).tolist() for status in by_status.columns},
+        'by_type': {str(pass_type): by_type[pass_type].astype(int).tolist() for pass_type in by_type.columns},
+    }
+
+
+def _turnaround_table(steps, key, limit=None):
+    grouped = steps.groupby(key, observed=True)
+    table = grouped['minutes'].agg(['size', 'median', 'mean'])
+    table['p90'] = grouped['minutes'].quantile(0.9)
+    table['approved'] = grouped['is_approved'].sum()
+    table = table.sort_values('size', ascending=False)
+    if limit:
+        table = table.head(limit)
+    return [{'id': str(index), 'decisions': int(size), 'approved': int(approved),
+             'median_minutes': median, 'mean_minutes': mean, 'p90_minutes': p90}
+            for index, size, approved, median, mean, p90 in zip(
+                table.index, table['size'], table['approved'],
+                _round(table['median']), _round(table['mean']), _round(table['p90']))]
+
+
+def _turnaround(approvals):
+    decided = approvals[approvals['status'].isin(['approved', 'rejected']) & approvals['approved_by'].notna()
+                        & approvals['requested_at'].notna() & approvals['decided_at'].notna()]
+    steps = decided.assign(
+        minutes=((decided['decided_at'] - decided['requested_at']).dt.total_seconds() / 60).clip(lower=0),
+        is_approved=decided['status'].eq('approved'),
+    )
+    # Steps settled without an approver: auto-approved at submission or after an escalation timeout
+    auto = approvals[approvals['status'].eq('auto_approved')].groupby('role', observed=True).size()
+    by_role = _turnaround_table(steps, 'role')
+    for row in by_role:
+        row['auto_approved'] = int(auto.get(row['id'], 0))
+    return {
+        'decisions': int(len(steps)),
+        'median_minutes': round(float(steps['minutes'].median()), 1) if len(steps) else None,
+        'by_approver': _turnaround_table(steps, 'approved_by', TOP_APPROVERS),
+        'by_role': by_role,
+    }
+
+
+def _rejections(passes):
+    decided = passes[passes['status'].isin(DECIDED_STATUSES)]
+    table = decided['status'].eq('rejected').groupby(decided['department'].astype(str)).agg(['size', 'sum'])
+    table['rate'] = table['sum'] / table['size']
+    table = table.sort_values('rate', ascending=False)
+    return [{'department': department, 'decided': int(size), 'rejected': int(rejected), 'rate': rate}
+            for department, size, rejected, rate in zip(
+                table.index, table['size'], table['sum'], _round(table['rate'], 4))]
+
+
+def _heatmap(passes, tz):
+    import numpy as np
+
+    local = passes['date'].dropna().dt.tz_convert(tz)
+    cells = local.dt.weekday.to_numpy() * 24 + local.dt.hour.to_numpy()
+    counts = np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+    peak_day, peak_hour = np.unravel_index(counts.argmax(), counts.shape)
+    return {
+        'weekdays': WEEKDAYS,
+        'hours': list(range(24)),
+        'counts': counts.tolist(),
+        'by_hour': counts.sum(axis=0).tolist(),
+        'by_weekday': counts.sum(axis=1).tolist(),
+        'peak': {'weekday': WEEKDAYS[peak_day], 'hour': int(peak_hour), 'passes': int(counts.max())},
+    }
+
+
+def _repeat_applicants(passes):
+    grouped = passes.groupby(['applicant_type', 'applicant_id'], observed=True)
+    table = grouped.size().rename('passes').to_frame()
+    table['department'] = grouped['department'].first().astype(str)
+    table['late_returns'] = grouped['late_return'].sum().astype(int)
+    by_type = table['passes'].groupby(level='applicant_type')
+    median = by_type.transform('median')
+    mad = (table['passes'] - median).abs().groupby(level='applicant_type').transform('median')
+    # A MAD of zero (most applicants with the same count) would flag everyone above the median
+    table['z'] = 0.6745 * (table['passes'] - median) / mad.where(mad > 0, 1)
+    table['median'] = median
+    outliers = table[table['z'] > OUTLIER_Z].sort_values('passes', ascending=False).head(TOP_OUTLIERS)
+    return {
+        'applicants': int(len(table)),
+        'median_by_type': {str(applicant_type): float(value) for applicant_type, value in by_type.median().items()},
+        'outliers': [{'applicant_type': str(applicant_type), 'id': str(applicant_id), 'passes': int(count),
+                      'department': department, 'late_returns': int(late), 'z': z, 'type_median': med}
+                     for (applicant_type, applicant_id), count, department, late, z, med in zip(
+                         outliers.index, outliers['passes'], outliers['department'], outliers['late_returns'],
+                         _round(outliers['z'], 2), _round(outliers['median']))],
+    }
+
+
+def _empty_report():
+    return {
+        'volume': {'months': [], 'total': 0, 'by_month': [], 'by_status': {}, 'by_type': {}},
+        'turnaround': {'decisions': 0, 'median_minutes': None, 'by_approver': [], 'by_role': []},
+        'rejections': [],
+        'heatmap': {'weekdays': WEEKDAYS, 'hours': list(range(24)), 'counts': [[0] * 24 for _ in WEEKDAYS],
+                    'by_hour': [0] * 24, 'by_weekday': [0] * 7, 'peak': None},
+        'repeat_applicants': {'applicants': 0, 'median_by_type': {}, 'outliers': []},
+    }
+
+
+def build_report(passes, approvals, tz=None):
+    """Computes every report section from snapshot DataFrames. No reads."""
+    if passes.empty:
+        return _empty_report()
+    tz = tz or datetime.now().astimezone().tzinfo
+    passes = passes.assign(
+        applicant_type=passes['applicant_type'].fillna('unknown'),
+        status=passes['status'].fillna('unknown'),
+        pass_type=passes['pass_type'].fillna('unknown'),
+        late_return=passes['late_return'].fillna(False).astype(bool),
+    )
+    return {
+        'volume': _volume(passes),
+        'turnaround': _turnaround(approvals),
+        'rejections': _rejections(passes),
+        'heatmap': _heatmap(passes, tz),
+        'repeat_applicants': _repeat_applicants(passes),
+    }
+
+
+def _attach_names(db, report):
+    """Adds names for the approvers and outliers listed (one batched read per collection)."""
+    wanted = {'faculty': {row['id'] for row in report['turnaround']['by_approver']}, 'students': set()}
+    for row in report['repeat_applicants']['outliers']:
+        wanted['faculty' if row['applicant_type'] == 'faculty' else 'students'].add(row['id'])
+    names = {}
+    for collection, ids in wanted.items():
+        if ids:
+            refs = [db.collection(collection).document(uid) for uid in ids]
+            names.update({doc.id: doc.to_dict().get('name') for doc in db.get_all(refs) if doc.exists})
+    for row in report['turnaround']['by_approver'] + report['repeat_applicants']['outliers']:
+        row['name'] = names.get(row['id'])
+
+
+def get_report(period='year', directory=None, with_names=True):
+    """
+    Returns the report for `period` from the current snapshot, cached per snapshot
+    version. The report carries the version, watermark and how long it took to build.
+    """
+    manifest = read_manifest(directory)
+    version = manifest.get('version', 0)
+    key = (directory, version, period, with_names)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+
+    started = time.perf_counter()
+    months = report_months(period, manifest.get('watermark'))
+    passes = read_passes(directory, months=months, columns=PASS_COLUMNS)
+    approvals = read_approvals(directory, months=months, columns=APPROVAL_COLUMNS)
+    report = build_report(passes, approvals)
+    if with_names:
+        try:
+            _attach_names(get_db(), report)
+        except Exception as e:
+            logger.warning(f"Could not look up names for the analytics report: {e}")
+    report.update({
+        'period': period,
+        'months': months,
+        'snapshot_version': version,
+        'watermark': manifest.get('watermark'),
+        'built_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
+    with _cache_lock:
+        # Reports of older snapshot versions are never asked for again
+        for stale in [k for k in _cache if k[0] == directory and k[1] != version]:
+            del _cache[stale]
+        while len(_cache) >= CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+        _cache[key] = report
+    return report
@@ -0,0 +1,154 @@
+"""
+Profile Image Pipeline
+Uploads profile photos off the request path and produces resized thumbnail and
+medium variants, writing their URLs back to the user's document.
+
+Storage is selected with IMAGE_STORAGE_BACKEND:
+- firebase: Cloud Storage default bucket (default)
+- local: files under static/uploads, served by Flask (IMAGE_LOCAL_ROOT to override)
+"""
+
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import get_bucket, get_db
+
+logger = logging.getLogger(__name__)
+
+# Accepted upload types -> extension of the stored original
+ORIGINAL_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+
+# Variant name -> (max edge in px, square crop)
+VARIANTS = {
+    'thumb': (96, True),
+    'medium': (480, False),
+}
+
+
+class FirebaseImageStorage:
+    """Stores images in the Firebase default Cloud Storage bucket."""
+
+    def save(self, path, data, content_type):
+        blob = get_bucket().blob(path)
+        blob.upload_from_string(data, content_type=content_type)
+        return blob.public_url
+
+
+class LocalImageStorage:
+    """Stores images on the local filesystem under a static directory."""
+
+    def __init__(self, root, url_prefix='/static/uploads'):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def save(self, path, data, content_type):
+        root = os.path.realpath(self.root)
+        full_path = os.path.realpath(os.path.join(root, *path.split('/')))
+        if os.path.commonpath([root, full_path]) != root:
+            raise ValueError(f"Refusing to write outside {root}: {path}")
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(data)
+        return f"{self.url_prefix}/{path}"
+
+
+def get_image_storage():
+    """Returns the storage backend chosen by IMAGE_STORAGE_BACKEND."""
+    if os.getenv('IMAGE_STORAGE_BACKEND', 'firebase').lower() == 'local':
+        default_root = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads')
+        return LocalImageStorage(os.getenv('IMAGE_LOCAL_ROOT', default_root))
+    return FirebaseImageStorage()
+
+
+def make_variants(data):
+    """
+    Returns {variant_name: (bytes, extension, content_type)} for the given image bytes.
+    Variants are WebP when Pillow supports it, JPEG otherwise.
+    """
+    from PIL import Image, ImageOps, features
+
+    if features.check('webp'):
+        fmt, ext, content_type, options = 'WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}
+    else:
+        fmt, ext, content_type, options = 'JPEG', 'jpg', 'image/jpeg', {'quality': 85, 'optimize': True}
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source).convert('RGB')
+
+    variants = {}
+    for name, (size, square) in VARIANTS.items():
+        if square:
+            resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        resized.save(out, fmt, **options)
+        variants[name] = (out.getvalue(), ext, content_type)
+    return variants
+
+
+class ImagePipeline:
+    """Accepts uploaded images and processes them on a small worker pool."""
+
+    def __init__(self, storage_backend=None, max_workers=2):
+        self._storage = storage_backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-pipeline')
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = get_image_storage()
+        return self._storage
+
+    def submit(self, file, collection_name, item_id):
+        """
+        Reads the uploaded file and queues it for processing. Returns a Future,
+        or None if there is no file. The user document receives `image_url`,
+        `image_thumb_url` and `image_medium_url` once the job finishes.
+        """
+        if not file:
+            return None
+        data = file.read()
+        if not data:
+            return None
+        content_type = (file.content_type or '').split(';')[0].strip().lower()
+        if content_type not in ORIGINAL_EXTENSIONS:
+            logger.warning(f"Ignoring profile image for {collection_name}/{item_id} with type '{content_type}'")
+            return None
+        return self._executor.submit(self._process, data, content_type, collection_name, item_id)
+
+    def _process(self, data, content_type, collection_name, item_id):
+        try:
+            # Version suffix keeps browsers from showing a cached old photo after a change.
+            # The client's filename is never used in the path.
+            version = int(time.time())
+            prefix = f"{collection_name}/{item_id}"
+            original = f"{prefix}/original-{version}.{ORIGINAL_EXTENSIONS[content_type]}"
+            urls = {'image_url': self.storage.save(original, data, content_type)}
+
+            try:
+                for name, (variant_data, ext, variant_type) in make_variants(data).items():
+                    urls[f'image_{name}_url'] = self.storage.save(f"{prefix}/{name}-{version}.{ext}", variant_data, variant_type)
+            except Exception as e:
+                # Keep the original; list pages fall back to image_url
+                logger.warning(f"Could not resize image for {collection_name}/{item_id}: {e}")
+                urls.update({f'image_{name}_url': None for name in VARIANTS})
+
+            get_db().collection(collection_name).document(item_id).set(urls, merge=True)
+            logger.info(f"Processed profile image for {collection_name}/{item_id}")
+            return urls
+        except Exception as e:
+            logger.error(f"Image processing failed for {collection_name}/{item_id}: {e}")
+            return None
+
+
+image_pipeline = ImagePipeline(max_workers=int(os.getenv('IMAGE_PIPELINE_WORKERS', '2')))
@@ -0,0 +1,212 @@
+"""
+Outbound Mail Dispatcher
+Background worker that sends queued emails over one reused, authenticated SMTP connection
+
+SMTP settings come from environment variables:
+- SMTP_HOST, SMTP_PORT, SMTP_FROM (required)
+- SMTP_USER, SMTP_PASSWORD (optional; login is skipped when unset)
+- SMTP_STARTTLS (default "1"; set to "0" for a local stand-in such as aiosmtpd)
+"""
+
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def smtp_settings():
+    """Returns the SMTP settings dict, or None if the required ones are missing."""
+    settings = {
+        'host': os.getenv('SMTP_HOST'),
+        'port': os.getenv('SMTP_PORT'),
+        'user': os.getenv('SMTP_USER'),
+        'password': os.getenv('SMTP_PASSWORD'),
+        'from': os.getenv('SMTP_FROM'),
+        'starttls': os.getenv('SMTP_STARTTLS', '1') not in ('0', 'false', 'False'),
+    }
+    if not all([settings['host'], settings['port'], settings['from']]):
+        return None
+    return settings
+
+
+class MailDispatcher:
+    """
+    Queues EmailMessage objects and sends them from a single background thread.
+
+    The worker keeps one SMTP connection open while there is work, sends up to
+    `batch_size` messages per wake-up, retries failures with exponential backoff
+    and closes the connection after `idle_timeout` seconds without mail.
+    """
+
+    def __init__(self, batch_size=20, max_attempts=4, backoff_base=2.0, idle_timeout=30, status_limit=5000):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.idle_timeout = idle_timeout
+        self.status_limit = status_limit
+
+        self._queue = queue.Queue()
+        self._retries = []  # heap of (ready_at, seq, message_id, msg)
+        self._seq = itertools.count()
+        self._status = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._smtp = None
+
+    # --- Public API ---
+    def enqueue(self, msg):
+        """Queues a message for delivery and returns its message ID."""
+        message_id = uuid.uuid4().hex
+        self._set_status(message_id, status='queued', to=msg['To'], attempts=0, error=None)
+        self._queue.put((message_id, msg))
+        self._ensure_worker()
+        return message_id
+
+    def status(self, message_id):
+        """Returns the delivery status dict for a message, or None if unknown."""
+        with self._lock:
+            entry = self._status.get(message_id)
+            return dict(entry) if entry else None
+
+    def summary(self):
+        """Returns counts of tracked messages by status."""
+        with self._lock:
+            counts = {}
+            for entry in self._status.values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+            counts['queued_now'] = self._queue.qsize() + len(self._retries)
+            return counts
+
+    def stop(self, timeout=10):
+        """Sends whatever is already queued (without waiting for retries) and stops the worker."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._close()
+
+    # --- Worker ---
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _set_status(self, message_id, **fields):
+        with self._lock:
+            entry = self._status.setdefault(message_id, {})
+            entry.update(fields, updated_at=time.time())
+            self._status.move_to_end(message_id)
+            while len(self._status) > self.status_limit:
+                self._status.popitem(last=False)
+
+    def _next_batch(self):
+        """Blocks until there is work, then returns up to batch_size (message_id, msg) pairs."""
+        batch = []
+        now = time.time()
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.batch_size:
+            _, _, message_id, msg = heapq.heappop(self._retries)
+            batch.append((message_id, msg))
+
+        if not batch:
+            wait = self.idle_timeout
+            if self._retries:
+                wait = max(0.0, min(wait, self._retries[0][0] - now))
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                if not self._retries:
+                    self._close()
+                return []
+            if item is None:
+                return None
+            batch.append(item)
+
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            for message_id, msg in batch:
+                self._deliver(message_id, msg)
+            if self._stopping and self._queue.empty():
+                return
+
+    def _deliver(self, message_id, msg):
+        attempts = (self.status(message_id) or {}).get('attempts', 0) + 1
+        self._set_status(message_id, status='sending', attempts=attempts)
+        try:
+            try:
+                self._connection().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # The kept-alive connection was dropped by the server; reconnect once
+                self._close()
+                self._connection().send_message(msg)
+            self._set_status(message_id, status='sent', error=None)
+        except Exception as e:
+            if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                self._close()
+            if attempts >= self.max_attempts or isinstance(e, smtplib.SMTPRecipientsRefused):
+                self._set_status(message_id, status='failed', error=str(e))
+                logger.error(f"Giving up on email {message_id} to {msg['To']}: {e}")
+                return
+            delay = self.backoff_base ** attempts
+            self._set_status(message_id, status='retrying', error=str(e))
+            heapq.heappush(self._retries, (time.time() + delay, next(self._seq), message_id, msg))
+            logger.warning(f"Email {message_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+
+    def _connection(self):
+        if self._smtp is not None:
+            return self._smtp
+        settings = smtp_settings()
+        if settings is None:
+            raise RuntimeError("SMTP is not configured")
+        smtp = smtplib.SMTP(settings['host'], int(settings['port']), timeout=30)
+        if settings['starttls']:
+            smtp.starttls()
+        if settings['user'] and settings['password']:
+            smtp.login(settings['user'], settings['password'])
+        self._smtp = smtp
+        return smtp
+
+    def _close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+
+dispatcher = MailDispatcher(
+    batch_size=int(os.getenv('MAIL_BATCH_SIZE', '20')),
+    max_attempts=int(os.getenv('MAIL_MAX_ATTEMPTS', '4')),
+)
+atexit.register(dispatcher.stop)
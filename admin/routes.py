@@ -1,7 +1,17 @@
-import pandas as pd
-from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, jsonify, session
-from firebase_admin import auth, firestore, storage
-from admin.utils import send_password_reset_email
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, jsonify, session, send_file, abort
+from firebase_admin import auth, firestore
+from db import get_db as _get_db, get_auth, invalidate_system_settings
+from admin.utils import send_password_reset_email, mail_dispatcher
+from admin.images import image_pipeline
+from auth.roles import set_user_role
+from audit import record_audit
+from notifications import TARGET_TYPES, send_notification, list_notifications
+from profiling import profiling_settings, list_profiles, profile_file
+from pass_revocations import revoke_pass
+from pass_snapshots import export_snapshot, read_manifest
+from admin.analytics import get_report, valid_period
+from pass_summaries import get_global_stats, record_status_change
+from pass_search import pass_search_index
 from firebase_admin.auth import EmailAlreadyExistsError
 import io
 from datetime import datetime, timedelta
@@ -21,20 +31,21 @@ admin_bp = Blueprint(
 )
 
 def get_db():
-    return firestore.client()
+    return _get_db()
 
 # --- Image Upload Helper ---
-def _upload_image(file, item_type, item_id):
-    if not file:
-        return None
-    try:
-        bucket = storage.bucket()
-        blob = bucket.blob(f'{item_type}/{item_id}/{file.filename}')
-        blob.upload_from_file(file, content_type=file.content_type)
-        return blob.public_url
-    except Exception as e:
-        flash(f"Error uploading image: {e}", "danger")
-        return None
+def _prepare_image_fields(data, image_file, original_data=None):
+    """Adjusts image fields before saving a user document.
+
+    With an uploaded file, `image_url` is left for the image pipeline to fill in
+    so the form value can't overwrite it. A pasted URL that replaces the old photo
+    clears the resized variants, which would otherwise still show the old one.
+    """
+    if image_file:
+        data.pop('image_url', None)
+    elif original_data is not None and data.get('image_url') != original_data.get('image_url'):
+        data['image_thumb_url'] = None
+        data['image_medium_url'] = None
 
 # --- Authorization ---
 def is_main_admin():
@@ -65,28 +76,27 @@ def add_item(item_type):
 def index():
     db = get_db()
     try:
-        students_count = len(list(db.collection('students').stream()))
-        faculty_count = len(list(db.collection('faculty').stream()))
-        admins_count = len(list(db.collection('admins').stream()))
-        # Temporarily simplified queries to avoid index errors
+        # Aggregation counts and the global pass summary: no collection scans
+        pass_counts = get_global_stats(db).get('counts_by_status') or {}
         stats_cards = {
-            "total_students": students_count,
-            "total_faculty": faculty_count,
-            "total_admins": admins_count,
-            "total_passes": {"pending": 0, "approved": 0, "rejected": 0}
+            "total_students": db.collection('students').count().get()[0][0].value,
+            "total_faculty": db.collection('faculty').count().get()[0][0].value,
+            "total_admins": db.collection('admins').count().get()[0][0].value,
+            "total_passes": {
+                "pending": pass_counts.get('pending', 0),
+                "approved": pass_counts.get('approved', 0) + pass_counts.get('auto_approved', 0),
+                "rejected": pass_counts.get('rejected', 0),
+            }
         }
-        pass_trends = {'labels': [], 'data': []}
-        department_chart_data = {'labels': [], 'datasets': []}
         activity_feed = []
     except Exception as e:
         flash(f"Error fetching dashboard data: {e}", "danger")
         logging.error(f"Dashboard Error: {e}")
         stats_cards = {"total_students": 0, "total_faculty": 0, "total_passes": {"pending": 0, "approved": 0, "rejected": 0}, "total_admins": 0}
-        pass_trends = {'labels': [], 'data': []}
-        department_chart_data = {'labels': [], 'datasets': []}
         activity_feed = []
 
-    return render_template('dashboard.html', stats_cards=stats_cards, pass_trends=pass_trends, department_chart_data=department_chart_data, activity_feed=activity_feed)
+    # The trend and department charts load analytics_report's JSON, built from the pass snapshot
+    return render_template('dashboard.html', stats_cards=stats_cards, activity_feed=activity_feed)
 
 
 @admin_bp.route('/manage-students', methods=['GET', 'POST'])
@@ -227,6 +237,8 @@ def system_settings():
                 'auto_approve_absent_faculty': 'auto_approve_absent_faculty' in request.form,
             }
             settings_ref.set(settings_data, merge=True)
+            invalidate_system_settings()
+            record_audit('system_settings_update', settings=settings_data)
             flash("System settings updated successfully!", "success")
         except Exception as e:
             flash(f"Error updating settings: {e}", "danger")
@@ -272,6 +284,12 @@ def settings():
             current['faculty'] = faculty
 
             settings_ref.set(current, merge=True)
+            invalidate_system_settings()
+            record_audit('settings_update', settings={
+                'student': student,
+                'faculty': faculty,
+                'jumma_pass_enabled': current['jumma_pass_enabled'],
+            })
             flash("Settings saved successfully!", "success")
         except Exception as e:
             flash(f"Error saving settings: {e}", "danger")
@@ -287,6 +305,17 @@ def settings():
 
 @admin_bp.route('/pass-overview', methods=['GET'])
 def pass_overview():
+    query = request.args.get('q', '').strip()
+    if query:
+        if session.get('user_role') != 'admin':
+            abort(403)
+        try:
+            found = _search_passes(query)
+        except ValueError:
+            flash("Dates must be given as YYYY-MM-DD.", "warning")
+            return redirect(url_for('admin.pass_overview'))
+        return render_template('pass_overview.html', passes=found['results'], search=found, query=query)
+
     db = get_db()
     passes_query = db.collection_group('passes')
     try:
@@ -297,6 +326,112 @@ def pass_overview():
         passes = []
     return render_template('pass_overview.html', passes=passes)
 
+def _search_passes(query):
+    """Runs a pass search from the request's from/to (YYYY-MM-DD, inclusive) and cursor arguments."""
+    date_from = request.args.get('from', '').strip()
+    date_to = request.args.get('to', '').strip()
+    date_from = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+    date_to = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1) if date_to else None
+    if not pass_search_index.wait_ready():
+        logging.warning("Pass search index is still loading; results may be incomplete")
+    return pass_search_index.search(query, date_from=date_from, date_to=date_to,
+                                    cursor=request.args.get('cursor') or None)
+
+@admin_bp.route('/pass-search', methods=['GET'])
+def pass_search():
+    """Ranked full-text pass search as JSON, served from the local search index."""
+    if session.get('user_role') != 'admin':
+        abort(403)
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        found = _search_passes(query)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    for result in found['results']:
+        result['date'] = result['date'].isoformat() if result['date'] else None
+    return jsonify(found)
+
+@admin_bp.route('/revoke-pass/<pass_id>', methods=['POST'])
+def revoke_pass_route(pass_id):
+    """Revokes an approved pass; gate scanners reject its token from their next revocation refresh."""
+    if session.get('user_role') != 'admin':
+        abort(403)
+    db = get_db()
+    pass_ref = db.collection('passes').document(pass_id)
+    try:
+        pass_doc = pass_ref.get()
+        if not pass_doc.exists:
+            flash("Pass not found.", "danger")
+            return redirect(url_for('admin.pass_overview'))
+        pass_data = pass_doc.to_dict()
+        if pass_data.get('status') not in ('approved', 'auto_approved'):
+            flash("Only approved passes can be revoked.", "warning")
+            return redirect(url_for('admin.pass_overview'))
+
+        reason = request.form.get('reason', '').strip() or 'revoked_by_admin'
+        batch = db.batch()
+        batch.update(pass_ref, {'status': 'revoked', 'revoked_reason': reason})
+        revoke_pass(batch, db, pass_id, pass_data, reason, actor_id=session.get('user_id'))
+        if pass_data.get('applicant_id'):
+            record_status_change(batch, db, pass_id, pass_data, 'revoked')
+        batch.commit()
+        record_audit('pass_revoked', pass_id=pass_id, reason=reason)
+        flash("Pass revoked.", "success")
+    except Exception as e:
+        flash(f"Error revoking pass: {e}", "danger")
+        logging.error(f"REVOKE PASS ERROR: {e}")
+    return redirect(url_for('admin.pass_overview'))
+
+@admin_bp.route('/analytics', methods=['GET'])
+def analytics():
+    """Pass insights (turnaround, rejections, peak hours, repeat applicants) from the latest pass snapshot."""
+    if session.get('user_role') != 'admin':
+        abort(403)
+    period = request.args.get('period', 'year')
+    if not valid_period(period):
+        flash("Choose a period as YYYY or YYYY-MM.", "warning")
+        return redirect(url_for('admin.analytics'))
+    try:
+        report = get_report(period)
+    except Exception as e:
+        flash(f"Error building the analytics report: {e}", "danger")
+        logging.error(f"ANALYTICS ERROR: {e}")
+        report = None
+    return render_template('analytics.html', report=report, period=period, manifest=read_manifest())
+
+
+@admin_bp.route('/analytics/report.json', methods=['GET'])
+def analytics_report():
+    """The analytics report as JSON for the dashboard charts; cached per snapshot version."""
+    if session.get('user_role') != 'admin':
+        abort(403)
+    period = request.args.get('period', 'year')
+    if not valid_period(period):
+        return jsonify({'error': 'period must be year, YYYY or YYYY-MM'}), 400
+    try:
+        return jsonify(get_report(period))
+    except Exception as e:
+        logging.error(f"ANALYTICS ERROR: {e}")
+        return jsonify({'error': 'The analytics report could not be built'}), 500
+
+
+@admin_bp.route('/analytics/export', methods=['POST'])
+@main_admin_required
+def analytics_export():
+    """Appends passes settled since the last export to the snapshot, without waiting for the nightly run."""
+    result = export_snapshot()
+    if result['status'] == 'success':
+        record_audit('pass_snapshot_exported', rows=result['rows'], version=result['version'])
+        flash(f"Snapshot updated: {result['rows']} new passes (version {result['version']}).", "success")
+    elif result['status'] == 'skipped':
+        flash(result['message'], "warning")
+    else:
+        flash(f"Snapshot export failed: {result['message']}", "danger")
+    return redirect(url_for('admin.analytics'))
+
+
 @admin_bp.route('/notifications', methods=['GET', 'POST'])
 @main_admin_required
 def notifications():
@@ -305,23 +440,33 @@ def notifications():
         try:
             target = request.form.get('target')
             message = request.form.get('message')
-            db.collection('notifications').add({
-                'message': message,
-                'target': target,
-                'timestamp': firestore.SERVER_TIMESTAMP
-            })
-            flash("Notification sent successfully!", "success")
+            target_value = (request.form.get('target_value') or '').strip() or None
+
+            if target not in TARGET_TYPES:
+                flash("Invalid notification target.", "danger")
+                return redirect(url_for('admin.notifications'))
+            if target in ('department', 'individual') and not target_value:
+                flash("Please enter a department or user email for this target.", "danger")
+                return redirect(url_for('admin.notifications'))
+            if target == 'individual':
+                # Individual notifications are addressed by email and stored by uid
+                target_value = get_auth().get_user_by_email(target_value).uid
+
+            recipients = send_notification(db, target, message, value=target_value, sender_id=session.get('user_id'))
+            flash(f"Notification sent successfully to {recipients} users!", "success")
+        except auth.UserNotFoundError:
+            flash("No user found with that email.", "danger")
         except Exception as e:
             flash(f"Error sending notification: {e}", "danger")
         return redirect(url_for('admin.notifications'))
 
+    next_cursor = None
     try:
-        notifications_docs = db.collection('notifications').order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
-        notifications = [doc.to_dict() for doc in notifications_docs]
+        notifications, next_cursor = list_notifications(db, cursor=request.args.get('cursor'))
     except Exception as e:
         flash(f"Error fetching notifications: {e}", "danger")
         notifications = []
-    return render_template('notifications.html', notifications=notifications)
+    return render_template('notifications.html', notifications=notifications, next_cursor=next_cursor)
 
 # --- Bulk Upload ---
 @admin_bp.route('/bulk-upload/<item_type>', methods=['GET', 'POST'])
@@ -334,6 +479,8 @@ def bulk_upload(item_type):
             return redirect(request.url)
 
         try:
+            # pandas adds ~0.4s to startup, so it is only imported when a file is uploaded
+            import pandas as pd
             if file.filename.endswith('.csv'):
                 df = pd.read_csv(file)
             elif file.filename.endswith('.xlsx'):
@@ -353,6 +500,7 @@ def bulk_upload(item_type):
     return render_template('bulk_upload.html', item_type=item_type)
 
 def process_bulk_upload(df, item_type):
+    import pandas as pd
     db = get_db()
     collection_name = item_type
     required_fields = []
@@ -386,11 +534,11 @@ def process_bulk_upload(df, item_type):
                     password = str(faculty_id_val) if faculty_id_val and pd.notna(faculty_id_val) else 'Hitam@123'
 
             try:
-                user = auth.create_user(email=email, password=password, display_name=name)
+                user = get_auth().create_user(email=email, password=password, display_name=name)
                 item_id = user.uid
             except EmailAlreadyExistsError:
                 logging.warning(f"Email {email} already exists. Skipping Auth creation.")
-                user = auth.get_user_by_email(email)
+                user = get_auth().get_user_by_email(email)
                 item_id = user.uid
 
             if item_type == 'students':
@@ -398,6 +546,8 @@ def process_bulk_upload(df, item_type):
             elif item_type == 'faculty':
                 data = _build_faculty_data_from_row(row)
             
+            # No role claim here: one Auth call per row would dominate large uploads,
+            # and the first login writes the claim after its lookup
             db.collection(collection_name).document(item_id).set(data, merge=True)
             success_count += 1
 
@@ -405,6 +555,8 @@ def process_bulk_upload(df, item_type):
             error_count += 1
             logging.error(f"Error processing row {index + 2}: {e}")
 
+    record_audit('bulk_upload', item_type=item_type, rows=len(df), success_count=success_count, error_count=error_count)
+
     flash(f"Bulk upload complete! {success_count} records processed, {error_count} errors.", "success" if error_count == 0 else "warning")
 
 def _build_student_data_from_row(row):
@@ -458,6 +610,7 @@ def _build_student_data_from_row(row):
     return data
 
 def _build_faculty_data_from_row(row):
+    import pandas as pd
     data = {
         "name": row.get('name'),
         "email": row.get('email'),
@@ -627,17 +780,18 @@ def add_user(role):
                 password = request.form.get('faculty_id') or 'Hitam@123'
 
         try:
-            user = auth.create_user(email=data['email'], password=password, display_name=data.get('name'))
+            user = get_auth().create_user(email=data['email'], password=password, display_name=data.get('name'))
             item_id = user.uid
         except EmailAlreadyExistsError:
             flash(f"A user with email {data['email']} already exists.", "danger")
             return render_template('add_user.html', role=role, user=request.form)
 
         image_file = request.files.get('image')
-        if image_file:
-            data['image_url'] = _upload_image(image_file, collection_name, item_id)
-        
+        _prepare_image_fields(data, image_file)
+
         db.collection(collection_name).document(item_id).set(data)
+        set_user_role(item_id, role)
+        image_pipeline.submit(image_file, collection_name, item_id)
         flash(f"{role.capitalize()} added successfully!", "success")
 
     except Exception as e:
@@ -662,14 +816,15 @@ def edit_student(item_id):
             auth_updates['password'] = 'Hitam@123'
         
         original_doc = db.collection('students').document(item_id).get()
+        original_data = original_doc.to_dict() if original_doc.exists else {}
         if original_doc.exists:
-            original_email = original_doc.to_dict().get('email')
+            original_email = original_data.get('email')
             if data.get('email') != original_email:
                 auth_updates['email'] = data.get('email')
         
         password_used = auth_updates.get('password')
         if len(auth_updates) > 1 or 'email' in auth_updates:
-            auth.update_user(item_id, **auth_updates)
+            get_auth().update_user(item_id, **auth_updates)
             # attempt to send notification email about password reset; ignore failures
             try:
                 send_password_reset_email(data.get('email'), password_used, data.get('name'))
@@ -677,10 +832,10 @@ def edit_student(item_id):
                 pass
 
         image_file = request.files.get('image')
-        if image_file:
-            data['image_url'] = _upload_image(image_file, 'students', item_id)
-        
+        _prepare_image_fields(data, image_file, original_data)
+
         db.collection('students').document(item_id).set(data, merge=True)
+        image_pipeline.submit(image_file, 'students', item_id)
         flash("Student updated successfully!", "success")
 
     except Exception as e:
@@ -700,11 +855,12 @@ def edit_faculty(item_id):
             auth_updates['password'] = request.form.get('password')
         
         original_doc = db.collection('faculty').document(item_id).get()
+        original_data = original_doc.to_dict() if original_doc.exists else {}
             # Get faculty_id for password reset
         faculty_id = data.get('faculty_id')
         
         if original_doc.exists:
-            original_email = original_doc.to_dict().get('email')
+            original_email = original_data.get('email')
             if data.get('email') != original_email:
                 auth_updates['email'] = data.get('email')
         
@@ -714,17 +870,17 @@ def edit_faculty(item_id):
         
         password_used = auth_updates.get('password')
         if len(auth_updates) > 1 or 'email' in auth_updates:
-            auth.update_user(item_id, **auth_updates)
+            get_auth().update_user(item_id, **auth_updates)
             try:
                 send_password_reset_email(data.get('email'), password_used, data.get('name'))
             except Exception:
                 pass
 
         image_file = request.files.get('image')
-        if image_file:
-            data['image_url'] = _upload_image(image_file, 'faculty', item_id)
-        
+        _prepare_image_fields(data, image_file, original_data)
+
         db.collection('faculty').document(item_id).set(data, merge=True)
+        image_pipeline.submit(image_file, 'faculty', item_id)
         flash("Faculty member updated successfully!", "success")
 
     except Exception as e:
@@ -740,11 +896,12 @@ def delete_item(item_type, item_id):
     try:
         if item_type in ['faculty', 'students', 'admins']:
             try:
-                auth.delete_user(item_id)
+                get_auth().delete_user(item_id)
             except auth.UserNotFoundError:
                 logging.warning(f"User with ID {item_id} not found in Auth, but proceeding with Firestore deletion.")
         
         db.collection(item_type).document(item_id).delete()
+        record_audit('delete', item_type=item_type, target_id=item_id)
         flash(f"{item_type.capitalize()} deleted successfully!", "success")
     except Exception as e:
         flash(f"Error deleting {item_type}: {e}", "danger")
@@ -768,22 +925,13 @@ def reset_faculty_password(item_id):
             flash("Faculty ID is not set for this member; cannot reset password.", "danger")
             return redirect(url_for('admin.manage_faculty'))
         try:
-            auth.update_user(item_id, password=str(faculty_id_val))
+            get_auth().update_user(item_id, password=str(faculty_id_val))
             flash("Password reset to Faculty ID successfully.", "success")
             try:
                 send_password_reset_email(email, str(faculty_id_val), data.get('name'))
             except Exception:
                 pass
-            try:
-                db.collection('audit').add({
-                    'type': 'password_reset',
-                    'target_id': item_id,
-                    'admin_id': session.get('user_id'),
-                    'method': 'reset_to_faculty_id',
-                    'timestamp': firestore.SERVER_TIMESTAMP
-                })
-            except Exception:
-                pass
+            record_audit('password_reset', target_id=item_id, method='reset_to_faculty_id')
         except Exception as e:
             flash(f"Error resetting password: {e}", "danger")
             logging.error(f"RESET FACULTY PASSWORD ERROR: {e}")
@@ -806,22 +954,13 @@ def reset_student_password(item_id):
         email = data.get('email')
         default_password = 'Hitam@123'
         try:
-            auth.update_user(item_id, password=default_password)
+            get_auth().update_user(item_id, password=default_password)
             flash("Password reset to default (Hitam@123) successfully.", "success")
             try:
                 send_password_reset_email(email, default_password, data.get('name'))
             except Exception:
                 pass
-            try:
-                db.collection('audit').add({
-                    'type': 'password_reset',
-                    'target_id': item_id,
-                    'admin_id': session.get('user_id'),
-                    'method': 'reset_to_default',
-                    'timestamp': firestore.SERVER_TIMESTAMP
-                })
-            except Exception:
-                pass
+            record_audit('password_reset', target_id=item_id, method='reset_to_default')
         except Exception as e:
             flash(f"Error resetting password: {e}", "danger")
             logging.error(f"RESET STUDENT PASSWORD ERROR: {e}")
@@ -831,6 +970,52 @@ def reset_student_password(item_id):
     return redirect(url_for('admin.manage_students'))
 
 
+@admin_bp.route('/mail-status', defaults={'message_id': None}, methods=['GET'])
+@admin_bp.route('/mail-status/<message_id>', methods=['GET'])
+@main_admin_required
+def mail_status(message_id):
+    """Delivery status of one queued email, or counts by status for all recent ones."""
+    if message_id is None:
+        return jsonify(mail_dispatcher.summary())
+    status = mail_dispatcher.status(message_id)
+    if status is None:
+        return jsonify({'error': 'Unknown message ID'}), 404
+    return jsonify(status)
+
+
+@admin_bp.route('/profiling', methods=['GET', 'POST'])
+@main_admin_required
+def profiling():
+    """Request profiling: sampling settings and the list of captured profiles."""
+    if request.method == 'POST':
+        try:
+            rate = float(request.form.get('rate') or 0) / 100
+            remaining = request.form.get('remaining')
+            profiling_settings.update(
+                rate,
+                endpoint_prefix=(request.form.get('endpoint_prefix') or '').strip(),
+                remaining=int(remaining) if remaining else None
+            )
+            record_audit('profiling_settings_changed', **profiling_settings.snapshot())
+            flash('Profiling settings updated.', 'success')
+        except ValueError:
+            flash('Sample rate and request count must be numbers.', 'danger')
+        return redirect(url_for('admin.profiling'))
+
+    return render_template('profiling.html', settings=profiling_settings.snapshot(), profiles=list_profiles())
+
+
+@admin_bp.route('/profiling/<profile_id>/<kind>', methods=['GET'])
+@main_admin_required
+def profiling_download(profile_id, kind):
+    """Downloads one output of a captured profile (summary, speedscope, collapsed, cpu_collapsed)."""
+    found = profile_file(profile_id, kind)
+    if found is None:
+        abort(404)
+    path, mimetype = found
+    return send_file(path, mimetype=mimetype, as_attachment=kind != 'summary')
+
+
 @admin_bp.route('/add/role', methods=['POST'])
 @main_admin_required
 def add_role():
@@ -842,9 +1027,11 @@ def add_role():
             "approval_type": request.form.get('approval_type'),
             "priority": int(request.form.get('priority', 99)),
             "fallback_roles": fallback_roles,
+            "sla_minutes": int(request.form.get('sla_minutes')) if request.form.get('sla_minutes') else None,
             "created_at": firestore.SERVER_TIMESTAMP
         }
-        db.collection('roles').add(role_data)
+        _, role_ref = db.collection('roles').add(role_data)
+        record_audit('role_add', role_id=role_ref.id, role_name=role_data['role_name'])
         flash("Role added successfully!", "success")
     except Exception as e:
         flash(f"Error adding role: {e}", "danger")
@@ -860,9 +1047,11 @@ def edit_role(role_id):
             "role_name": request.form.get('role_name'),
             "approval_type": request.form.get('approval_type'),
             "priority": int(request.form.get('priority', 99)),
-            "fallback_roles": fallback_roles
+            "fallback_roles": fallback_roles,
+            "sla_minutes": int(request.form.get('sla_minutes')) if request.form.get('sla_minutes') else None
         }
         db.collection('roles').document(role_id).set(role_data, merge=True)
+        record_audit('role_update', role_id=role_id, role=role_data)
         flash("Role updated successfully!", "success")
     except Exception as e:
         flash(f"Error updating role: {e}", "danger")
@@ -1,47 +1,33 @@
 from datetime import datetime
-import os
-import smtplib
 from email.message import EmailMessage
+from admin.mailer import dispatcher as mail_dispatcher, smtp_settings
 
 
 def send_password_reset_email(to_email, new_password, name=None):
-    """Send a simple password reset email using SMTP settings from env vars.
+    """Queue a simple password reset email for background delivery.
 
-    Required environment variables:
+    SMTP settings are read from env vars (see admin.mailer):
     - SMTP_HOST
     - SMTP_PORT
-    - SMTP_USER
-    - SMTP_PASSWORD
     - SMTP_FROM
-    Returns True if sent, False otherwise.
+    - SMTP_USER / SMTP_PASSWORD (optional)
+    Returns the queued message ID, or None if SMTP is not configured.
+    Delivery status can be checked with `mail_dispatcher.status(message_id)`.
     """
-    smtp_host = os.getenv('SMTP_HOST')
-    smtp_port = os.getenv('SMTP_PORT')
-    smtp_user = os.getenv('SMTP_USER')
-    smtp_password = os.getenv('SMTP_PASSWORD')
-    smtp_from = os.getenv('SMTP_FROM')
-
-    if not all([smtp_host, smtp_port, smtp_user, smtp_password, smtp_from]):
-        return False
+    settings = smtp_settings()
+    if settings is None or not to_email:
+        return None
 
     subject = 'Your account password has been reset'
     display_name = name or ''
     body = f"Hello {display_name},\n\nYour account password has been reset.\n\nNew password: {new_password}\n\nPlease change your password after logging in.\n\nRegards,\nAdmin"
 
-    try:
-        msg = EmailMessage()
-        msg['Subject'] = subject
-        msg['From'] = smtp_from
-        msg['To'] = to_email
-        msg.set_content(body)
-
-        with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
-        return True
-    except Exception:
-        return False
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = settings['from']
+    msg['To'] = to_email
+    msg.set_content(body)
+    return mail_dispatcher.enqueue(msg)
 
 def format_datetime(value, format='%Y-%m-%d %H:%M'):
     """Format a datetime object for display."""
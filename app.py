@@ -1,16 +1,56 @@
-
 import os
+import threading
 from flask import Flask, redirect, url_for
-import firebase_admin
-from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
+from db import get_db, using_memory_backend
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Global scheduler instance
 scheduler = BackgroundScheduler()
+_scheduler_bootstrap_lock = threading.Lock()
+_scheduler_bootstrapped = False
+
+
+def bootstrap_scheduler():
+    """Reads the configured Jumma time and starts the background scheduler (once per process)."""
+    global _scheduler_bootstrapped
+    with _scheduler_bootstrap_lock:
+        if _scheduler_bootstrapped or scheduler.running:
+            return
+        _scheduler_bootstrapped = True
+    try:
+        from gate_events import gate_event_log
+        from pass_archive import schedule_pass_archival
+        from pass_escalation import schedule_escalation_sweep
+        from pass_snapshots import schedule_snapshot_export
+        from student.jumma_scheduler import schedule_jumma_pass_generation
+
+        # Get the configured Jumma time from system settings
+        db = get_db()
+        settings_ref = db.collection('settings').document('system').get()
+
+        if settings_ref.exists:
+            settings = settings_ref.to_dict()
+            jumma_time = settings.get('jumma_pass_start_time', '12:00')
+        else:
+            jumma_time = '12:00'  # Default to noon
+
+        schedule_jumma_pass_generation(scheduler, jumma_time)
+        schedule_escalation_sweep(scheduler)
+        schedule_pass_archival(scheduler)
+        schedule_snapshot_export(scheduler)
+        # Gate scans buffered before a restart are written out now rather than at the next scan
+        gate_event_log.recover()
+        scheduler.start()
+        print(f"Background scheduler started. Jumma passes will be generated at {jumma_time} every Friday; "
+              f"stale pending passes are swept every {os.getenv('ESCALATION_SWEEP_MINUTES', '5')} minutes; "
+              f"closed passes are exported and archived nightly.")
+    except Exception as e:
+        print(f"Warning: Failed to initialize background scheduler: {e}")
+
 
 def create_app():
     """Create and configure an instance of the Flask application."""
@@ -19,55 +59,48 @@ def create_app():
         SECRET_KEY=os.getenv('SECRET_KEY', 'a-default-fallback-secret-key'),
     )
 
-    # --- Firebase Admin SDK Initialization ---
-    try:
-        if not firebase_admin._apps:
-            cred_path = os.path.join(os.path.dirname(__file__), 'firebase-credentials.json')
-            if not os.path.exists(cred_path):
-                raise FileNotFoundError("Firebase credentials file not found.")
-            
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-            print("Firebase Admin SDK initialized successfully.")
+    # --- Storage Backend ---
+    # Firebase is initialized lazily by db.get_db() on first use, so startup does no network I/O.
+    if using_memory_backend():
+        print("Using in-memory storage backend (DB_BACKEND=memory); Firebase is not initialized.")
 
-    except Exception as e:
-        print(f"CRITICAL: Failed to initialize Firebase Admin SDK: {e}")
+    # --- Request Metrics and Firestore Accounting ---
+    from metrics import init_metrics
+    init_metrics(app)
+
+    # --- Opt-in Request Profiling (after metrics, so Firestore usage is still attached when it finishes) ---
+    from profiling import init_profiling
+    init_profiling(app)
+
+    # --- Server-Side Sessions ---
+    from session_store import init_session_store
+    init_session_store(app)
 
     # --- Register Blueprints ---
     from auth.routes import auth_bp
     from admin.routes import admin_bp
     from student.routes import student_bp
     from faculty.routes import faculty_bp
+    from gate.routes import gate_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(student_bp)
     app.register_blueprint(faculty_bp)
+    app.register_blueprint(gate_bp)
 
     # --- Register Jinja Filters ---
     from admin.utils import format_datetime
     app.jinja_env.filters['format_datetime'] = format_datetime
 
     # --- Initialize Scheduler for Automatic Jumma Pass Generation ---
-    try:
-        if not scheduler.running:
-            from student.jumma_scheduler import schedule_jumma_pass_generation
-            
-            # Get the configured Jumma time from system settings
-            db = firestore.client()
-            settings_ref = db.collection('settings').document('system').get()
-            
-            if settings_ref.exists:
-                settings = settings_ref.to_dict()
-                jumma_time = settings.get('jumma_pass_start_time', '12:00')
-            else:
-                jumma_time = '12:00'  # Default to noon
-            
-            schedule_jumma_pass_generation(scheduler, jumma_time)
-            scheduler.start()
-            print(f"Background scheduler started. Jumma passes will be generated at {jumma_time} every Friday.")
-    except Exception as e:
-        print(f"Warning: Failed to initialize background scheduler: {e}")
+    # SCHEDULER_BOOTSTRAP: 'background' (default) reads settings off the startup path,
+    # 'sync' blocks create_app until the scheduler is running, 'off' skips it (e.g. extra workers).
+    bootstrap_mode = os.getenv('SCHEDULER_BOOTSTRAP', 'background').lower()
+    if bootstrap_mode == 'sync':
+        bootstrap_scheduler()
+    elif bootstrap_mode != 'off':
+        threading.Thread(target=bootstrap_scheduler, name='scheduler-bootstrap', daemon=True).start()
 
     # --- Root URL Logic ---
     @app.route('/')
@@ -0,0 +1,329 @@
+"""
+Approval Routing
+Decides who approves a new pass. A student pass goes to the section mentor,
+then the department HOD. Each step is a role key:
+
+- mentor_{academic_year}_{branch}_{section}: a role assigned with a mapping
+- hod_{department}: a role assigned without a mapping, scoped to the faculty member's department
+- hod: the same role, institution-wide
+
+Role keys are derived from each faculty member's `assigned_roles` (role name plus
+mapping). Explicit keys in `assigned_student_roles` / `assigned_faculty_roles` /
+`assigned_head_roles` are honoured as well.
+
+The router keeps an in-memory index from role key to eligible faculty, fed by one
+listener on `faculty` and one on `roles`. A change to one faculty member or role
+only re-indexes that faculty member, or the holders of that role, so resolving a
+chain at submission time is a handful of dict lookups.
+
+Per step:
+1. Route to the step's own role if anyone holding it is present.
+2. Otherwise route to the first of the role's `fallback_roles` (by role priority) with a present holder.
+3. Otherwise, if `auto_approve_absent_faculty` is on and the step's holders are all absent,
+   the step is auto-approved.
+4. Otherwise the step waits on its own role, as before.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from db import get_db, get_system_settings
+
+logger = logging.getLogger(__name__)
+
+# roles.approval_type -> faculty approval queue it feeds
+APPROVAL_TYPE_QUEUES = {
+    'student_pass': 'student',
+    'faculty_pass': 'faculty',
+    'head_approval': 'head',
+}
+
+# Approval queue name -> faculty field holding explicit approver role keys
+QUEUE_ROLE_FIELDS = {
+    'student': 'assigned_student_roles',
+    'faculty': 'assigned_faculty_roles',
+    'head': 'assigned_head_roles',
+}
+
+# Student passes: (role name, scope) per step, in order
+STUDENT_CHAIN = (('Mentor', 'section'), ('HOD', 'department'))
+# After the listeners fail to start, callers fall back at once for this long before they are retried
+START_RETRY_SECONDS = 30
+
+
+def role_slug(role_name):
+    """'Class Teacher' -> 'class_teacher'."""
+    return '_'.join(str(role_name or '').lower().split())
+
+
+def scoped_key(role_name, scope, student):
+    """Returns the role key of one chain step for a student."""
+    slug = role_slug(role_name)
+    if scope == 'section':
+        return f"{slug}_{student.get('academic_year')}_{student.get('branch')}_{student.get('section')}"
+    if scope == 'department':
+        return f"{slug}_{student.get('branch')}"
+    return slug
+
+
+def faculty_role_keys(faculty):
+    """Returns {queue_name: [role keys]} a faculty member approves for."""
+    keys = {queue_name: list(faculty.get(field) or []) for queue_name, field in QUEUE_ROLE_FIELDS.items()}
+    for role in faculty.get('assigned_roles') or []:
+        if not isinstance(role, dict) or not role.get('role_name'):
+            continue
+        slug = role_slug(role['role_name'])
+        queue_name = APPROVAL_TYPE_QUEUES.get(role.get('approval_type'), 'student')
+        mapping = role.get('mapping')
+        if mapping:
+            role_keys = [f"{slug}_{mapping.get('academic_year')}_{mapping.get('branch')}_{mapping.get('section')}"]
+        else:
+            role_keys = [slug]
+            if faculty.get('department'):
+                role_keys.insert(0, f"{slug}_{faculty['department']}")
+        keys[queue_name].extend(k for k in role_keys if k not in keys[queue_name])
+    return keys
+
+
+def _all_keys(faculty):
+    return {key for role_keys in faculty_role_keys(faculty).values() for key in role_keys}
+
+
+class ApprovalRouter:
+    """Role key -> eligible faculty index, kept current by listeners on `faculty` and `roles`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watches = []
+        self._ready = {'faculty': threading.Event(), 'roles': threading.Event()}
+        self._faculty = {}                        # uid -> (role keys, present, faculty doc)
+        self._holders = defaultdict(set)          # role key -> uids
+        self._present = defaultdict(int)          # role key -> present holders
+        self._roles = {}                          # role id -> role doc
+        self._roles_by_slug = {}                  # role slug -> role id
+        self._role_holders = defaultdict(set)     # role id -> uids (for role renames)
+        self._start_failed_at = None
+
+    # --- Listeners ---
+    def start(self):
+        """Starts the faculty and roles listeners if they are not already running."""
+        with self._lock:
+            if self._watches:
+                return
+            if self._start_failed_at is not None and time.monotonic() - self._start_failed_at < START_RETRY_SECONDS:
+                return
+            watches = []
+            try:
+                db = get_db()
+                watches.append(db.collection('roles').on_snapshot(self._on_roles))
+                watches.append(db.collection('faculty').on_snapshot(self._on_faculty))
+                self._watches = watches
+                self._start_failed_at = None
+                logger.info("Approval routing listeners started")
+            except Exception as e:
+                for watch in watches:
+                    watch.unsubscribe()
+                self._start_failed_at = time.monotonic()
+                logger.error(f"Could not start approval routing listeners, retrying in {START_RETRY_SECONDS}s: {e}")
+
+    def stop(self):
+        with self._lock:
+            for watch in self._watches:
+                watch.unsubscribe()
+            self._watches = []
+            for event in self._ready.values():
+                event.clear()
+            self._faculty.clear()
+            self._holders.clear()
+            self._present.clear()
+            self._roles.clear()
+            self._roles_by_slug.clear()
+            self._role_holders.clear()
+
+    def wait_ready(self, timeout=5):
+        """
+        Starts the listeners if needed and waits for both first snapshots. Returns False
+        (at once while the listeners cannot be started) if the index is not loaded.
+        """
+        self.start()
+        if not self._watches:
+            return False
+        return all(event.wait(timeout) for event in self._ready.values())
+
+    def _on_faculty(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                uid = change.document.id
+                if change.type.name == 'REMOVED':
+                    self._unindex_faculty(uid)
+                else:
+                    self._index_faculty(uid, change.document.to_dict() or {})
+        self._ready['faculty'].set()
+
+    def _on_roles(self, docs, changes, read_time):
+        with self._lock:
+            affected = set()
+            for change in changes:
+                role_id = change.document.id
+                old = self._roles.pop(role_id, None)
+                if old is not None and self._roles_by_slug.get(role_slug(old.get('role_name'))) == role_id:
+                    del self._roles_by_slug[role_slug(old.get('role_name'))]
+                if change.type.name != 'REMOVED':
+                    role = change.document.to_dict() or {}
+                    self._roles[role_id] = role
+                    self._roles_by_slug[role_slug(role.get('role_name'))] = role_id
+                affected |= self._role_holders.get(role_id, set())
+            # A renamed (or late-loaded) role changes the keys of the faculty holding it
+            for uid in affected:
+                entry = self._faculty.get(uid)
+                if entry is not None:
+                    self._index_faculty(uid, entry[2])
+        self._ready['roles'].set()
+
+    def _index_faculty(self, uid, faculty):
+        """(Re)indexes one faculty member. Caller holds the lock."""
+        self._unindex_faculty(uid)
+        faculty = self._with_current_role_names(faculty)
+        keys = _all_keys(faculty)
+        present = faculty.get('status', 'present') != 'absent'
+        self._faculty[uid] = (keys, present, faculty)
+        for key in keys:
+            self._holders[key].add(uid)
+            if present:
+                self._present[key] += 1
+        for role in faculty.get('assigned_roles') or []:
+            if isinstance(role, dict) and role.get('role_id'):
+                self._role_holders[role['role_id']].add(uid)
+
+    def _unindex_faculty(self, uid):
+        entry = self._faculty.pop(uid, None)
+        if entry is None:
+            return
+        keys, present, faculty = entry
+        for key in keys:
+            self._holders[key].discard(uid)
+            if not self._holders[key]:
+                del self._holders[key]
+            if present:
+                self._present[key] -= 1
+                if self._present[key] <= 0:
+                    del self._present[key]
+        for role in faculty.get('assigned_roles') or []:
+            if isinstance(role, dict) and role.get('role_id'):
+                self._role_holders[role['role_id']].discard(uid)
+
+    def _with_current_role_names(self, faculty):
+        """assigned_roles copies the role name at assignment time; prefer the live role document."""
+        assigned = faculty.get('assigned_roles')
+        if not isinstance(assigned, list) or not self._roles:
+            return faculty
+        refreshed = []
+        for role in assigned:
+            live = self._roles.get(role.get('role_id')) if isinstance(role, dict) else None
+            if live:
+                role = {**role, 'role_name': live.get('role_name') or role.get('role_name'),
+                        'approval_type': live.get('approval_type') or role.get('approval_type')}
+            refreshed.append(role)
+        return {**faculty, 'assigned_roles': refreshed}
+
+    def faculty_profile(self, uid):
+        """
+        The faculty member's current document (with current role names) from the index,
+        or None until the faculty listener has loaded or if the uid is unknown. No reads.
+        """
+        if not self._ready['faculty'].is_set():
+            return None
+        with self._lock:
+            entry = self._faculty.get(uid)
+            return dict(entry[2]) if entry else None
+
+    def faculty_name(self, uid):
+        """Name of a faculty member from the index, or None. No reads."""
+        with self._lock:
+            entry = self._faculty.get(uid)
+            return entry[2].get('name') if entry else None
+
+    # --- Resolution ---
+    def _role_for_key(self, key):
+        """Returns (role doc or None, slug) for a role key, by its longest known role-name prefix. Caller holds the lock."""
+        parts = key.split('_')
+        for n in range(len(parts), 0, -1):
+            slug = '_'.join(parts[:n])
+            role_id = self._roles_by_slug.get(slug)
+            if role_id:
+                return self._roles[role_id], slug
+        return None, parts[0]
+
+    def _present_fallback(self, role, suffix, department, exclude_slugs=()):
+        """
+        Returns the first fallback key of `role` with a present holder, trying each
+        fallback role (highest priority, i.e. lowest number, first) in the step's own
+        scope, then the department, then institution-wide. Fallback roles named in
+        `exclude_slugs` are skipped. Caller holds the lock.
+        """
+        if not role:
+            return None
+        fallbacks = [self._roles[role_id] for role_id in role.get('fallback_roles') or [] if role_id in self._roles]
+        fallbacks.sort(key=lambda r: r.get('priority', 99))
+        for fallback in fallbacks:
+            slug = role_slug(fallback.get('role_name'))
+            if slug in exclude_slugs:
+                continue
+            for key in (slug + suffix, f"{slug}_{department}", slug):
+                if self._present.get(key):
+                    return key
+        return None
+
+    def _resolve_step(self, role_name, scope, student, auto_approve_absent):
+        primary = scoped_key(role_name, scope, student)
+        if self._present.get(primary):
+            return {'role': primary, 'status': 'pending'}
+
+        slug = role_slug(role_name)
+        role = self._roles.get(self._roles_by_slug.get(slug))
+        fallback = self._present_fallback(role, primary[len(slug):], student.get('branch'))
+        if fallback:
+            return {'role': fallback, 'status': 'pending', 'routed_from': primary}
+
+        if auto_approve_absent and self._holders.get(primary):
+            return {'role': primary, 'status': 'auto_approved', 'reason': 'approver_absent'}
+        return {'role': primary, 'status': 'pending'}
+
+    def escalation_target(self, origin_key, department, tried=()):
+        """
+        Returns the next fallback key with a present holder for a step that started at
+        `origin_key` and has already waited on every key in `tried`, or None.
+        """
+        with self._lock:
+            role, slug = self._role_for_key(origin_key)
+            tried_slugs = {self._role_for_key(key)[1] for key in tried} | {slug}
+            return self._present_fallback(role, origin_key[len(slug):], department, exclude_slugs=tried_slugs)
+
+    def sla_minutes(self, role_key, default):
+        """Returns the approval SLA of the role behind a key (roles.sla_minutes), or `default`."""
+        with self._lock:
+            role, _ = self._role_for_key(role_key)
+        return (role or {}).get('sla_minutes') or default
+
+    def student_chain(self, student):
+        """Returns the approvals list for a new student pass, routed around absent approvers."""
+        if not self.wait_ready():
+            logger.warning("Approval routing index not ready; using the default chain")
+            return [{'role': scoped_key(name, scope, student), 'status': 'pending'} for name, scope in STUDENT_CHAIN]
+
+        auto_approve_absent = bool(get_system_settings().get('auto_approve_absent_faculty'))
+        with self._lock:
+            return [self._resolve_step(name, scope, student, auto_approve_absent) for name, scope in STUDENT_CHAIN]
+
+
+approval_router = ApprovalRouter()
+
+
+def first_pending(approvals, start=0):
+    """Returns the index of the first pending step at or after `start`, or None when every step is decided."""
+    for i in range(start, len(approvals)):
+        if approvals[i].get('status') == 'pending':
+            return i
+    return None
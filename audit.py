@@ -0,0 +1,135 @@
+"""
+Buffered Audit Log
+Request handlers append audit entries in memory; a background thread writes them
+to the Firestore `audit` collection in batches.
+
+Tuning via environment variables:
+- AUDIT_FLUSH_INTERVAL_MS: flush at least this often while entries are waiting (default 1000)
+- AUDIT_FLUSH_BATCH_SIZE: flush as soon as this many entries are buffered (default 100)
+- AUDIT_MAX_BUFFER: oldest entries are dropped beyond this many (default 10000)
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from db import get_db
+from firebase_admin import firestore
+from flask import has_request_context, session
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects write batches larger than this
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class AuditLog:
+    """In-memory audit buffer with a background flusher."""
+
+    def __init__(self, collection='audit', flush_interval_ms=1000, batch_size=100, max_buffer=10000):
+        self.collection = collection
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self._buffer = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+    def record(self, event_type, actor_id=None, **details):
+        """
+        Buffers an audit entry. Never blocks on Firestore and never raises.
+        The acting user defaults to the logged-in user of the current request.
+        """
+        if actor_id is None and has_request_context():
+            actor_id = session.get('user_id')
+        entry = {
+            'type': event_type,
+            # admin_id is what existing audit readers query; actor_id also covers system jobs
+            'admin_id': actor_id,
+            'actor_id': actor_id,
+            # Set by Firestore on write; recorded_at keeps the order entries were buffered in
+            'timestamp': firestore.SERVER_TIMESTAMP,
+            'recorded_at': datetime.now(timezone.utc),
+            **details,
+        }
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                logger.warning("Audit buffer full, dropping oldest entry")
+            self._buffer.append(entry)
+            pending = len(self._buffer)
+        self._ensure_worker()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Writes all buffered entries to Firestore. Returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    entries = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.batch_size))]
+                if not entries:
+                    return written
+                try:
+                    db = get_db()
+                    batch = db.batch()
+                    collection = db.collection(self.collection)
+                    for entry in entries:
+                        batch.set(collection.document(), entry)
+                    batch.commit()
+                    written += len(entries)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(entries)} audit entries, will retry: {e}")
+                    self._requeue(entries)
+                    return written
+
+    def _requeue(self, entries):
+        """Puts entries from a failed flush back in front, dropping the oldest if the buffer is full."""
+        with self._lock:
+            overflow = len(entries) + len(self._buffer) - self._buffer.maxlen
+            if overflow > 0:
+                logger.warning(f"Audit buffer full, dropping the {overflow} oldest entries")
+                # Failed entries are older than anything buffered since, so they go first
+                entries = entries[overflow:]
+            self._buffer.extendleft(reversed(entries))
+
+    def stop(self):
+        """Stops the flusher and writes out whatever is still buffered."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        self.flush()
+
+    def _ensure_worker(self):
+        if self._thread is not None or self._stopped:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._buffer:
+                self.flush()
+
+
+audit_log = AuditLog(
+    flush_interval_ms=int(os.getenv('AUDIT_FLUSH_INTERVAL_MS', '1000')),
+    batch_size=int(os.getenv('AUDIT_FLUSH_BATCH_SIZE', '100')),
+    max_buffer=int(os.getenv('AUDIT_MAX_BUFFER', '10000')),
+)
+atexit.register(audit_log.stop)
+
+
+def record_audit(event_type, actor_id=None, **details):
+    """Shortcut for `audit_log.record(...)`."""
+    audit_log.record(event_type, actor_id=actor_id, **details)
@@ -0,0 +1,90 @@
+"""
+Identity Toolkit Client
+Shared, pooled HTTP session for Firebase email/password sign-in
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from db import get_auth, using_memory_backend
+
+DEFAULT_BASE_URL = "https://identitytoolkit.googleapis.com"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    """
+    Builds a keep-alive session whose connection pool is reused across logins.
+    Only connection failures and 5xx responses are retried, a bounded number of times.
+    """
+    retries = Retry(
+        total=int(os.getenv('IDENTITY_TOOLKIT_RETRIES', '2')),
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['POST']),
+        raise_on_status=False,
+    )
+    pool_size = int(os.getenv('IDENTITY_TOOLKIT_POOL_SIZE', '20'))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Returns the process-wide Identity Toolkit session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session():
+    """Closes the shared session so the next call rebuilds it (e.g. after changing env settings)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def sign_in_with_password(email, password):
+    """
+    Signs a user in with email and password and returns the Identity Toolkit response JSON.
+
+    The base URL can be pointed at a local stand-in with IDENTITY_TOOLKIT_URL;
+    with DB_BACKEND=memory the in-memory user store answers instead.
+    Raises requests.exceptions.HTTPError for rejected credentials or server errors
+    and requests.exceptions.Timeout if the service does not answer in time.
+    """
+    if using_memory_backend():
+        return get_auth().sign_in_with_password(email, password)
+
+    base_url = os.getenv('IDENTITY_TOOLKIT_URL', DEFAULT_BASE_URL).rstrip('/')
+    api_key = os.getenv("FIREBASE_API_KEY")
+    timeout = (
+        float(os.getenv('IDENTITY_TOOLKIT_CONNECT_TIMEOUT', '3')),
+        float(os.getenv('IDENTITY_TOOLKIT_READ_TIMEOUT', '10')),
+    )
+    payload = {
+        "email": email,
+        "password": password,
+        "returnSecureToken": True
+    }
+    response = get_session().post(
+        f"{base_url}/v1/accounts:signInWithPassword",
+        params={'key': api_key},
+        json=payload,
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,84 @@
+"""
+User Role Resolution
+Works out which collection (admins, faculty or students) a signed-in user belongs to
+"""
+
+from db import get_auth
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Checked in this order, so an admin who also has a faculty profile logs in as admin
+ROLE_COLLECTIONS = [
+    ('admin', 'admins'),
+    ('faculty', 'faculty'),
+    ('student', 'students'),
+]
+
+
+ROLE_PRIORITY = {role: rank for rank, (role, _) in enumerate(ROLE_COLLECTIONS)}
+
+
+def set_user_role(uid, role, replace_higher=False):
+    """
+    Stores the user's role as a custom claim on their Firebase account.
+    The claim is carried in every ID token issued afterwards, so login can go
+    straight to the right collection instead of probing all three.
+
+    Other custom claims are kept. A role claim that outranks `role` (an admin
+    also added as faculty) is left alone unless `replace_higher` is set, which
+    login does once it has found the claimed profile gone.
+
+    Returns True if the claim was written, False otherwise.
+    """
+    try:
+        claims = dict(get_auth().get_user(uid).custom_claims or {})
+        current = claims.get('role')
+        if current == role:
+            return True
+        if not replace_higher and ROLE_PRIORITY.get(current, len(ROLE_PRIORITY)) < ROLE_PRIORITY[role]:
+            logger.info(f"Keeping role claim '{current}' for user {uid} over '{role}'")
+            return False
+        claims['role'] = role
+        get_auth().set_custom_user_claims(uid, claims)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not set role claim for user {uid}: {e}")
+        return False
+
+
+def resolve_user_role(db, uid, decoded_token):
+    """
+    Returns (role, user_info) for the given uid, or (None, None) if the user
+    has no profile in any role collection.
+
+    The candidate documents are fetched together with a single `get_all` round
+    trip. A `role` custom claim in the ID token narrows the lookup to that role
+    and the ones above it (one read for admins, two for faculty), so a profile
+    added in a higher-priority collection still wins. A missing or wrong claim
+    is rewritten for the next login.
+    """
+    claimed_role = decoded_token.get('role')
+    candidates = ROLE_COLLECTIONS
+    if claimed_role in ROLE_PRIORITY:
+        candidates = ROLE_COLLECTIONS[:ROLE_PRIORITY[claimed_role] + 1]
+
+    role, user_info = _first_profile(db, uid, candidates)
+    if role is None and candidates is not ROLE_COLLECTIONS:
+        logger.info(f"Role claim '{claimed_role}' for user {uid} is stale, falling back to lookup")
+        role, user_info = _first_profile(db, uid, ROLE_COLLECTIONS[len(candidates):])
+
+    if role is not None and role != claimed_role:
+        set_user_role(uid, role, replace_higher=True)
+    return role, user_info
+
+
+def _first_profile(db, uid, candidates):
+    """Returns (role, user_info) for the highest-priority profile among `candidates`, or (None, None)."""
+    refs = [db.collection(collection).document(uid) for _, collection in candidates]
+    snapshots = {snap.reference.path: snap for snap in db.get_all(refs)}
+    for (role, _), ref in zip(candidates, refs):
+        snap = snapshots.get(ref.path)
+        if snap is not None and snap.exists:
+            return role, snap.to_dict()
+    return None, None
@@ -1,7 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-from firebase_admin import auth, firestore
+from firebase_admin import auth
+from db import get_db, get_auth
 import requests
-import os
+from .identity import sign_in_with_password
+from .roles import resolve_user_role
+from session_store import rotate_session_id
 
 # Blueprint setup
 auth_bp = Blueprint('auth', __name__, template_folder='templates', url_prefix='/auth')
@@ -30,37 +33,21 @@ def login():
         password = request.form.get('password')
 
         try:
-            api_key = os.getenv("FIREBASE_API_KEY")
-            url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={api_key}"
-            payload = {
-                "email": email,
-                "password": password,
-                "returnSecureToken": True
-            }
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-
-            id_token = response.json()['idToken']
-            decoded_token = auth.verify_id_token(id_token)
+            id_token = sign_in_with_password(email, password)['idToken']
+            decoded_token = get_auth().verify_id_token(id_token)
             uid = decoded_token['uid']
 
-            db = firestore.client()
-            roles_to_check = ['admins', 'faculty', 'students']
-            user_role = None
-            user_info = None
-            is_main_admin_flag = False
+            db = get_db()
+            user_role, user_info = resolve_user_role(db, uid, decoded_token)
+
+            # Check for main admin status by role or name for backward compatibility
+            is_main_admin_flag = bool(
+                user_role == 'admin' and user_info
+                and (user_info.get('role') == 'main_admin' or user_info.get('name') == 'Main Admin')
+            )
 
-            for role in roles_to_check:
-                user_ref = db.collection(role).document(uid).get()
-                if user_ref.exists:
-                    user_role = role.rstrip('s')
-                    user_info = user_ref.to_dict()
-                    # Check for main admin status by role or name for backward compatibility
-                    if user_role == 'admin' and (user_info.get('role') == 'main_admin' or user_info.get('name') == 'Main Admin'):
-                        is_main_admin_flag = True
-                    break
-            
             if user_role and user_info:
+                rotate_session_id(session)
                 session['user_id'] = uid
                 session['user_role'] = user_role
                 session['user_info'] = user_info
@@ -70,8 +57,13 @@ def login():
             else:
                 flash('Your account is not assigned a role. Please contact an administrator.', 'danger')
 
-        except requests.exceptions.HTTPError:
-            flash('Invalid email or password.', 'danger')
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code >= 500:
+                flash('The login service is temporarily unavailable. Please try again.', 'danger')
+            else:
+                flash('Invalid email or password.', 'danger')
+        except requests.exceptions.Timeout:
+            flash('The login service did not respond in time. Please try again.', 'danger')
         except auth.InvalidIdTokenError:
             flash('Invalid ID token.', 'danger')
         except Exception as e:
@@ -0,0 +1,182 @@
+"""
+Analytics Report Benchmark
+Writes a synthetic year of passes and approval steps as a Parquet snapshot, in the
+layout pass_snapshots.py exports, and times the admin analytics report over it:
+
+- read: loading the year's partitions with pandas
+- build: computing every report section (admin.analytics.build_report)
+- cold / cached: get_report() on a new snapshot version, then again from the cache
+
+With --max-seconds the script exits non-zero when the cold report is slower than
+the budget, so it can gate a CI job.
+
+Usage:
+    python -m benchmarks.analytics_report
+    python -m benchmarks.analytics_report --passes 500000 --max-seconds 5
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# The benchmark always runs offline; these must be set before the app modules load
+os.environ['DB_BACKEND'] = 'memory'
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('SCHEDULER_BOOTSTRAP', 'off')
+
+DEPARTMENTS = ['CSE', 'ECE', 'EEE', 'MECH', 'CIVIL', 'IT']
+PASS_TYPES = ['outing', 'medical', 'personal', 'event']
+STATUSES = ['approved', 'auto_approved', 'rejected', 'revoked']
+STATUS_WEIGHTS = [0.72, 0.1, 0.16, 0.02]
+
+
+def build_frames(passes, students, faculty, seed, start, end):
+    """Returns (passes, approvals) DataFrames for passes between `start` and `end`, generated with NumPy."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    # A few students apply far more often than the rest
+    weights = rng.pareto(2.5, students) + 1
+    applicant = rng.choice(students, size=passes, p=weights / weights.sum())
+    department = np.array(DEPARTMENTS)[applicant % len(DEPARTMENTS)]
+    # Requests cluster around the lunch hour and the end of classes
+    day = rng.integers(0, (end - start).days, passes)
+    minute = np.clip(rng.normal(rng.choice([12.5, 16], passes) * 60, 60), 0, 1439).astype(int)
+    date = pd.to_datetime(start, utc=True) + pd.to_timedelta(day * 1440 + minute, unit='min')
+    status = rng.choice(STATUSES, size=passes, p=STATUS_WEIGHTS)
+
+    frame = pd.DataFrame({
+        'pass_id': np.char.add('p', np.arange(passes).astype(str)),
+        'applicant_id': np.char.add('s', applicant.astype(str)),
+        'applicant_type': 'student',
+        'academic_year': 2021 + applicant % 4,
+        'pass_out_year': 2025 + applicant % 4,
+        'section': np.array(['A', 'B', 'C'])[applicant % 3],
+        'pass_type': rng.choice(PASS_TYPES, size=passes),
+        'status': status,
+        'is_automatic': False,
+        'date': date,
+        'out_time': None,
+        'in_time': None,
+        'actual_out': date + pd.to_timedelta(rng.integers(5, 60, passes), unit='min'),
+        'actual_in': pd.NaT,
+        'late_return': rng.random(passes) < 0.03,
+        'late_by_minutes': None,
+        'overdue_return': False,
+        'month': date.strftime('%Y-%m'),
+        'department': department,
+    })
+
+    # One to three approval steps per pass, each decided some minutes after the previous one
+    steps = rng.integers(1, 4, passes)
+    owner = np.repeat(np.arange(passes), steps)
+    step = np.arange(len(owner)) - np.repeat(np.cumsum(steps) - steps, steps)
+    waited = pd.to_timedelta(rng.exponential(45, len(owner)), unit='min').floor('s')
+    requested = date[owner] + pd.to_timedelta(step * 90, unit='min')
+    approvals = pd.DataFrame({
+        'pass_id': frame['pass_id'].to_numpy()[owner],
+        'step': step,
+        'role': np.char.add(np.array(['mentor_', 'class_teacher_', 'hod_'])[step], department[owner]),
+        'status': np.where(status[owner] == 'rejected', 'rejected',
+                           np.where(status[owner] == 'auto_approved', 'auto_approved', 'approved')),
+        'approved_by': np.char.add('f', rng.integers(0, faculty, len(owner)).astype(str)),
+        'reason': None,
+        'escalated': rng.random(len(owner)) < 0.05,
+        'requested_at': requested,
+        'decided_at': requested + waited,
+        'month': frame['month'].to_numpy()[owner],
+        'department': department[owner],
+    })
+    return frame, approvals
+
+
+def write_snapshot(directory, passes, approvals, watermark):
+    """Writes the frames as the exporter lays them out and publishes a manifest."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from pass_snapshots import APPROVAL_FIELDS, PASS_FIELDS, _schema, _write_manifest
+
+    for name, frame, fields in (('passes', passes, PASS_FIELDS), ('approvals', approvals, APPROVAL_FIELDS)):
+        schema = _schema(fields).append(pa.field('month', pa.string())).append(pa.field('department', pa.string()))
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        pq.write_to_dataset(table, os.path.join(directory, name), partition_cols=['month', 'department'],
+                            basename_template='part-0-{i}.parquet', compression='zstd')
+    _write_manifest(directory, {'version': 1, 'watermark': watermark.isoformat(), 'total_rows': len(passes),
+                                'runs': []})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--passes', type=int, default=500000)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--faculty', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--max-seconds', type=float, help='fail when the cold report takes longer than this')
+    parser.add_argument('--output', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    from admin.analytics import APPROVAL_COLUMNS, PASS_COLUMNS, build_report, get_report, report_months
+    from pass_snapshots import read_approvals, read_passes
+
+    directory = tempfile.mkdtemp(prefix='analytics-bench-')
+    # Passes fill the twelve months a 'year' report covers, up to today
+    end = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    months = report_months('year', end.isoformat())
+    start = datetime.strptime(months[0], '%Y-%m').replace(tzinfo=timezone.utc)
+    started = time.perf_counter()
+    passes, approvals = build_frames(args.passes, args.students, args.faculty, args.seed, start, end)
+    write_snapshot(directory, passes, approvals, end)
+    generated = time.perf_counter() - started
+    size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files)
+
+    started = time.perf_counter()
+    frame = read_passes(directory, months=months, columns=PASS_COLUMNS)
+    steps = read_approvals(directory, months=months, columns=APPROVAL_COLUMNS)
+    read_s = time.perf_counter() - started
+    started = time.perf_counter()
+    built = build_report(frame, steps)
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_report('year', directory=directory, with_names=False)
+    cold_s = time.perf_counter() - started
+    started = time.perf_counter()
+    get_report('year', directory=directory, with_names=False)
+    cached_ms = (time.perf_counter() - started) * 1000
+
+    report = {
+        'passes': len(frame),
+        'approval_steps': len(steps),
+        'snapshot_mb': round(size / 1e6, 1),
+        'generate_s': round(generated, 2),
+        'read_s': round(read_s, 3),
+        'build_s': round(build_s, 3),
+        'cold_report_s': round(cold_s, 3),
+        'cached_report_ms': round(cached_ms, 3),
+        'report_json_kb': round(len(json.dumps(built)) / 1024, 1),
+        'outliers': len(built['repeat_applicants']['outliers']),
+        'peak': built['heatmap']['peak'],
+    }
+    failures = []
+    if args.max_seconds is not None and cold_s > args.max_seconds:
+        failures.append(f"cold report took {cold_s:.2f}s > budget {args.max_seconds}s")
+    report['failures'] = failures
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
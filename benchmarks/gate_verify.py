@@ -0,0 +1,240 @@
+"""
+Gate Verification Benchmark
+Issues signed gate tokens for a day's worth of synthetic approved passes, revokes
+a share of them, and measures how fast one process verifies scans:
+
+- token: verify_token alone (signature and validity window)
+- scan: verify_scan (token plus the in-memory revocation list)
+- single: one /gate/verify request per scan
+- batch: /gate/verify-batch with --batch-size scans per request, as an offline
+  scanner syncs them
+
+- events: /gate/events exit scans, buffered in the write-ahead file, and the time
+  until the flusher has written them all to the passes
+
+It also reports the size of a full revocation snapshot and of an incremental refresh.
+With --min-batch-scans-per-sec the script exits non-zero when batch throughput is
+below the budget, so it can gate a CI job.
+
+Usage:
+    python -m benchmarks.gate_verify
+    python -m benchmarks.gate_verify --passes 20000 --batch-size 500 --min-batch-scans-per-sec 5000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# The benchmark always runs offline; these must be set before the app modules load
+os.environ['DB_BACKEND'] = 'memory'
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('PASS_TOKEN_SECRET', 'benchmark-pass-token-secret')
+os.environ.setdefault('SCHEDULER_BOOTSTRAP', 'off')
+os.environ['GATE_API_KEY'] = 'benchmark-gate-key'
+os.environ.setdefault('GATE_EVENT_WAL', os.path.join(tempfile.mkdtemp(prefix='gate-bench-'), 'gate_events.wal'))
+os.environ.setdefault('GATE_EVENT_MAX_BACKLOG', '1000000')
+
+PASS_TYPES = ['outing', 'medical', 'personal', 'event']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def issue_tokens(count, seed=42):
+    """Returns [(pass_id, pass_data with gate_token)] for `count` passes approved this morning."""
+    from pass_tokens import issue_token
+
+    rng = random.Random(seed)
+    approved_at = datetime.now(timezone.utc) - timedelta(minutes=30)
+    passes = []
+    for _ in range(count):
+        pass_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        pass_data = {
+            'applicant_id': uuid.UUID(int=rng.getrandbits(128)).hex[:28],
+            'pass_type': rng.choice(PASS_TYPES),
+            'date': approved_at,
+        }
+        pass_data['gate_token'] = issue_token(pass_id, pass_data, approved_at)
+        passes.append((pass_id, pass_data))
+    return passes
+
+
+def seed_revocations(db, passes, hours=(2, 1)):
+    """Loads revocations spread over an earlier window (hours ago) straight into the store."""
+    from pass_tokens import token_expiry
+
+    now = datetime.now(timezone.utc)
+    start, end = now - timedelta(hours=hours[0]), now - timedelta(hours=hours[1])
+    step = (end - start) / max(1, len(passes))
+    documents = {}
+    for i, (pass_id, pass_data) in enumerate(passes):
+        revoked_at = start + step * i
+        documents[pass_id] = {'pass_id': pass_id, 'version': int(revoked_at.timestamp() * 1e6),
+                              'reason': 'benchmark', 'revoked_by': 'benchmark', 'revoked_at': revoked_at,
+                              'expires_at': token_expiry(pass_data['gate_token'])}
+    db.bulk_load('pass_revocations', documents)
+
+
+def time_calls(func, tokens):
+    started = time.perf_counter()
+    for token in tokens:
+        func(token)
+    elapsed = time.perf_counter() - started
+    return {'calls': len(tokens), 'us_per_call': round(elapsed / len(tokens) * 1e6, 2),
+            'per_sec': round(len(tokens) / elapsed)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--passes', type=int, default=10000, help='approved passes with tokens')
+    parser.add_argument('--revoked', type=float, default=0.02, help='share of passes revoked')
+    parser.add_argument('--scans', type=int, default=20000, help='scans verified per measurement')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--single-requests', type=int, default=2000, help='scans sent one request each')
+    parser.add_argument('--min-batch-scans-per-sec', type=float, help='fail when batch throughput is below this')
+    parser.add_argument('--output', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    from app import create_app
+    from db import get_db
+    from gate_events import gate_event_log
+    from pass_revocations import revocation_index, revoke_pass, verify_scan
+    from pass_tokens import verify_token
+
+    app = create_app()
+    db = get_db()
+    client = app.test_client()
+    # Scans come from a scanner device holding the gate key
+    client.environ_base['HTTP_X_GATE_KEY'] = os.environ['GATE_API_KEY']
+
+    passes = issue_tokens(args.passes)
+    revoked_count = int(len(passes) * args.revoked)
+    # Most revocations are over an hour old; the last few arrive through the app, as an incremental refresh would see them
+    late = min(10, revoked_count)
+    seed_revocations(db, passes[:revoked_count - late])
+    if not revocation_index.wait_ready(timeout=30):
+        sys.exit("Revocation listener did not become ready")
+    before_refresh = revocation_index.version
+    batch = db.batch()
+    for pass_id, pass_data in passes[revoked_count - late:revoked_count]:
+        revoke_pass(batch, db, pass_id, pass_data, 'benchmark', 'benchmark')
+    batch.commit()
+    deadline = time.monotonic() + 10
+    while len(revocation_index.snapshot()['revoked']) < revoked_count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    rng = random.Random(7)
+    scans = [rng.choice(passes)[1]['gate_token'] for _ in range(args.scans)]
+    expected_revoked = {pass_id for pass_id, _ in passes[:revoked_count]}
+
+    report = {
+        'passes': len(passes),
+        'revoked': revoked_count,
+        'token': time_calls(verify_token, scans),
+        'scan': time_calls(verify_scan, scans),
+    }
+
+    # One request per scan
+    single = scans[:args.single_requests]
+    started = time.perf_counter()
+    for token in single:
+        response = client.post('/gate/verify', json={'token': token})
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - started
+    report['single'] = {'requests': len(single), 'scans_per_sec': round(len(single) / elapsed),
+                        'ms_per_request': round(elapsed / len(single) * 1000, 3)}
+
+    # Offline scanners syncing in bursts
+    now = datetime.now(timezone.utc)
+    latencies, flagged, wrong = [], 0, 0
+    started = time.perf_counter()
+    for i in range(0, len(scans), args.batch_size):
+        chunk = scans[i:i + args.batch_size]
+        body = {'scans': [{'token': token, 'scanned_at': (now - timedelta(minutes=j % 20)).isoformat()}
+                          for j, token in enumerate(chunk)]}
+        batch_started = time.perf_counter()
+        response = client.post('/gate/verify-batch', json=body)
+        latencies.append((time.perf_counter() - batch_started) * 1000)
+        assert response.status_code == 200, response.status_code
+        for result in response.get_json()['results']:
+            is_revoked = result['reason'] == 'revoked'
+            flagged += is_revoked
+            wrong += is_revoked != (result['pass_id'] in expected_revoked)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    report['batch'] = {
+        'batch_size': args.batch_size,
+        'requests': len(latencies),
+        'scans_per_sec': round(len(scans) / elapsed),
+        'ms_per_batch': {'p50': round(percentile(latencies, 50), 3), 'p95': round(percentile(latencies, 95), 3)},
+        'revoked_scans_flagged': flagged,
+        'misclassified': wrong,
+    }
+
+    full = client.get('/gate/revocations')
+    delta = client.get(f'/gate/revocations?since={before_refresh}')
+    report['revocations'] = {
+        'version': full.get_json()['version'],
+        'full_ids': len(full.get_json()['revoked']),
+        'full_bytes': len(full.data),
+        'delta_ids': len(delta.get_json()['revoked']),
+        'delta_bytes': len(delta.data),
+    }
+
+    # Exit scans through the write-ahead buffer, then until every pass is stamped
+    db.bulk_load('passes', {pass_id: {'applicant_id': pass_data['applicant_id'], 'status': 'approved'}
+                            for pass_id, pass_data in passes})
+    valid = [pass_data['gate_token'] for pass_id, pass_data in passes[revoked_count:]][:args.scans]
+    started = time.perf_counter()
+    for i in range(0, len(valid), args.batch_size):
+        chunk = valid[i:i + args.batch_size]
+        response = client.post('/gate/events', json={'events': [{'token': token, 'direction': 'out', 'gate': 'bench'}
+                                                                for token in chunk]})
+        assert response.status_code == 202, response.status_code
+    ingested = time.perf_counter() - started
+    deadline = time.monotonic() + 120
+    while gate_event_log.summary()['backlog'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    drained = time.perf_counter() - started
+    status = gate_event_log.summary()
+    report['events'] = {
+        'events': len(valid),
+        'ingest_per_sec': round(len(valid) / ingested),
+        'drained_ms': round(drained * 1000, 1),
+        'firestore_writes': status['writes'],
+        'backlog_left': status['backlog'],
+    }
+
+    failures = []
+    if status['backlog']:
+        failures.append(f"{status['backlog']} gate events were not flushed")
+    if wrong:
+        failures.append(f"{wrong} scans misclassified against the revocation list")
+    if args.min_batch_scans_per_sec is not None and report['batch']['scans_per_sec'] < args.min_batch_scans_per_sec:
+        failures.append(f"batch throughput {report['batch']['scans_per_sec']}/s "
+                        f"< budget {args.min_batch_scans_per_sec}/s")
+    report['failures'] = failures
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
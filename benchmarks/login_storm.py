@@ -0,0 +1,136 @@
+"""
+Login Storm Benchmark
+Compares per-login connections (plain requests.post) with the pooled Identity Toolkit
+session against a local stand-in server.
+
+Usage:
+    python -m benchmarks.login_storm --workers 50 --logins 20 --handshake-ms 30
+
+The stand-in sleeps for --handshake-ms whenever a new TCP connection is accepted,
+to model the TLS handshake cost that connection reuse avoids.
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from auth import identity
+
+
+def _make_handler(handshake_s, response_s):
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if handshake_s:
+                time.sleep(handshake_s)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            if response_s:
+                time.sleep(response_s)
+            body = json.dumps({'idToken': 'stand-in-token', 'localId': 'stand-in-uid'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInHandler
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stand_in(handshake_ms=30, response_ms=5):
+    """Starts the stand-in Identity Toolkit server on a free port and returns it."""
+    server = StandInServer(('127.0.0.1', 0), _make_handler(handshake_ms / 1000, response_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_storm(login_fn, workers, logins_per_worker):
+    """Runs workers * logins_per_worker logins concurrently and returns latency stats in ms."""
+    def worker(_):
+        latencies = []
+        for i in range(logins_per_worker):
+            start = time.perf_counter()
+            login_fn(f"student{i}@example.com", "Hitam@123")
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(worker, range(workers)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(l for worker_latencies in results for l in worker_latencies)
+    return {
+        'logins': len(latencies),
+        'throughput_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--logins', type=int, default=20, help='logins per worker')
+    parser.add_argument('--handshake-ms', type=float, default=30)
+    parser.add_argument('--response-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    server = start_stand_in(args.handshake_ms, args.response_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ['IDENTITY_TOOLKIT_URL'] = base_url
+    os.environ['IDENTITY_TOOLKIT_POOL_SIZE'] = str(args.workers)
+    identity.reset_session()
+
+    def unpooled_login(email, password):
+        response = requests.post(
+            f"{base_url}/v1/accounts:signInWithPassword?key=test",
+            json={"email": email, "password": password, "returnSecureToken": True},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    try:
+        report = {
+            'config': vars(args),
+            'unpooled': run_storm(unpooled_login, args.workers, args.logins),
+            'pooled': run_storm(identity.sign_in_with_password, args.workers, args.logins),
+        }
+    finally:
+        server.shutdown()
+        identity.reset_session()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Pass Archival Benchmark
+Simulates several years of passes and measures the live queries after each year,
+once with the history left in the `passes` collection and once with the nightly
+archival job moving closed passes into per-term archives:
+
+- live_passes: documents left in the live collection (what its indexes cover)
+- overview_ms: one scan of the live passes, newest first, as the admin pass overview does
+- history_ms / history_reads: a student's first page of approved passes
+- archive_page_reads: the first history page past the live passes (archived runs only)
+- archive_ms: how long that year's archival run took
+
+With archival, live_passes and overview_ms should stay roughly flat from one year to the next.
+
+Usage:
+    python -m benchmarks.pass_archive
+    python -m benchmarks.pass_archive --students 2000 --passes-per-year 40 --years 5
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# The benchmark always runs offline; these must be set before the app modules load
+os.environ['DB_BACKEND'] = 'memory'
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('SCHEDULER_BOOTSTRAP', 'off')
+
+PASS_TYPES = ['outing', 'medical', 'personal', 'event']
+STATUSES = ['approved'] * 7 + ['auto_approved', 'rejected', 'rejected']
+
+
+def year_of_passes(rng, students, per_student, start):
+    """Returns {pass_id: data} for one year of passes starting at `start`."""
+    passes = {}
+    for applicant_id in students:
+        for _ in range(per_student):
+            passes[str(uuid.UUID(int=rng.getrandbits(128)))] = {
+                'applicant_id': applicant_id,
+                'pass_type': rng.choice(PASS_TYPES),
+                'status': rng.choice(STATUSES),
+                'reason': 'benchmark',
+                'date': start + timedelta(seconds=rng.randrange(365 * 86400)),
+            }
+    return passes
+
+
+def measure(db, students, rng, sample):
+    """Times the live-collection queries the app runs every day."""
+    from firebase_admin import firestore
+    from pass_summaries import HISTORY_PAGE_SIZE, list_approved_passes
+
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        scanned = sum(1 for _ in db.collection_group('passes')
+                      .order_by('date', direction=firestore.Query.DESCENDING).stream())
+        timings.append((time.perf_counter() - started) * 1000)
+    overview_ms = min(timings)
+
+    picked = rng.sample(students, min(sample, len(students)))
+    reads = db.stats['reads']
+    started = time.perf_counter()
+    for applicant_id in picked:
+        list_approved_passes(db, applicant_id)
+    history_ms = (time.perf_counter() - started) * 1000 / len(picked)
+    result = {
+        'live_passes': scanned,
+        'overview_ms': round(overview_ms, 1),
+        'history_ms': round(history_ms, 3),
+        'history_reads': round((db.stats['reads'] - reads) / len(picked), 1),
+    }
+
+    # Follow one student's history until it leaves the live collection
+    reads_per_page = []
+    cursor = None
+    while True:
+        reads = db.stats['reads']
+        passes, cursor = list_approved_passes(db, picked[0], cursor=cursor)
+        reads_per_page.append(db.stats['reads'] - reads)
+        if not cursor or '/' in cursor or len(reads_per_page) > 1000:
+            break
+    if cursor and '/' in cursor:
+        reads = db.stats['reads']
+        list_approved_passes(db, picked[0], cursor=cursor)
+        result['archive_page_reads'] = db.stats['reads'] - reads
+    result['history_pages_to_archive'] = len(reads_per_page)
+    result['history_page_size'] = HISTORY_PAGE_SIZE
+    return result
+
+
+def simulate(db, args, archive):
+    from pass_archive import archive_closed_passes
+
+    db.reset()
+    rng = random.Random(args.seed)
+    students = [uuid.UUID(int=rng.getrandbits(128)).hex[:28] for _ in range(args.students)]
+    # Summaries and global counts exist already, as they do for every account since they were introduced
+    db.bulk_load('pass_summaries', {uid: {'total_passes': 0, 'counts_by_status': {}} for uid in students})
+    db.bulk_load('pass_stats', {'global': {'total_passes': 0, 'counts_by_status': {},
+                                           'backfilled_at': datetime.now(timezone.utc)}})
+
+    first_year = datetime.now(timezone.utc).year - args.years
+    years = []
+    for year in range(args.years):
+        year_start = datetime(first_year + year, 1, 1, tzinfo=timezone.utc)
+        db.bulk_load('passes', year_of_passes(rng, students, args.passes_per_year, year_start))
+        row = {'year': year_start.year}
+        if archive:
+            result = archive_closed_passes(now=year_start.replace(year=year_start.year + 1),
+                                           horizon_days=args.horizon_days, max_passes=10 ** 9)
+            if result['status'] != 'success':
+                sys.exit(f"Archival failed: {result.get('message')}")
+            row['archived'] = result['moved']
+            row['archive_ms'] = round(result['elapsed_ms'], 1)
+        row.update(measure(db, students, random.Random(year), args.sample))
+        print(f"  {'archived' if archive else 'live only'} {row}", file=sys.stderr)
+        years.append(row)
+    return years
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--passes-per-year', type=int, default=40, help='passes per student per year')
+    parser.add_argument('--years', type=int, default=4)
+    parser.add_argument('--horizon-days', type=int, default=180)
+    parser.add_argument('--sample', type=int, default=200, help='students whose history is timed each year')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    from app import create_app
+    from db import get_db
+
+    create_app()
+    db = get_db()
+    report = {
+        'dataset': {'students': args.students, 'passes_per_year': args.students * args.passes_per_year,
+                    'years': args.years, 'horizon_days': args.horizon_days},
+        'live_only': simulate(db, args, archive=False),
+        'archived': simulate(db, args, archive=True),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
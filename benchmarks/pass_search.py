@@ -0,0 +1,137 @@
+"""
+Pass Search Benchmark
+Indexes synthetic passes into the pass search index (pass_search.py) through the
+in-memory backend's listener and times:
+
+- build: the first snapshot indexing every pass
+- update: re-indexing one pass after a status change and after a reason change
+- query: p50/p95 latency of ranked searches (names, roll numbers, reason words,
+  date-filtered and second-page queries)
+
+With --max-query-ms the script exits non-zero when p95 query latency is over budget.
+
+Usage:
+    python -m benchmarks.pass_search
+    python -m benchmarks.pass_search --passes 200000 --max-query-ms 50
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+# The benchmark always runs offline; these must be set before the app modules load
+os.environ['DB_BACKEND'] = 'memory'
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('SCHEDULER_BOOTSTRAP', 'off')
+os.environ.setdefault('PASS_SEARCH_DB', ':memory:')
+
+FIRST_NAMES = ['Ravi', 'Anita', 'Suresh', 'Priya', 'Kiran', 'Lakshmi', 'Arjun', 'Divya', 'Rahul', 'Sneha']
+LAST_NAMES = ['Kumar', 'Sharma', 'Reddy', 'Rao', 'Naidu', 'Varma', 'Gupta', 'Iyer']
+REASONS = ['hospital visit', 'going home for the festival', 'bank work', 'family function',
+           'passport appointment', 'fever and cold', 'sports tournament', 'internship interview']
+DEPARTMENTS = ['CSE', 'ECE', 'EEE', 'MECH', 'CIVIL', 'IT']
+
+
+def _wait_for(predicate, timeout=600):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError('pass search index did not catch up')
+        time.sleep(0.001)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--passes', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--max-query-ms', type=float, help='fail when p95 query latency is above this')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    from db import get_db
+    from pass_search import PassSearchIndex
+
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    docs = {}
+    for i in range(args.passes):
+        department = DEPARTMENTS[i % len(DEPARTMENTS)]
+        docs[f'p{i}'] = {
+            'applicant_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'applicant_type': 'student',
+            'roll_number': f"21E51A{i:06d}",
+            'reason': rng.choice(REASONS),
+            'pass_type': 'outing',
+            'department': department,
+            'status': 'approved',
+            'date': now - timedelta(minutes=rng.randrange(365 * 1440)),
+            'approvals': [{'role': f'mentor_{department}', 'approved_by': f'f{rng.randrange(300)}',
+                           'status': 'approved'}],
+        }
+    get_db().bulk_load('passes', docs)
+
+    index = PassSearchIndex(':memory:')
+    started = time.perf_counter()
+    index.wait_ready(timeout=600)
+    build_s = time.perf_counter() - started
+
+    db = get_db()
+    updates = {}
+    for name, change in (('status', {'status': 'revoked'}), ('reason', {'reason': 'medical emergency'})):
+        indexed = index.summary()['indexed']
+        started = time.perf_counter()
+        db.collection('passes').document('p1').update(change)
+        _wait_for(lambda: index.summary()['indexed'] > indexed)
+        updates[f'{name}_update_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    queries = []
+    for _ in range(args.queries):
+        kind = rng.randrange(5)
+        if kind == 0:
+            queries.append({'text': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"})
+        elif kind == 1:
+            queries.append({'text': f"21E51A{rng.randrange(args.passes):06d}"})
+        elif kind == 2:
+            queries.append({'text': rng.choice(REASONS).split()[0][:4]})
+        elif kind == 3:
+            queries.append({'text': rng.choice(REASONS), 'date_from': now - timedelta(days=30)})
+        else:
+            name = rng.choice(FIRST_NAMES)
+            queries.append({'text': name, 'cursor': index.search(name)['next_cursor']})
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(**query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+
+    report = {
+        'passes': args.passes,
+        'build_s': round(build_s, 2),
+        **updates,
+        'queries': len(latencies),
+        'query_p50_ms': round(statistics.median(latencies), 3),
+        'query_p95_ms': round(p95, 3),
+        'index': index.summary(),
+    }
+    failures = []
+    if args.max_query_ms is not None and p95 > args.max_query_ms:
+        failures.append(f"p95 query latency {p95:.1f}ms > budget {args.max_query_ms}ms")
+    report['failures'] = failures
+    index.stop()
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+"""
+Route Load Benchmark
+Seeds a synthetic campus into the in-memory storage backend and drives the app's
+busiest routes through the Flask test client, reporting throughput, latency
+percentiles and Firestore reads/writes per request.
+
+Usage:
+    python -m benchmarks.route_load
+    python -m benchmarks.route_load --scale 0.1 --only admin.index student.gate_pass
+    python -m benchmarks.route_load --latency-ms 8 --compare benchmarks/results/routes-abc1234.json
+
+Results are written as JSON to benchmarks/results/routes-<commit>.json (or --output),
+so runs from different commits can be compared with --compare.
+
+Reads and writes are counted the way Firestore bills them (one read per document
+returned), so they carry over to production even though latency does not.
+--latency-ms adds a sleep per storage round trip to approximate network time.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+# The benchmark always runs offline; these must be set before the app modules load
+os.environ['DB_BACKEND'] = 'memory'
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('PASS_TOKEN_SECRET', 'benchmark-pass-token-secret')
+os.environ.setdefault('SCHEDULER_BOOTSTRAP', 'off')
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+PASSWORD = 'Hitam@123'
+
+BRANCHES = ['CSE', 'ECE', 'EEE', 'MECH', 'CIVIL', 'IT']
+SECTIONS = ['A', 'B', 'C']
+ACADEMIC_YEARS = [2021, 2022, 2023, 2024]
+PASS_TYPES = ['outing', 'medical', 'personal', 'event']
+FIRST_NAMES = ['Arif', 'Sana', 'Ravi', 'Priya', 'Imran', 'Lakshmi', 'Kiran', 'Ayesha', 'Vikram', 'Divya']
+LAST_NAMES = ['Hussain', 'Reddy', 'Sharma', 'Khan', 'Rao', 'Begum', 'Naidu', 'Varma']
+
+
+# --- Dataset ---
+def build_dataset(students=5000, faculty=300, passes=200000, seed=42):
+    """Returns {collection: {doc_id: data}} plus the generated accounts, deterministically."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def name():
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    student_docs = {}
+    for i in range(students):
+        year = ACADEMIC_YEARS[i % len(ACADEMIC_YEARS)]
+        branch = BRANCHES[(i // len(ACADEMIC_YEARS)) % len(BRANCHES)]
+        roll = f"{year % 100}E51A{BRANCHES.index(branch):02d}{i:04d}"
+        student_docs[f"stu{i:05d}"] = {
+            'name': name(),
+            'email': f"{roll.lower()}@hitam.org",
+            'roll_number': roll,
+            'branch': branch,
+            'section': SECTIONS[i % len(SECTIONS)],
+            'academic_year': year,
+            'pass_out_year': year + 4,
+            'gender': rng.choice(['Male', 'Female']),
+            'religion': rng.choices(['Muslim', 'Hindu', 'Christian'], weights=[15, 75, 10])[0],
+            'phone': f"+91 9{rng.randrange(10**8, 10**9)}",
+            'parents': [{'name': name(), 'email': f"parent{i}@example.com", 'phone': '+91 9000000000'}],
+            'created_at': now - timedelta(days=rng.randrange(30, 900)),
+        }
+
+    # Mentor roles for every (year, branch, section); one HOD per branch
+    mentor_roles = [f"mentor_{y}_{b}_{s}" for y in ACADEMIC_YEARS for b in BRANCHES for s in SECTIONS]
+    faculty_docs = {}
+    for i in range(faculty):
+        branch = BRANCHES[i % len(BRANCHES)]
+        student_roles = [mentor_roles[i]] if i < len(mentor_roles) else []
+        head_roles = []
+        if i < len(BRANCHES):
+            student_roles.append(f"hod_{branch}")
+            head_roles.append(f"hod_{branch}")
+        faculty_docs[f"fac{i:04d}"] = {
+            'name': name(),
+            'email': f"faculty{i:04d}@hitam.org",
+            'department': branch,
+            'faculty_id': f"HF{i:04d}",
+            'gender': rng.choice(['Male', 'Female']),
+            'status': 'present',
+            'assigned_student_roles': student_roles,
+            'assigned_faculty_roles': [],
+            'assigned_head_roles': head_roles,
+            'assigned_roles': [],
+        }
+
+    pass_docs = {}
+    student_ids = list(student_docs)
+    for i in range(passes):
+        applicant_id = rng.choice(student_ids)
+        student = student_docs[applicant_id]
+        mentor = f"mentor_{student['academic_year']}_{student['branch']}_{student['section']}"
+        hod = f"hod_{student['branch']}"
+        status = rng.choices(['approved', 'rejected', 'pending', 'auto_approved'], weights=[70, 10, 5, 15])[0]
+        # Pending passes are recent; closed ones are spread over the last two terms
+        age = timedelta(hours=rng.randrange(0, 72)) if status == 'pending' else timedelta(
+            days=rng.randrange(1, 180), minutes=rng.randrange(0, 1440))
+        approvals = [{'role': mentor, 'status': 'pending' if status == 'pending' else status},
+                     {'role': hod, 'status': 'pending' if status == 'pending' else status}]
+        pass_docs[f"pass{i:06d}"] = {
+            'pass_id': f"pass{i:06d}",
+            'applicant_id': applicant_id,
+            'applicant_name': student['name'],
+            'applicant_type': 'student',
+            'roll_number': student['roll_number'],
+            'department': student['branch'],
+            'academic_year': student['academic_year'],
+            'pass_out_year': student['pass_out_year'],
+            'pass_type': 'jumma' if status == 'auto_approved' else rng.choice(PASS_TYPES),
+            'reason': 'Synthetic benchmark pass',
+            'date': today - age if status != 'pending' else now - age,
+            'out_time': f"{rng.randrange(9, 16):02d}:{rng.randrange(0, 60):02d}",
+            'status': status,
+            'approvals': approvals,
+            'current_approver': mentor if status == 'pending' else None,
+            'escalate_at': now - age + timedelta(minutes=60) if status == 'pending' else None,
+        }
+
+    admin_docs = {'adm0001': {'name': 'Main Admin', 'email': 'admin@hitam.org', 'role': 'main_admin'}}
+    settings = {'system': {
+        'student_pass_start_time': '00:00',
+        'student_pass_end_time': '23:59',
+        'student_working_days': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+        'auto_jumma_pass_enabled': True,
+        'jumma_pass_start_time': '12:00',
+        'jumma_pass_end_time': '14:00',
+        'auto_approve_absent_faculty': True,
+    }}
+    roles = {
+        'mentor': {'role_name': 'Mentor', 'approval_type': 'student_pass', 'priority': 1, 'fallback_roles': ['hod']},
+        'hod': {'role_name': 'HOD', 'approval_type': 'student_pass', 'priority': 2, 'fallback_roles': []},
+    }
+    # Summaries as the app maintains them, so dashboards are measured in steady state
+    from pass_summaries import summarise
+    by_applicant = {}
+    for pass_id, pass_data in pass_docs.items():
+        by_applicant.setdefault(pass_data['applicant_id'], []).append((pass_id, pass_data))
+    summary_docs = {applicant_id: summarise(passes) for applicant_id, passes in by_applicant.items()}
+    overall = summarise(list(pass_docs.items()))
+    stats_docs = {'global': {'total_passes': overall['total_passes'], 'counts_by_status': overall['counts_by_status'],
+                             'counts_by_type': overall['counts_by_type'], 'backfilled_at': now}}
+
+    return {
+        'students': student_docs,
+        'faculty': faculty_docs,
+        'admins': admin_docs,
+        'passes': pass_docs,
+        'pass_summaries': summary_docs,
+        'pass_stats': stats_docs,
+        'settings': settings,
+        'roles': roles,
+    }
+
+
+def seed_backend(dataset):
+    """Loads the dataset into the memory backend and creates a login for every person."""
+    from db import get_auth, get_db
+
+    db, users = get_db(), get_auth()
+    for collection, documents in dataset.items():
+        db.bulk_load(collection, documents)
+    for collection, role in (('students', 'student'), ('faculty', 'faculty'), ('admins', 'admin')):
+        for uid, data in dataset[collection].items():
+            users.create_user(uid=uid, email=data['email'], password=PASSWORD, display_name=data.get('name'))
+            users.set_custom_user_claims(uid, {'role': role})
+
+
+# --- Measurement ---
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Scenario:
+    """One benchmarked route: `run(i)` performs request number i and returns its HTTP status."""
+
+    def __init__(self, name, run, requests, expect=(200,), warmup=True):
+        self.name = name
+        self.run = run
+        self.requests = requests
+        self.expect = expect
+        self.warmup = warmup
+
+
+def run_scenario(scenario, db, concurrency, warmup):
+    from audit import audit_log
+
+    for i in range(min(warmup, scenario.requests) if scenario.warmup else 0):
+        scenario.run(-1 - i)
+    audit_log.flush()
+    before = dict(db.stats)
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            status = scenario.run(i)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"{scenario.name} request {i} failed: {e}")
+            status = None
+        return time.perf_counter() - start, status
+
+    wall_start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, range(scenario.requests)))
+    else:
+        results = [timed(i) for i in range(scenario.requests)]
+    wall = time.perf_counter() - wall_start
+
+    # Deferred audit writes belong to the requests that caused them
+    audit_log.flush()
+    after = dict(db.stats)
+
+    latencies = sorted(elapsed * 1000 for elapsed, _ in results)
+    count = len(results)
+    return {
+        'requests': count,
+        'errors': sum(1 for _, status in results if status not in scenario.expect),
+        'throughput_rps': round(count / wall, 2) if wall else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(sum(latencies) / count, 3),
+            'max': round(latencies[-1], 3),
+        },
+        'reads_per_request': round((after['reads'] - before['reads']) / count, 2),
+        'writes_per_request': round((after['writes'] - before['writes']) / count, 2),
+        'queries_per_request': round((after['queries'] - before['queries']) / count, 2),
+    }
+
+
+# --- Scenarios ---
+def logged_in_client(app, email):
+    client = app.test_client()
+    response = client.post('/auth/login', data={'email': email, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in {email} for the benchmark")
+    return client
+
+
+def bulk_upload_csv(batch, rows):
+    lines = ['name,email,roll_number,branch,section,academic_year,gender,religion']
+    for row in range(rows):
+        roll = f"BU{batch:04d}{row:03d}"
+        lines.append(f"Bulk Student {row},{roll.lower()}@hitam.org,{roll},CSE,A,2024,Male,Hindu")
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+def build_scenarios(app, dataset, args):
+    from pass_escalation import sweep_stale_passes
+    from student.jumma_scheduler import generate_automatic_jumma_passes
+
+    rng = random.Random(args.seed)
+    n = args.requests
+    pool_size = max(1, args.concurrency)
+
+    def pick(ids, count):
+        return [rng.choice(ids) for _ in range(count)]
+
+    students = list(dataset['students'])
+    faculty_with_queues = [uid for uid, f in dataset['faculty'].items() if f['assigned_student_roles']]
+    pending = [pid for pid, p in dataset['passes'].items() if p['status'] == 'pending']
+    rng.shuffle(pending)
+
+    student_clients = [logged_in_client(app, dataset['students'][uid]['email']) for uid in pick(students, pool_size)]
+    faculty_clients = [logged_in_client(app, dataset['faculty'][uid]['email'])
+                       for uid in pick(faculty_with_queues, pool_size)]
+    admin_clients = [logged_in_client(app, 'admin@hitam.org') for _ in range(pool_size)]
+    login_emails = [dataset['students'][uid]['email'] for uid in pick(students, n + args.warmup)]
+
+    def client_for(clients, i):
+        return clients[i % len(clients)]
+
+    def login(i):
+        return app.test_client().post('/auth/login', data={'email': login_emails[i], 'password': PASSWORD}).status_code
+
+    def get(clients, path):
+        return lambda i: client_for(clients, i).get(path).status_code
+
+    def process_pass(i):
+        return client_for(faculty_clients, i).post(f"/faculty/process_pass/{pending[i]}/approved").status_code
+
+    def bulk_upload(i):
+        data = {'file': (bulk_upload_csv(i + args.warmup, args.bulk_rows), 'students.csv')}
+        return client_for(admin_clients, i).post(
+            '/admin/bulk-upload/students', data=data, content_type='multipart/form-data').status_code
+
+    def jumma(i):
+        result = generate_automatic_jumma_passes()
+        return 200 if result.get('status') == 'success' else 500
+
+    def escalation_sweep(i):
+        result = sweep_stale_passes()
+        print(f"  sweep moved {result.get('moved')} of {result.get('overdue')} overdue passes, "
+              f"stage timings {result.get('timings_ms')}", file=sys.stderr)
+        return 200 if result.get('status') == 'success' else 500
+
+    heavy = args.heavy_requests
+    return [
+        Scenario('auth.login', login, n, expect=(302,)),
+        Scenario('student.dashboard', get(student_clients, '/student/dashboard'), n),
+        Scenario('student.gate_pass', get(student_clients, '/student/gate-pass'), n),
+        Scenario('student.pass_history', get(student_clients, '/student/pass-history'), n),
+        Scenario('faculty.dashboard', get(faculty_clients, '/faculty/dashboard'), n),
+        Scenario('faculty.personal_passes', get(faculty_clients, '/faculty/personal-passes'), n),
+        Scenario('faculty.process_pass', process_pass, min(n, len(pending) - args.warmup), expect=(302,)),
+        Scenario('admin.index', get(admin_clients, '/admin/'), n),
+        Scenario('admin.manage_students', get(admin_clients, '/admin/manage-students'), heavy),
+        Scenario('admin.pass_overview', get(admin_clients, '/admin/pass-overview'), heavy),
+        Scenario('admin.bulk_upload', bulk_upload, heavy, expect=(302,)),
+        # A warm-up run would issue today's passes and leave only the skip path to measure
+        Scenario('student.generate_automatic_jumma_passes', jumma, args.jumma_runs, warmup=False),
+        # Overdue pending passes are escalated once; later sweeps would find nothing left to move
+        Scenario('pass_escalation_sweep', escalation_sweep, 1, warmup=False),
+    ]
+
+
+# --- Reporting ---
+def git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def print_comparison(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    print(f"{'scenario':42} {'p95 ms':>18} {'reads/req':>16} {'writes/req':>14}")
+    for name, result in report['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old:
+            print(f"{name:42} {'(new)':>18}")
+            continue
+        p95 = f"{old['latency_ms']['p95']:.1f} -> {result['latency_ms']['p95']:.1f}"
+        reads = f"{old['reads_per_request']:g} -> {result['reads_per_request']:g}"
+        writes = f"{old['writes_per_request']:g} -> {result['writes_per_request']:g}"
+        print(f"{name:42} {p95:>18} {reads:>16} {writes:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the dataset size (default 1.0)')
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--faculty', type=int, default=300)
+    parser.add_argument('--passes', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per light scenario')
+    parser.add_argument('--heavy-requests', type=int, default=5,
+                        help='requests for the full-collection admin pages and bulk upload')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--bulk-rows', type=int, default=25, help='rows per bulk upload file')
+    parser.add_argument('--jumma-runs', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated storage round-trip time')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='run only these scenarios')
+    parser.add_argument('--output', help='result file (default benchmarks/results/routes-<commit>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='earlier result file to compare against')
+    args = parser.parse_args()
+
+    os.environ['MEMORY_STORE_LATENCY_MS'] = str(args.latency_ms)
+    from app import create_app
+    from db import get_db
+
+    app = create_app()
+    # Route handlers log every row and pass at INFO; keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+
+    sizes = {
+        'students': int(args.students * args.scale),
+        'faculty': int(args.faculty * args.scale) or 1,
+        'passes': int(args.passes * args.scale),
+    }
+    seed_start = time.perf_counter()
+    dataset = build_dataset(seed=args.seed, **sizes)
+    seed_backend(dataset)
+    db = get_db()
+    print(f"Seeded {sizes} in {time.perf_counter() - seed_start:.1f}s", file=sys.stderr)
+
+    scenarios = build_scenarios(app, dataset, args)
+    if args.only:
+        scenarios = [s for s in scenarios if s.name in args.only]
+
+    commit, dirty = git_revision()
+    report = {
+        'benchmark': 'routes',
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': {**sizes, 'seed': args.seed},
+        'settings': {'concurrency': args.concurrency, 'latency_ms': args.latency_ms, 'warmup': args.warmup},
+        'scenarios': {},
+    }
+    for scenario in scenarios:
+        print(f"Running {scenario.name} ({scenario.requests} requests)...", file=sys.stderr)
+        report['scenarios'][scenario.name] = run_scenario(scenario, db, args.concurrency, args.warmup)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"routes-{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report['scenarios'], indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+    if args.compare:
+        print_comparison(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Session Payload Benchmark
+Measures the session cookie size a logged-in student sends on every request and the
+per-request cost of opening that session, for the cookie backend versus the
+server-side memory and SQLite backends.
+
+Usage:
+    python -m benchmarks.session_payload --iterations 5000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from flask import Flask, session
+from flask.sessions import SecureCookieSessionInterface
+
+from session_store import (MemorySessionStore, ServerSideSessionInterface,
+                           SQLiteSessionStore)
+
+
+def sample_student_session():
+    """A logged-in student's session as auth.login builds it."""
+    return {
+        'user_id': 'Xk3v9QmT2bYc8LpR4sWn7eHd1aZ2',
+        'user_role': 'student',
+        'is_main_admin': False,
+        'user_info': {
+            'name': 'Mohammed Arif Hussain',
+            'email': '22e51a0501@hitam.org',
+            'roll_number': '22E51A0501',
+            'branch': 'CSE',
+            'section': 'A',
+            'academic_year': 2022,
+            'pass_out_year': 2026,
+            'gender': 'Male',
+            'religion': 'Muslim',
+            'phone': '+91 98480 22338',
+            'image_url': 'https://storage.googleapis.com/hitam-digital-pass.appspot.com/students/'
+                         'Xk3v9QmT2bYc8LpR4sWn7eHd1aZ2/profile-photo-2024-07-15.jpg',
+            'parents': [
+                {'name': 'Abdul Rahman Hussain', 'email': 'rahman.hussain@example.com', 'phone': '+91 98480 11223'},
+                {'name': 'Ayesha Begum', 'email': 'ayesha.begum@example.com', 'phone': '+91 98480 44556'},
+            ],
+            'created_at': datetime(2024, 7, 15, 10, 30),
+            'updated_at': datetime(2025, 1, 8, 9, 5),
+        },
+    }
+
+
+def measure(app, interface, iterations):
+    """Returns the cookie value length and mean microseconds spent in open_session."""
+    app.session_interface = interface
+    with app.test_request_context('/'):
+        session.update(sample_student_session())
+        response = app.response_class()
+        interface.save_session(app, session._get_current_object(), response)
+        cookie_header = response.headers.get('Set-Cookie', '')
+        cookie_value = cookie_header.split(';', 1)[0].split('=', 1)[1]
+
+    cookie = f"{app.config['SESSION_COOKIE_NAME']}={cookie_value}"
+    with app.test_request_context('/', headers={'Cookie': cookie}):
+        from flask import request
+        start = time.perf_counter()
+        for _ in range(iterations):
+            opened = interface.open_session(app, request)
+        elapsed = time.perf_counter() - start
+        assert opened.get('user_id') == 'Xk3v9QmT2bYc8LpR4sWn7eHd1aZ2'
+
+    return {
+        'cookie_bytes': len(cookie),
+        'open_session_us': round(elapsed / iterations * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark-secret'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = {
+            'cookie': measure(app, SecureCookieSessionInterface(), args.iterations),
+            'memory': measure(app, ServerSideSessionInterface(MemorySessionStore()), args.iterations),
+            'sqlite': measure(app, ServerSideSessionInterface(
+                SQLiteSessionStore(os.path.join(tmp, 'sessions.sqlite3'))), args.iterations),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
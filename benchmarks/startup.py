@@ -0,0 +1,121 @@
+"""
+Cold Start Benchmark
+Measures how long a fresh worker process takes to become useful:
+
+- import_ms: `import app` in a new interpreter
+- ttfr_ms: `import app`, create_app() and the first GET /auth/login (time to first response)
+
+Each measurement runs in its own subprocess so module caches never carry over,
+and the median of --runs is reported. With --import-budget-ms / --ttfr-budget-ms
+the script exits non-zero when a median is over budget, so it can gate a CI job.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 9 --import-budget-ms 1200 --ttfr-budget-ms 2500
+    python -m benchmarks.startup --importtime    # per-module import cost (python -X importtime)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import time
+start = time.perf_counter()
+import app
+print(round((time.perf_counter() - start) * 1000, 3))
+"""
+
+TTFR_PROBE = """
+import time
+start = time.perf_counter()
+import app
+flask_app = app.create_app()
+response = flask_app.test_client().get('/auth/login')
+assert response.status_code == 200, response.status_code
+print(round((time.perf_counter() - start) * 1000, 3))
+"""
+
+
+def _probe_env():
+    env = dict(os.environ)
+    env.update({
+        'DB_BACKEND': 'memory',
+        'SESSION_BACKEND': 'memory',
+        'SCHEDULER_BOOTSTRAP': 'off',
+    })
+    env.pop('MEMORY_SEED_PATH', None)
+    return env
+
+
+def run_probe(source):
+    """Runs one probe in a fresh interpreter and returns the milliseconds it printed."""
+    result = subprocess.run(
+        [sys.executable, '-c', source],
+        cwd=PROJECT_ROOT, env=_probe_env(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit=15):
+    """Returns the modules with the highest cumulative import time for `import app`."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=PROJECT_ROOT, env=_probe_env(), capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append({'module': module.strip(), 'cumulative_ms': int(cumulative) / 1000})
+    rows.sort(key=lambda row: -row['cumulative_ms'])
+    return rows[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per measurement (median reported)')
+    parser.add_argument('--import-budget-ms', type=float, help='fail when the median import time exceeds this')
+    parser.add_argument('--ttfr-budget-ms', type=float, help='fail when the median time to first response exceeds this')
+    parser.add_argument('--importtime', action='store_true', help='also report the slowest imports')
+    args = parser.parse_args(argv)
+
+    # Warm the OS file cache and .pyc files so the first run is not an outlier
+    run_probe(IMPORT_PROBE)
+
+    imports = [run_probe(IMPORT_PROBE) for _ in range(args.runs)]
+    ttfrs = [run_probe(TTFR_PROBE) for _ in range(args.runs)]
+    report = {
+        'runs': args.runs,
+        'python': sys.version.split()[0],
+        'import_ms': {'median': statistics.median(imports), 'min': min(imports), 'max': max(imports)},
+        'ttfr_ms': {'median': statistics.median(ttfrs), 'min': min(ttfrs), 'max': max(ttfrs)},
+    }
+    if args.importtime:
+        report['slowest_imports'] = slowest_imports()
+
+    failures = []
+    if args.import_budget_ms is not None and report['import_ms']['median'] > args.import_budget_ms:
+        failures.append(f"import {report['import_ms']['median']}ms > budget {args.import_budget_ms}ms")
+    if args.ttfr_budget_ms is not None and report['ttfr_ms']['median'] > args.ttfr_budget_ms:
+        failures.append(f"time to first response {report['ttfr_ms']['median']}ms > budget {args.ttfr_budget_ms}ms")
+    report['over_budget'] = failures
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,141 @@
 
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import auth, credentials, firestore
 import os
+import threading
+import time
+
+from metrics import instrument
+
+# Storage backend: 'firestore' (default) or 'memory' for offline runs and benchmarks
+DB_BACKEND = os.getenv('DB_BACKEND', 'firestore').lower()
+
+_memory_lock = threading.Lock()
+_memory_db = None
+_memory_auth = None
+
+
+def using_memory_backend():
+    """Returns True when the app runs against the in-memory store instead of Firebase."""
+    return DB_BACKEND == 'memory'
+
+
+def _memory_backend():
+    global _memory_db, _memory_auth
+    with _memory_lock:
+        if _memory_db is None:
+            from memory_store import MemoryFirestore, MemoryAuth, load_seed
+            _memory_db = MemoryFirestore(latency_ms=float(os.getenv('MEMORY_STORE_LATENCY_MS', '0')))
+            _memory_auth = MemoryAuth()
+            seed_path = os.getenv('MEMORY_SEED_PATH')
+            if seed_path:
+                load_seed(_memory_db, _memory_auth, seed_path)
+                print(f"Memory backend seeded from {seed_path}.")
+    return _memory_db, _memory_auth
+
+
+_firebase_lock = threading.Lock()
+_firebase_attempted = False
+_firestore_client = None
+
 
 def init_db():
-    """Initializes the Firebase database connection."""
-    if not firebase_admin._apps:
+    """
+    Initializes the Firebase Admin app, once per process, on first use.
+    Credentials come from FIREBASE_SERVICE_ACCOUNT_KEY_PATH, falling back to
+    firebase-credentials.json next to this file.
+    """
+    global _firebase_attempted
+    if using_memory_backend() or _firebase_attempted:
+        return
+    with _firebase_lock:
+        if _firebase_attempted:
+            return
+        _firebase_attempted = True
+        if firebase_admin._apps:
+            return
         try:
-            cred_path = os.path.join(os.path.dirname(__file__), 'firebase-credentials.json')
+            cred_path = os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_PATH') or \
+                os.path.join(os.path.dirname(__file__), 'firebase-credentials.json')
             if not os.path.exists(cred_path):
                 raise FileNotFoundError("Firebase credentials file not found.")
-            
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-            print("Firebase DB initialized successfully.")
+
+            options = {}
+            if os.getenv('FIREBASE_STORAGE_BUCKET'):
+                options['storageBucket'] = os.getenv('FIREBASE_STORAGE_BUCKET')
+            firebase_admin.initialize_app(credentials.Certificate(cred_path), options or None)
+            print("Firebase Admin SDK initialized successfully.")
         except Exception as e:
-            print(f"Error initializing Firebase: {e}")
+            print(f"CRITICAL: Failed to initialize Firebase Admin SDK: {e}")
+
+
+def get_db():
+    """
+    Returns the document store client every blueprint reads and writes through,
+    instrumented so its reads and writes are charged to the current request.
+    Firebase is initialized on the first call.
+    """
+    global _firestore_client
+    if using_memory_backend():
+        return instrument(_memory_backend()[0])
+    if _firestore_client is None:
+        init_db()
+        _firestore_client = firestore.client()
+    return instrument(_firestore_client)
+
+
+def get_auth():
+    """Returns the user account API: firebase_admin.auth, or its in-memory stand-in."""
+    if using_memory_backend():
+        return _memory_backend()[1]
+    init_db()
+    return auth
+
+
+def get_bucket():
+    """Returns the default Cloud Storage bucket. The storage client is only imported when first needed."""
+    from firebase_admin import storage
+    init_db()
+    return storage.bucket()
+
+
+_settings_lock = threading.Lock()
+_settings_cache = {'value': None, 'loaded_at': 0.0}
+
+
+def get_system_settings():
+    """
+    Returns the settings/system document, cached in-process for SETTINGS_CACHE_TTL
+    seconds (default 30) so the pages that check pass windows skip the read.
+    Returns {} when the document is missing or cannot be read.
+    """
+    ttl = float(os.getenv('SETTINGS_CACHE_TTL', '30'))
+    now = time.monotonic()
+    with _settings_lock:
+        if _settings_cache['value'] is not None and now - _settings_cache['loaded_at'] < ttl:
+            return dict(_settings_cache['value'])
+    try:
+        doc = get_db().collection('settings').document('system').get()
+        settings = doc.to_dict() if doc.exists else {}
+    except Exception as e:
+        print(f"Error fetching system settings: {e}")
+        return {}
+    with _settings_lock:
+        _settings_cache['value'] = settings or {}
+        _settings_cache['loaded_at'] = now
+    return dict(settings or {})
+
+
+def invalidate_system_settings():
+    """Drops the cached settings so this process re-reads them (other workers catch up within the TTL)."""
+    with _settings_lock:
+        _settings_cache['value'] = None
+
 
 def get_user_by_id(user_type, user_id):
     """Fetches a user document from the appropriate collection by its document ID."""
     try:
-        db = firestore.client()
+        db = get_db()
         collection_name = f"{user_type}s"
         doc_ref = db.collection(collection_name).document(user_id)
         doc = doc_ref.get()
@@ -35,7 +150,7 @@ def get_user_by_id(user_type, user_id):
 def add_document(collection_name, data, document_id=None):
     """Adds a new document to a specified collection."""
     try:
-        db = firestore.client()
+        db = get_db()
         if document_id:
             doc_ref = db.collection(collection_name).document(document_id)
         else:
@@ -55,7 +170,7 @@ def add_user(role, user_data):
 def get_user_by_email(role, email):
     """Fetches a user from the appropriate collection by their email address."""
     try:
-        db = firestore.client()
+        db = get_db()
         collection_name = f"{role}s"
         users_ref = db.collection(collection_name)
         query = users_ref.where('email', '==', email).limit(1)
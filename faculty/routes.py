@@ -1,80 +1,154 @@
 
-from flask import Blueprint, render_template, session, redirect, url_for, flash, request
-from firebase_admin import firestore, auth
+from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify, Response
+from db import get_db
+from approval_routing import approval_router, faculty_role_keys, first_pending
+from audit import record_audit
+from notifications import inbox_keys, list_notifications, mark_all_read, unread_count
+from pass_escalation import escalation_deadline
+from pass_events import pass_watcher, sse_stream
+from pass_summaries import get_summary, list_passes, record_status_change
+from pass_tokens import issue_token
+from datetime import datetime, timezone
+from google.api_core.exceptions import FailedPrecondition
+import logging
 
 faculty_bp = Blueprint('faculty', __name__, url_prefix='/faculty', template_folder='templates')
 
 
+# Only the dashboard shows the unread badge; fragments such as the queue tables skip the read
+BADGE_ENDPOINTS = frozenset(('faculty.dashboard',))
+
+
+@faculty_bp.context_processor
+def inject_unread_notifications():
+    """Unread badge for the header: one read of the faculty member's inbox counter."""
+    if 'user_id' not in session or request.endpoint not in BADGE_ENDPOINTS:
+        return {}
+    try:
+        return {'unread_notifications': unread_count(get_db(), session['user_id'])}
+    except Exception:
+        return {'unread_notifications': 0}
+
+
+def _queue_entry(pass_id, pass_data):
+    """Shapes a pass document for the approval queue table."""
+    entry = {**pass_data, 'id': pass_id}
+    entry['applicant_name'] = pass_data.get('applicant_name') or 'N/A'
+    entry['applicant_roll'] = pass_data.get('roll_number') or pass_data.get('faculty_id') or 'N/A'
+    entry['department'] = pass_data.get('department') or 'N/A'
+    entry['academic_year'] = pass_data.get('academic_year') or 'N/A'
+    return entry
+
+
+def _approver_profile():
+    """
+    The faculty member's current document, so approver roles an admin changes apply
+    without logging in again. Served from the approval router's faculty index; one
+    read of faculty/{uid} while that is not loaded; the login profile if both fail.
+    """
+    uid = session['user_id']
+    approval_router.start()
+    profile = approval_router.faculty_profile(uid)
+    if profile is None:
+        try:
+            doc = get_db().collection('faculty').document(uid).get()
+            profile = doc.to_dict() if doc.exists else None
+        except Exception as e:
+            logging.warning(f"Could not read faculty profile {uid}: {e}")
+    return profile or session.get('user_info') or {}
+
+
+def _pending_queues(user):
+    """
+    Returns {queue_name: [passes]} for the faculty member's approver roles.
+    Served from the shared pending-pass index; falls back to Firestore queries
+    only if the listener is unavailable.
+    """
+    queues = {}
+    queue_roles = faculty_role_keys(user)
+    if pass_watcher.wait_ready():
+        for queue_name, role_ids in queue_roles.items():
+            queues[queue_name] = [
+                _queue_entry(p['id'], p) for p in pass_watcher.pending_for_approvers(role_ids)
+            ]
+        return queues
+
+    db = get_db()
+    for queue_name, role_ids in queue_roles.items():
+        queues[queue_name] = []
+        if not role_ids:
+            continue
+        passes_ref = db.collection('passes').where('current_approver', 'in', role_ids).where('status', '==', 'pending').stream()
+        queues[queue_name] = [_queue_entry(p.id, p.to_dict()) for p in passes_ref]
+    return queues
+
+
 @faculty_bp.route('/dashboard', endpoint='dashboard')
 def dashboard():
     if 'user_id' not in session:
         flash('Please log in to access your dashboard.', 'danger')
         return redirect(url_for('auth.login'))
 
-    db = firestore.client()
-    user_uid = session['user_id']
-
+    # Approver roles come from the approval router's faculty index, so opening the
+    # dashboard normally needs no Firestore reads; personal passes load separately.
+    user = _approver_profile()
     try:
-        user_ref = db.collection('faculty').document(user_uid)
-        user_doc = user_ref.get()
-        if not user_doc.exists:
-            flash('Could not find your user profile.', 'danger')
-            return redirect(url_for('auth.logout'))
-        user = user_doc.to_dict()
-
-        # Fetch passes this faculty member needs to approve
-        assigned_student_roles = user.get('assigned_student_roles', [])
-        assigned_faculty_roles = user.get('assigned_faculty_roles', [])
-        assigned_head_roles = user.get('assigned_head_roles', [])
-
-        pending_passes = {
-            'student': [],
-            'faculty': [],
-            'head': []
-        }
-
-        def fetch_passes(role_ids, pass_type):
-            if not role_ids:
-                return
-            passes_ref = db.collection('passes').where('current_approver', 'in', role_ids).where('status', '==', 'pending').stream()
-            for p in passes_ref:
-                pass_data = p.to_dict()
-                pass_data['id'] = p.id
-
-                # Get applicant details
-                applicant_ref = db.collection('students').document(pass_data['applicant_id']).get()
-                if not applicant_ref.exists:
-                    applicant_ref = db.collection('faculty').document(pass_data['applicant_id']).get()
-                
-                if applicant_ref.exists:
-                    applicant_data = applicant_ref.to_dict()
-                    pass_data['applicant_name'] = applicant_data.get('name', 'N/A')
-                    pass_data['applicant_roll'] = applicant_data.get('roll_number', 'N/A')
-                    pass_data['department'] = applicant_data.get('branch', applicant_data.get('department', 'N/A'))
-                    pass_data['academic_year'] = applicant_data.get('academic_year', 'N/A')
-                else:
-                    pass_data['applicant_name'] = 'N/A'
-                    pass_data['applicant_roll'] = 'N/A'
-                    pass_data['department'] = 'N/A'
-                    pass_data['academic_year'] = 'N/A'
-
-                pending_passes[pass_type].append(pass_data)
-
-        fetch_passes(assigned_student_roles, 'student')
-        fetch_passes(assigned_faculty_roles, 'faculty')
-        fetch_passes(assigned_head_roles, 'head')
-
-        # Fetch personal passes
-        personal_passes_ref = db.collection('passes').where('applicant_id', '==', user_uid).stream()
-        personal_passes = [p.to_dict() for p in personal_passes_ref]
-
+        pending_passes = _pending_queues(user)
     except Exception as e:
         flash(f"An error occurred: {e}", "danger")
         pending_passes = {'student': [], 'faculty': [], 'head': []}
-        personal_passes = []
-        user = {}
 
-    return render_template('faculty/dashboard.html', user=user, pending_passes=pending_passes, personal_passes=personal_passes)
+    return render_template('faculty/dashboard.html', user=user, pending_passes=pending_passes)
+
+
+@faculty_bp.route('/queue', endpoint='queue')
+def approval_queue():
+    """Re-rendered approval queue tables, fetched by the dashboard when its live stream reports a change."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    pending_passes = _pending_queues(_approver_profile())
+    return jsonify({
+        queue_name: render_template('faculty/_pass_table.html', passes=passes)
+        for queue_name, passes in pending_passes.items()
+    })
+
+
+@faculty_bp.route('/queue-events', endpoint='queue_events')
+def queue_events():
+    """Server-Sent Events stream that fires whenever one of the faculty member's approval queues changes."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    role_ids = [role_id for keys in faculty_role_keys(_approver_profile()).values() for role_id in keys]
+    subscription = pass_watcher.subscribe_approvers(role_ids)
+    stream = sse_stream(subscription, lambda: pass_watcher.unsubscribe_approvers(role_ids, subscription),
+                        event_name='queue_changed')
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@faculty_bp.route('/personal-passes', endpoint='personal_passes')
+def personal_passes():
+    """
+    One page of the faculty member's own pass requests, loaded after the dashboard
+    renders. The first page also shows the counts from their summary document.
+    """
+    if 'user_id' not in session:
+        return '', 401
+
+    db = get_db()
+    cursor = request.args.get('cursor')
+    summary = {}
+    try:
+        if not cursor:
+            summary = get_summary(db, session['user_id'])
+        passes, next_cursor = list_passes(db, session['user_id'], cursor=cursor)
+    except Exception as e:
+        logging.error(f"Error fetching personal passes: {e}")
+        passes, next_cursor = [], None
+    template = 'faculty/_personal_pass_rows.html' if cursor else 'faculty/_personal_passes.html'
+    return render_template(template, summary=summary, personal_passes=passes, next_cursor=next_cursor)
 
 
 @faculty_bp.route('/process_pass/<pass_id>/<action>', methods=['POST'], endpoint='process_pass')
@@ -82,7 +156,11 @@ def process_pass(pass_id, action):
     if 'user_id' not in session:
         return redirect(url_for('auth.login'))
 
-    db = firestore.client()
+    if action not in ('approved', 'rejected'):
+        flash('Invalid action.', 'danger')
+        return redirect(url_for('faculty.dashboard'))
+
+    db = get_db()
     user_uid = session['user_id']
     pass_ref = db.collection('passes').document(pass_id)
 
@@ -93,6 +171,9 @@ def process_pass(pass_id, action):
             return redirect(url_for('faculty.dashboard'))
 
         pass_data = pass_doc.to_dict()
+        if pass_data.get('status') != 'pending':
+            flash(f"This pass has already been {(pass_data.get('status') or 'processed').replace('_', ' ')}.", 'warning')
+            return redirect(url_for('faculty.dashboard'))
         current_approver_role = pass_data.get('current_approver')
         approvals = pass_data.get('approvals', [])
 
@@ -110,35 +191,81 @@ def process_pass(pass_id, action):
         # Update the current approval status
         approvals[current_approval_index]['status'] = action # 'approved' or 'rejected'
         approvals[current_approval_index]['approved_by'] = user_uid
-        approvals[current_approval_index]['timestamp'] = firestore.SERVER_TIMESTAMP
+        # Transforms such as SERVER_TIMESTAMP are not allowed inside arrays
+        approvals[current_approval_index]['timestamp'] = datetime.now(timezone.utc)
 
+        # The pass and its applicant's summary are written together, and only if the
+        # pass is unchanged since it was read (e.g. not escalated by the sweep meanwhile)
+        batch = db.batch()
+        unchanged = db.write_option(last_update_time=pass_doc.update_time)
         if action == 'rejected':
             # If rejected at any stage, the whole pass is rejected
-            pass_ref.update({
+            batch.update(pass_ref, {
                 'status': 'rejected',
-                'approvals': approvals
-            })
+                'approvals': approvals,
+                'current_approver': None,
+                'escalate_at': None
+            }, option=unchanged)
+            record_status_change(batch, db, pass_id, pass_data, 'rejected')
+            batch.commit()
+            record_audit('pass_rejected', pass_id=pass_id, approver_role=current_approver_role)
             flash('Pass has been rejected.', 'success')
         
         elif action == 'approved':
-            # If this is the last approver, the pass is approved
-            if current_approval_index == len(approvals) - 1:
-                pass_ref.update({
+            # Steps auto-approved at submission (absent approvers) are skipped
+            next_index = first_pending(approvals, current_approval_index + 1)
+            if next_index is None:
+                batch.update(pass_ref, {
                     'status': 'approved',
                     'approvals': approvals,
-                    'current_approver': None
-                })
+                    'current_approver': None,
+                    'escalate_at': None,
+                    'gate_token': issue_token(pass_id, pass_data)
+                }, option=unchanged)
+                record_status_change(batch, db, pass_id, pass_data, 'approved')
+                batch.commit()
+                record_audit('pass_approved', pass_id=pass_id, approver_role=current_approver_role, final=True)
                 flash('Pass has been fully approved!', 'success')
             else:
                 # Move to the next approver
-                next_approver_role = approvals[current_approval_index + 1]['role']
-                pass_ref.update({
+                next_approver_role = approvals[next_index]['role']
+                batch.update(pass_ref, {
                     'approvals': approvals,
-                    'current_approver': next_approver_role
-                })
+                    'current_approver': next_approver_role,
+                    'escalate_at': escalation_deadline(next_approver_role)
+                }, option=unchanged)
+                batch.commit()
+                record_audit('pass_approved', pass_id=pass_id, approver_role=current_approver_role,
+                             next_approver=next_approver_role, final=False)
                 flash('Pass approved and moved to the next stage.', 'success')
 
+    except FailedPrecondition:
+        flash('This pass was changed while you were reviewing it. Please check it again.', 'warning')
     except Exception as e:
         flash(f'An error occurred while processing the pass: {e}', 'danger')
 
     return redirect(url_for('faculty.dashboard'))
+
+
+@faculty_bp.route('/notifications', endpoint='notifications')
+def notifications():
+    if 'user_id' not in session:
+        flash('Please log in to view your notifications.', 'danger')
+        return redirect(url_for('auth.login'))
+
+    db = get_db()
+    user_uid = session['user_id']
+    user_info = session.get('user_info', {})
+    cursor = request.args.get('cursor')
+    next_cursor = None
+
+    try:
+        keys = inbox_keys(user_uid, 'faculty', user_info.get('department'))
+        notifications, next_cursor = list_notifications(db, keys, cursor=cursor)
+        if not cursor:
+            mark_all_read(db, user_uid)
+    except Exception as e:
+        flash(f"An error occurred: {e}", "danger")
+        notifications = []
+
+    return render_template('faculty/notifications.html', notifications=notifications, next_cursor=next_cursor)
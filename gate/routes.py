@@ -0,0 +1,196 @@
+from flask import Blueprint, render_template, session, redirect, url_for, request, flash, jsonify, abort
+from datetime import datetime, timezone
+import hmac
+import os
+
+from gate_events import DIRECTIONS, gate_event_log
+from pass_revocations import revocation_index, verify_scan
+
+gate_bp = Blueprint('gate', __name__, url_prefix='/gate', template_folder='templates')
+
+
+# Logged-in users who may run the scanner page
+STAFF_ROLES = ('admin', 'faculty')
+# Token problems that still let a return be recorded: the student is back either way
+RETURN_ACCEPTS = (None, 'expired', 'revoked')
+# Most scans accepted by one batch verification call
+BATCH_LIMIT = int(os.getenv('GATE_BATCH_LIMIT', '1000'))
+
+
+def _check_gate_key(required=False):
+    """
+    Scanner devices send GATE_API_KEY as `Authorization: Bearer <key>` or `X-Gate-Key`;
+    staff using the scanner page are let through by their session. Verification is open
+    while no key is configured, but endpoints that record scans (`required`) never are.
+    """
+    if session.get('user_role') in STAFF_ROLES:
+        return
+    key = os.getenv('GATE_API_KEY')
+    if not key:
+        if required:
+            abort(403)
+        return
+    supplied = request.headers.get('X-Gate-Key') or request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(supplied.encode('utf-8'), key.encode('utf-8')):
+        abort(403)
+
+
+def _revocations_unavailable():
+    """503 while the revocation list is not loaded: without it a revoked pass would scan as valid."""
+    response = jsonify({'error': 'The revocation list is not loaded yet; retry shortly.',
+                        'valid': False, 'reason': 'revocations_unavailable', 'revocations_unavailable': True})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat() if epoch else None
+
+
+def _scan_time(value, now):
+    """Scan time sent by an offline scanner (epoch seconds or ISO 8601), never later than now."""
+    try:
+        if isinstance(value, (int, float)):
+            scanned_at = datetime.fromtimestamp(value, timezone.utc)
+        elif value:
+            scanned_at = datetime.fromisoformat(value)
+            if scanned_at.tzinfo is None:
+                scanned_at = scanned_at.replace(tzinfo=timezone.utc)
+        else:
+            return now
+    except (TypeError, ValueError, OverflowError, OSError):
+        return now
+    return min(scanned_at, now)
+
+
+def _result(claims, reason):
+    result = {'valid': reason is None, 'reason': reason}
+    if claims:
+        result.update({
+            'pass_id': claims.get('p'),
+            'applicant_id': claims.get('a'),
+            'pass_type': claims.get('t'),
+            'valid_from': _iso(claims.get('nbf')),
+            'valid_until': _iso(claims.get('exp')),
+        })
+    return result
+
+
+@gate_bp.route('/', methods=['GET'])
+def scanner():
+    """Minimal scanner page: a QR reader in keyboard mode types the token into the field."""
+    if session.get('user_role') not in STAFF_ROLES:
+        flash('Please log in as staff to use the gate scanner.', 'warning')
+        return redirect(url_for('auth.login'))
+    return render_template('gate/scanner.html')
+
+
+@gate_bp.route('/verify', methods=['GET', 'POST'])
+def verify():
+    """Verifies a pass token from its signature, validity window and the in-memory revocation list; no database read."""
+    _check_gate_key()
+    payload = request.get_json(silent=True) or {}
+    token = payload.get('token') or request.form.get('token') or request.args.get('token', '')
+    if not revocation_index.wait_ready():
+        return _revocations_unavailable()
+    return jsonify(_result(*verify_scan(token)))
+
+
+@gate_bp.route('/verify-batch', methods=['POST'])
+def verify_batch():
+    """
+    Verifies a burst of scans from a scanner coming back online. Body:
+    {"scans": ["<token>" | {"token": "<token>", "scanned_at": <epoch or ISO 8601>}, ...]}
+    Each scan is judged as of its scan time. Results come back in the same order,
+    with the current revocation version so the scanner knows to refresh its list.
+    """
+    _check_gate_key()
+    scans = (request.get_json(silent=True) or {}).get('scans')
+    if not isinstance(scans, list):
+        return jsonify({'error': 'Expected a JSON body with a "scans" list.'}), 400
+    if len(scans) > BATCH_LIMIT:
+        return jsonify({'error': f'At most {BATCH_LIMIT} scans per call.'}), 413
+
+    if not revocation_index.wait_ready():
+        return _revocations_unavailable()
+    now = datetime.now(timezone.utc)
+    results = []
+    counts = {'valid': 0, 'invalid': 0}
+    for scan in scans:
+        if isinstance(scan, dict):
+            claims, reason = verify_scan(scan.get('token'), _scan_time(scan.get('scanned_at'), now))
+        else:
+            claims, reason = verify_scan(scan, now)
+        counts['valid' if reason is None else 'invalid'] += 1
+        results.append(_result(claims, reason))
+    return jsonify({'results': results, 'counts': counts, 'revocation_version': revocation_index.version})
+
+
+@gate_bp.route('/revocations', methods=['GET'])
+def revocations():
+    """
+    Revoked pass IDs as a sorted array. Without `since`, every revocation still in force;
+    with `?since=<version>`, only those added after it (plus a small overlap).
+    """
+    _check_gate_key()
+    since = request.args.get('since', type=int)
+    if not revocation_index.wait_ready():
+        return _revocations_unavailable()
+    return jsonify(revocation_index.snapshot(since))
+
+
+@gate_bp.route('/events', methods=['POST'])
+def ingest_events():
+    """
+    Records exits and returns. Body:
+    {"events": [{"token": "<token>", "direction": "out" | "in", "scanned_at": <epoch or ISO 8601>, "gate": "main"}, ...]}
+    An exit needs a pass valid at scan time; a return only needs a genuine token.
+    Events are buffered and written to the passes in batches. 202 when accepted,
+    with "backpressure": true once the buffer is filling up; 503 when it is full.
+    Needs the gate key or a staff session, since a recorded return clears a late return.
+    """
+    _check_gate_key(required=True)
+    events = (request.get_json(silent=True) or {}).get('events')
+    if not isinstance(events, list):
+        return jsonify({'error': 'Expected a JSON body with an "events" list.'}), 400
+    if len(events) > BATCH_LIMIT:
+        return jsonify({'error': f'At most {BATCH_LIMIT} events per call.'}), 413
+
+    if not revocation_index.wait_ready():
+        return _revocations_unavailable()
+    now = datetime.now(timezone.utc)
+    results, accepted = [], []
+    for event in events:
+        event = event if isinstance(event, dict) else {}
+        direction = event.get('direction')
+        scanned_at = _scan_time(event.get('scanned_at'), now)
+        claims, reason = verify_scan(event.get('token'), scanned_at)
+        if direction not in DIRECTIONS:
+            reason = 'bad_direction'
+        elif direction == 'in' and claims and reason in RETURN_ACCEPTS:
+            reason = None
+        if reason is None:
+            accepted.append({'p': claims.get('p'), 'a': claims.get('a'), 'd': direction,
+                             'at': scanned_at.timestamp(), 'g': event.get('gate'), 'r': claims.get('r')})
+        results.append({**_result(claims, reason), 'direction': direction})
+
+    if accepted:
+        outcome = gate_event_log.append(accepted)
+    else:
+        status = gate_event_log.summary()
+        outcome = {'accepted': 0, 'backlog': status['backlog'], 'backpressure': status['backpressure'], 'refused': False}
+    body = {'results': results, **outcome}
+    if outcome['refused']:
+        response = jsonify(body)
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, int(gate_event_log.flush_interval * 5)))
+        return response
+    return jsonify(body), 202
+
+
+@gate_bp.route('/events/status', methods=['GET'])
+def events_status():
+    """Buffer depth, flush counters and late-return counts of this process's gate event log."""
+    _check_gate_key()
+    return jsonify(gate_event_log.summary())
@@ -0,0 +1,407 @@
+"""
+Gate In/Out Event Ingestion
+Records when a student actually leaves (`actual_out`) and returns (`actual_in`)
+without one Firestore write per scan.
+
+Scans are appended to a write-ahead file, one JSON line per event, and
+acknowledged as soon as the line is written. A background flusher drains the file
+into batched Firestore writes, coalescing repeated scans of the same pass:
+the first exit and the last return win. After each committed batch the flusher
+checkpoints its byte offset in `<wal>.offset`, so events written before a crash
+are replayed on restart rather than lost; the file is truncated once fully drained.
+
+Backpressure: once GATE_EVENT_HIGH_WATER events wait to be flushed, responses
+ask scanners to slow down; past GATE_EVENT_MAX_BACKLOG new events are refused
+until the flusher catches up.
+
+Exits are deduplicated against the stored pass, not this process's memory: the
+flusher reads the passes it is about to stamp out and writes with a
+last-update-time precondition, so a repeated exit scan ingested by another worker
+(or before a restart) never re-stamps `actual_out`.
+
+Late returns are detected on the ingested stream. Tokens for passes with an
+`in_time` carry the expected return ('r' claim); a return scanned more than
+GATE_LATE_GRACE_MINUTES after it marks the pass `late_return`. An exit also stores
+`return_due_at` (expected return plus grace), which the return clears. Every
+GATE_OVERDUE_CHECK_SECONDS the flusher queries passes whose `return_due_at` has
+passed and marks them `overdue_return`, guarded by the same precondition, so a
+return recorded by any worker in the meantime wins.
+
+Each process holds an exclusive lock on the WAL it ingests into (GATE_EVENT_WAL,
+default instance/gate_events.wal). Other workers on the host take the next free
+numbered file (gate_events.1.wal, gate_events.2.wal, ...), so no two processes
+ever replay or truncate the same file. After a restart, each worker claims a free
+file and replays what it holds.
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+from google.api_core.exceptions import FailedPrecondition, NotFound
+
+from audit import record_audit
+from db import get_db
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS = ('out', 'in')
+# Firestore rejects write batches larger than this
+FIRESTORE_BATCH_LIMIT = 500
+# Most WAL files (one per worker) tried before giving up
+MAX_WAL_SLOTS = 64
+# Re-reads of a pass changed by another writer before its update is given up
+MAX_CONFLICT_RETRIES = 5
+
+
+def _default_wal_path():
+    return os.getenv('GATE_EVENT_WAL',
+                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'gate_events.wal'))
+
+
+def _slot_path(path, slot):
+    """gate_events.wal -> gate_events.<slot>.wal (slot 0 is the path itself)."""
+    if not slot:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{slot}{ext}"
+
+
+def _stamp(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc)
+
+
+def _reconcile_exit(stored, fields):
+    """
+    Drops the parts of a scan's update the stored pass already has: an exit already
+    stamped keeps its first `actual_out`, and a pass already back gets no return deadline.
+    """
+    fields = dict(fields)
+    if stored.get('actual_out') and 'actual_out' in fields:
+        for field in ('actual_out', 'out_gate', 'return_due_at'):
+            fields.pop(field, None)
+    if stored.get('actual_in') and isinstance(fields.get('return_due_at'), datetime):
+        del fields['return_due_at']
+    return fields
+
+
+def _update_passes(db, updates, reconcile=None):
+    """
+    Applies [(pass_id, fields, update_time)] in batches; `update_time`, when not None,
+    requires the pass to be unchanged since it was read. A batch that fails because a
+    pass was deleted or archived since it was scanned, or changed meanwhile, is applied
+    pass by pass: missing passes are skipped, never recreated, and changed ones are
+    re-read and their fields recomputed with reconcile(stored, fields), or skipped when
+    there is no `reconcile`. Returns (IDs of the passes written, number missing).
+    """
+    written, missing = [], 0
+    for i in range(0, len(updates), FIRESTORE_BATCH_LIMIT):
+        chunk = updates[i:i + FIRESTORE_BATCH_LIMIT]
+        batch = db.batch()
+        for pass_id, fields, update_time in chunk:
+            option = db.write_option(last_update_time=update_time) if update_time is not None else None
+            batch.update(db.collection('passes').document(pass_id), fields, option=option)
+        try:
+            batch.commit()
+            written += [pass_id for pass_id, _, _ in chunk]
+            continue
+        except (FailedPrecondition, NotFound):
+            pass
+        for pass_id, fields, update_time in chunk:
+            ref = db.collection('passes').document(pass_id)
+            for _ in range(MAX_CONFLICT_RETRIES):
+                try:
+                    option = db.write_option(last_update_time=update_time) if update_time is not None else None
+                    ref.update(fields, option=option)
+                    written.append(pass_id)
+                    break
+                except NotFound:
+                    missing += 1
+                    logger.info(f"Gate event for pass {pass_id} dropped: the pass no longer exists")
+                    break
+                except FailedPrecondition:
+                    if reconcile is None:
+                        break
+                    snapshot = ref.get()
+                    if not snapshot.exists:
+                        missing += 1
+                        break
+                    fields, update_time = reconcile(snapshot.to_dict(), fields), snapshot.update_time
+                    if not fields:
+                        break
+            else:
+                logger.warning(f"Gate event for pass {pass_id} dropped: the pass kept changing")
+    return written, missing
+
+
+class GateEventLog:
+    """Write-ahead buffer of gate scans, drained into Firestore by one background thread."""
+
+    def __init__(self, path=None, flush_interval=1.0, batch_size=FIRESTORE_BATCH_LIMIT,
+                 high_water=5000, max_backlog=50000, late_grace_minutes=10, overdue_check_seconds=60,
+                 compact_bytes=1 << 20, fsync=False):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.high_water = high_water
+        self.max_backlog = max_backlog
+        self.late_grace = late_grace_minutes * 60
+        self.overdue_check_seconds = overdue_check_seconds
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self._file = None
+        self._pending = []          # (event, end offset in the WAL), oldest first
+        self._next_overdue_check = 0.0
+        self._stats = {'appended': 0, 'flushed': 0, 'writes': 0, 'late_returns': 0, 'overdue_returns': 0,
+                       'refused': 0, 'flush_errors': 0, 'missing_passes': 0, 'last_flush_ms': None}
+
+    # --- Public API ---
+    def append(self, events):
+        """
+        Durably buffers events ({'p', 'a', 'd', 'at', 'g', 'r'}). Returns
+        {'accepted', 'backlog', 'backpressure', 'refused'}; nothing is buffered when refused.
+        """
+        self._open()
+        with self._lock:
+            backlog = len(self._pending)
+            if backlog + len(events) > self.max_backlog:
+                self._stats['refused'] += len(events)
+                return {'accepted': 0, 'backlog': backlog, 'backpressure': True, 'refused': True}
+            position = self._file.tell()
+            encoded = []
+            for event in events:
+                line = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+                position += len(line)
+                encoded.append(line)
+                self._pending.append((event, position))
+            self._file.write(b''.join(encoded))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._stats['appended'] += len(events)
+            backlog = len(self._pending)
+        if backlog >= self.batch_size:
+            self._wake.set()
+        return {'accepted': len(events), 'backlog': backlog, 'backpressure': backlog >= self.high_water,
+                'refused': False}
+
+    def recover(self):
+        """Claims this process's WAL and, if it holds unflushed events from a previous run, starts draining them."""
+        self._open()
+        if self._pending:
+            self._wake.set()
+
+    def summary(self):
+        with self._lock:
+            return {**self._stats, 'backlog': len(self._pending), 'high_water': self.high_water,
+                    'max_backlog': self.max_backlog, 'backpressure': len(self._pending) >= self.high_water}
+
+    def stop(self, timeout=10):
+        """Flushes what is buffered and stops the flusher."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    # --- WAL ---
+    def _offset_path(self):
+        return self.path + '.offset'
+
+    def _open(self):
+        if self._file is not None and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._file is None:
+                self._claim(self.path or _default_wal_path())
+                self._replay()
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='gate-event-flusher', daemon=True)
+                self._thread.start()
+
+    def _claim(self, base):
+        """Opens and locks the first WAL file no other process holds. Caller holds the lock."""
+        os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+        for slot in range(MAX_WAL_SLOTS):
+            path = _slot_path(base, slot)
+            handle = open(path, 'ab')
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            self.path, self._file = path, handle
+            if slot:
+                logger.info(f"{base} is held by another process; ingesting into {path}")
+            return
+        raise RuntimeError(f"All {MAX_WAL_SLOTS} gate event WAL files next to {base} are in use")
+
+    def _replay(self):
+        """Loads events past the checkpoint into the pending list. Caller holds the lock."""
+        try:
+            with open(self._offset_path(), encoding='utf-8') as f:
+                checkpoint = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            checkpoint = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(checkpoint)
+            good_end = checkpoint
+            for line in iter(f.readline, b''):
+                if not line.endswith(b'\n'):
+                    break  # torn final write: the scan was never acknowledged
+                good_end = f.tell()
+                try:
+                    self._pending.append((json.loads(line), good_end))
+                except ValueError:
+                    logger.warning("Skipping an unreadable gate event in the WAL")
+        if os.path.getsize(self.path) > good_end:
+            os.truncate(self.path, good_end)
+        if self._pending:
+            logger.info(f"Replaying {len(self._pending)} unflushed gate events from {self.path}")
+
+    def _checkpoint(self, offset):
+        temp = self._offset_path() + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            f.write(str(offset))
+        os.replace(temp, self._offset_path())
+
+    def _compact(self):
+        """Truncates a fully drained WAL. Caller holds the lock."""
+        if self._pending or self._file.tell() < self.compact_bytes:
+            return
+        self._file.truncate(0)
+        self._file.seek(0)
+        self._checkpoint(0)
+
+    # --- Flusher ---
+    def _run(self):
+        failures = 0
+        while True:
+            self._wake.wait(self.flush_interval * (2 ** min(failures, 5)))
+            self._wake.clear()
+            stopping = self._stopping
+            try:
+                while self._flush_once():
+                    pass
+                self._flag_overdue()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+                logger.error(f"Gate event flush failed (attempt {failures}), will retry: {e}")
+                if stopping:
+                    return
+            if stopping:
+                return
+
+    def _flush_once(self):
+        """Writes up to one batch of coalesced events. Returns True if a full batch was taken."""
+        with self._lock:
+            taken = self._pending[:self.batch_size]
+        if not taken:
+            return False
+
+        started = time.perf_counter()
+        updates = {}
+        late = []
+        for event, _ in taken:
+            pass_id, at = event.get('p'), event.get('at')
+            if not pass_id or event.get('d') not in DIRECTIONS or not isinstance(at, (int, float)):
+                continue
+            fields = updates.setdefault(pass_id, {})
+            if event['d'] == 'out':
+                if 'actual_out' in fields:
+                    continue
+                fields['actual_out'] = _stamp(at)
+                fields['out_gate'] = event.get('g')
+                if event.get('r') and 'actual_in' not in fields:
+                    fields['return_due_at'] = _stamp(event['r'] + self.late_grace)
+            else:
+                fields['actual_in'] = _stamp(at)
+                fields['in_gate'] = event.get('g')
+                fields['return_due_at'] = firestore.DELETE_FIELD
+                return_by = event.get('r')
+                if return_by and at > return_by + self.late_grace:
+                    fields['late_return'] = True
+                    fields['late_by_minutes'] = int((at - return_by) // 60)
+                    late.append((pass_id, event.get('a'), fields['late_by_minutes']))
+
+        # Exits are checked against the stored pass, which any worker may have stamped already
+        db = get_db()
+        update_times = {}
+        exits = [pass_id for pass_id, fields in updates.items() if 'actual_out' in fields]
+        if exits:
+            for snapshot in db.get_all([db.collection('passes').document(pass_id) for pass_id in exits]):
+                if snapshot.exists:
+                    updates[snapshot.id] = _reconcile_exit(snapshot.to_dict(), updates[snapshot.id])
+                    update_times[snapshot.id] = snapshot.update_time
+        updates = [(pass_id, fields, update_times.get(pass_id)) for pass_id, fields in updates.items() if fields]
+
+        written, missing = _update_passes(db, updates, reconcile=_reconcile_exit)
+        for pass_id, applicant_id, minutes in late:
+            record_audit('late_return', actor_id='system', pass_id=pass_id, applicant_id=applicant_id,
+                         late_by_minutes=minutes)
+
+        with self._lock:
+            del self._pending[:len(taken)]
+            self._checkpoint(taken[-1][1])
+            self._compact()
+            self._stats['flushed'] += len(taken)
+            self._stats['writes'] += len(written)
+            self._stats['missing_passes'] += missing
+            self._stats['late_returns'] += len(late)
+            self._stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return len(taken) == self.batch_size
+
+    def _flag_overdue(self):
+        """Marks passes whose `return_due_at` has passed with no return recorded, at most every overdue_check_seconds."""
+        now = time.time()
+        if now < self._next_overdue_check:
+            return
+        self._next_overdue_check = now + self.overdue_check_seconds
+        db = get_db()
+        due = db.collection('passes').where('return_due_at', '<=', _stamp(now)) \
+            .limit(FIRESTORE_BATCH_LIMIT).stream()
+        updates = []
+        for doc in due:
+            fields = {'return_due_at': firestore.DELETE_FIELD}
+            if not (doc.to_dict() or {}).get('actual_in'):
+                fields['overdue_return'] = True
+            # A return written since the query fails the precondition and is left alone
+            updates.append((doc.id, fields, doc.update_time))
+        if not updates:
+            return
+        written = set(_update_passes(db, updates)[0])
+        overdue = [pass_id for pass_id, fields, _ in updates if pass_id in written and 'overdue_return' in fields]
+        if not overdue:
+            return
+        with self._lock:
+            self._stats['overdue_returns'] += len(overdue)
+        record_audit('overdue_returns', actor_id='system', count=len(overdue), pass_ids=overdue[:50])
+        logger.warning(f"{len(overdue)} students are past their expected return time")
+
+
+gate_event_log = GateEventLog(
+    flush_interval=float(os.getenv('GATE_EVENT_FLUSH_SECONDS', '1')),
+    high_water=int(os.getenv('GATE_EVENT_HIGH_WATER', '5000')),
+    max_backlog=int(os.getenv('GATE_EVENT_MAX_BACKLOG', '50000')),
+    late_grace_minutes=int(os.getenv('GATE_LATE_GRACE_MINUTES', '10')),
+    overdue_check_seconds=float(os.getenv('GATE_OVERDUE_CHECK_SECONDS', '60')),
+    fsync=os.getenv('GATE_EVENT_FSYNC', '0') in ('1', 'true', 'True'),
+)
+atexit.register(gate_event_log.stop)
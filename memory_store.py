@@ -0,0 +1,853 @@
+"""
+In-Memory Storage Backend
+A thread-safe, process-local stand-in for the parts of the Firestore client and
+Firebase Auth that this app uses, with the same query semantics. Selected with
+DB_BACKEND=memory so the whole app can run and be load-tested without a network.
+
+Supported Firestore surface:
+- collection(), collection_group(), document(), batch(), get_all()
+- set (with merge), create (AlreadyExists when present), update (dotted paths,
+  write_option(last_update_time=...)), delete, add
+- update_time on snapshots; updates of missing documents raise NotFound
+- where (==, !=, <, <=, >, >=, in, not-in, array_contains, array_contains_any),
+  order_by, limit, start_after, select, count, stream/get, on_snapshot
+- SERVER_TIMESTAMP, DELETE_FIELD, Increment, ArrayUnion, ArrayRemove
+
+Operation counters (reads, writes, queries) are kept in `MemoryFirestore.stats`,
+billed the way Firestore bills: one read per document returned, and at least one per query.
+"""
+
+import copy
+import json
+import logging
+import queue
+import secrets
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import requests
+from firebase_admin import auth
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType
+
+logger = logging.getLogger(__name__)
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+_MISSING = object()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _normalise(value):
+    """Stores datetimes as timezone-aware UTC, the way Firestore returns them."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {k: _normalise(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalise(v) for v in value]
+    return value
+
+
+def _reject_nested_sentinels(value):
+    """The Firestore client cannot encode transforms inside arrays; neither do we."""
+    if isinstance(value, (transforms.Sentinel, transforms._ValueList, transforms._NumericValue)):
+        raise TypeError('Cannot convert to a Firestore Value', value, 'Invalid type', type(value))
+    if isinstance(value, dict):
+        for v in value.values():
+            _reject_nested_sentinels(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _reject_nested_sentinels(v)
+
+
+def _get_path(data, path):
+    current = data
+    for part in path.split('.'):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+
+def _apply_transforms(data, updates, dotted):
+    """Applies field updates (with sentinels) to `data` in place."""
+    for key, value in updates.items():
+        parts = key.split('.') if dotted else [key]
+        target = data
+        for part in parts[:-1]:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        field = parts[-1]
+
+        if value is transforms.DELETE_FIELD:
+            target.pop(field, None)
+        elif value is transforms.SERVER_TIMESTAMP:
+            target[field] = _now()
+        elif isinstance(value, transforms.Increment):
+            current = target.get(field)
+            target[field] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, transforms.ArrayUnion):
+            current = list(target.get(field) or [])
+            current += [v for v in _normalise(list(value.values)) if v not in current]
+            target[field] = current
+        elif isinstance(value, transforms.ArrayRemove):
+            removed = _normalise(list(value.values))
+            target[field] = [v for v in (target.get(field) or []) if v not in removed]
+        elif isinstance(value, dict) and not dotted:
+            nested = target.get(field) if isinstance(target.get(field), dict) else {}
+            target[field] = nested
+            _apply_transforms(nested, value, dotted=False)
+        else:
+            if isinstance(value, (list, tuple)):
+                _reject_nested_sentinels(value)
+            target[field] = copy.deepcopy(_normalise(value))
+
+
+def _merge(existing, updates):
+    """Firestore set(..., merge=True): nested maps merge, everything else replaces."""
+    data = copy.deepcopy(existing)
+    _apply_transforms(data, updates, dotted=False)
+    return data
+
+
+def _replace(updates):
+    """Plain set(): the document is rebuilt from scratch."""
+    data = {}
+    _apply_transforms(data, updates, dotted=False)
+    return data
+
+
+def _comparable(a, b):
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool)
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return True
+    return type(a) is type(b) or (isinstance(a, datetime) and isinstance(b, datetime))
+
+
+def _matches(value, op, expected):
+    if value is _MISSING:
+        return False
+    expected = _normalise(expected)
+    if op == '==':
+        return value == expected
+    if op == '!=':
+        return value is not None and value != expected
+    if op in ('<', '<=', '>', '>='):
+        if value is None or not _comparable(value, expected):
+            return False
+        return {'<': value < expected, '<=': value <= expected,
+                '>': value > expected, '>=': value >= expected}[op]
+    if op == 'in':
+        return value in expected
+    if op == 'not-in':
+        return value is not None and value not in expected
+    if op == 'array_contains':
+        return isinstance(value, list) and expected in value
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(v in value for v in expected)
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def _index_key(value):
+    """Hashable key for equality indexes; keeps 1, 1.0 and True apart the way Firestore does."""
+    if value is _MISSING:
+        return None
+    key = _SortKey(value)
+    try:
+        hash(key.value)
+        return (key.rank, key.value)
+    except TypeError:
+        return (key.rank, repr(value))
+
+
+class _SortKey:
+    """Orders mixed values the way Firestore orders types: null < bool < number < time < string < other."""
+
+    __slots__ = ('rank', 'value')
+
+    def __init__(self, value):
+        if value is None:
+            self.rank, self.value = 0, 0
+        elif isinstance(value, bool):
+            self.rank, self.value = 1, value
+        elif isinstance(value, (int, float)):
+            self.rank, self.value = 2, value
+        elif isinstance(value, datetime):
+            self.rank, self.value = 3, value
+        elif isinstance(value, str):
+            self.rank, self.value = 4, value
+        else:
+            self.rank, self.value = 5, repr(value)
+
+    def __lt__(self, other):
+        if self.rank != other.rank:
+            return self.rank < other.rank
+        return self.value < other.value
+
+    def __eq__(self, other):
+        return self.rank == other.rank and self.value == other.value
+
+
+class MemorySnapshot:
+    def __init__(self, reference, data, read_time=None, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.read_time = read_time
+        self.create_time = None
+        self.update_time = update_time if data is not None else None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        value = _get_path(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, collection_path, doc_id):
+        self._client = client
+        self.id = doc_id
+        self._collection_path = collection_path
+        self.path = f"{collection_path}/{doc_id}"
+
+    @property
+    def parent(self):
+        return MemoryCollectionReference(self._client, self._collection_path)
+
+    def collection(self, name):
+        return MemoryCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._get(self)
+
+    def set(self, document_data, merge=False):
+        self._client._write([('set', self, document_data, merge)])
+
+    def create(self, document_data):
+        self._client._write([('create', self, document_data, None)])
+
+    def update(self, field_updates, option=None):
+        self._client._write([('update', self, field_updates, option)])
+
+    def delete(self):
+        self._client._write([('delete', self, None, None)])
+
+    def on_snapshot(self, callback):
+        return self._client._watch(_DocumentTarget(self), callback)
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class MemoryQuery:
+    def __init__(self, client, collection_path, group=False, filters=(), orders=(), limit=None,
+                 cursor=None, projection=None):
+        self._client = client
+        self._collection_path = collection_path
+        self._group = group
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy(self, **changes):
+        values = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      cursor=self._cursor, projection=self._projection)
+        values.update(changes)
+        return MemoryQuery(self._client, self._collection_path, self._group, **values)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        direction = DESCENDING if str(direction).upper().endswith('DESCENDING') else ASCENDING
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def count(self, alias=None):
+        return _CountQuery(self, alias or 'count')
+
+    def stream(self, transaction=None):
+        return iter(self._client._run_query(self))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._watch(_QueryTarget(self), callback)
+
+    # --- Evaluation helpers used by the client ---
+    def _matches_path(self, path):
+        collection_path = path.rsplit('/', 1)[0]
+        if self._group:
+            return collection_path.rsplit('/', 1)[-1] == self._collection_path
+        return collection_path == self._collection_path
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if not _matches(_get_path(data, field), op, value):
+                return False
+        for field, _ in self._orders:
+            if _get_path(data, field) is _MISSING:
+                return False
+        return True
+
+    def _sort(self, items):
+        """Sorts (path, doc_id, data) tuples by the query ordering, then document ID."""
+        keys = list(self._orders) + [('__name__', self._orders[-1][1] if self._orders else ASCENDING)]
+        for field, direction in reversed(keys):
+            items.sort(
+                key=lambda item: _SortKey(item[1] if field == '__name__' else _get_path(item[2], field)),
+                reverse=(direction == DESCENDING),
+            )
+        return items
+
+    def _after_cursor(self, items):
+        if self._cursor is None:
+            return items
+        if isinstance(self._cursor, MemorySnapshot):
+            cursor_id, cursor_data = self._cursor.id, self._cursor._data or {}
+        else:
+            cursor_id, cursor_data = None, self._cursor
+        keys = list(self._orders) + ([('__name__', self._orders[-1][1] if self._orders else ASCENDING)]
+                                     if cursor_id is not None else [])
+
+        def cursor_value(field):
+            return cursor_id if field == '__name__' else _get_path(cursor_data, field)
+
+        def is_after(item):
+            for field, direction in keys:
+                a = _SortKey(item[1] if field == '__name__' else _get_path(item[2], field))
+                b = _SortKey(cursor_value(field))
+                if a == b:
+                    continue
+                return (b < a) if direction == ASCENDING else (a < b)
+            return False
+
+        return [item for item in items if is_after(item)]
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+        self.id = path.rsplit('/', 1)[-1]
+        self._path = path
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, self._path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return _now(), ref
+
+    def list_documents(self):
+        return [MemoryDocumentReference(self._client, self._path, doc_id)
+                for doc_id in self._client._document_ids(self._path)]
+
+
+AggregationResult = namedtuple('AggregationResult', ['alias', 'value', 'read_time'])
+
+
+class _CountQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self, transaction=None):
+        count = self._query._client._count(self._query)
+        return [[AggregationResult(self._alias, count, _now())]]
+
+
+LastUpdateOption = namedtuple('LastUpdateOption', ['last_update_time'])
+
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(('set', reference, document_data, merge))
+        return self
+
+    def create(self, reference, document_data):
+        self._ops.append(('create', reference, document_data, None))
+        return self
+
+    def update(self, reference, field_updates, option=None):
+        self._ops.append(('update', reference, field_updates, option))
+        return self
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, None))
+        return self
+
+    def commit(self):
+        if len(self._ops) > 500:
+            raise ValueError("A write batch can contain at most 500 operations.")
+        self._client._write(self._ops)
+        self._ops = []
+        return []
+
+    def __len__(self):
+        return len(self._ops)
+
+
+DocumentChange = namedtuple('DocumentChange', ['type', 'document', 'old_index', 'new_index'])
+
+
+class _QueryTarget:
+    def __init__(self, query):
+        self.query = query
+
+    def contains(self, path, data):
+        return data is not None and self.query._matches_path(path) and self.query._matches(data)
+
+
+class _DocumentTarget:
+    def __init__(self, reference):
+        self.reference = reference
+
+    def contains(self, path, data):
+        return data is not None and path == self.reference.path
+
+
+class _Watch:
+    def __init__(self, client, target, callback):
+        self._client = client
+        self.target = target
+        self.callback = callback
+        self.members = set()
+
+    def unsubscribe(self):
+        self._client._unwatch(self)
+
+    close = unsubscribe
+
+
+class MemoryFirestore:
+    """
+    Thread-safe in-memory document store exposing the Firestore client API used by the app.
+
+    Documents are kept per collection, and equality filters are served from
+    per-field hash indexes built on first use, much like Firestore's automatic
+    single-field indexes. `latency_ms` adds a sleep to every round trip (get,
+    get_all, query, commit) to model network time. Snapshot listeners are called
+    on a background thread, like the Firestore client's watch thread.
+    """
+
+    def __init__(self, latency_ms=0):
+        self._lock = threading.RLock()
+        self._collections = {}
+        self._indexes = {}
+        self._update_times = {}
+        self._last_write_time = _now()
+        self._watches = []
+        self._events = queue.Queue()
+        self._dispatcher = None
+        self.latency = latency_ms / 1000
+        self.stats = {'reads': 0, 'writes': 0, 'queries': 0}
+
+    # --- Client API ---
+    def collection(self, collection_path):
+        return MemoryCollectionReference(self, collection_path)
+
+    def collection_group(self, collection_id):
+        return MemoryQuery(self, collection_id, group=True)
+
+    def document(self, document_path):
+        collection_path, doc_id = document_path.rsplit('/', 1)
+        return MemoryDocumentReference(self, collection_path, doc_id)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    @staticmethod
+    def write_option(last_update_time=None):
+        """Precondition for update(): the document must still have this update time."""
+        return LastUpdateOption(last_update_time)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self._round_trip()
+        with self._lock:
+            self.stats['queries'] += 1
+        for reference in references:
+            yield self._get(reference, round_trip=False)
+
+    def reset(self):
+        with self._lock:
+            self._collections.clear()
+            self._indexes.clear()
+            self._update_times.clear()
+            self.stats = {'reads': 0, 'writes': 0, 'queries': 0}
+
+    def bulk_load(self, collection_path, documents):
+        """
+        Loads {doc_id: data} straight into a collection, bypassing write batches,
+        listeners and counters. Meant for seeding large datasets.
+        """
+        with self._lock:
+            docs = self._collections.setdefault(collection_path, {})
+            loaded_at = _now()
+            for doc_id, data in documents.items():
+                docs[doc_id] = _replace(data)
+                self._update_times[f"{collection_path}/{doc_id}"] = loaded_at
+            for (path, field), index in list(self._indexes.items()):
+                if path == collection_path:
+                    del self._indexes[(path, field)]
+
+    def document_count(self, collection_path):
+        with self._lock:
+            return len(self._collections.get(collection_path, ()))
+
+    # --- Internals ---
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _document_ids(self, collection_path):
+        with self._lock:
+            return list(self._collections.get(collection_path, ()))
+
+    def _get(self, reference, round_trip=True):
+        if round_trip:
+            self._round_trip()
+        collection_path, doc_id = reference.path.rsplit('/', 1)
+        with self._lock:
+            data = self._collections.get(collection_path, {}).get(doc_id)
+            self.stats['reads'] += 1
+            return MemorySnapshot(reference, copy.deepcopy(data), _now(), self._update_times.get(reference.path))
+
+    def _index(self, collection_path, field):
+        """Returns {index key: set(doc_ids)} for a field, building it on first use. Caller holds the lock."""
+        index = self._indexes.get((collection_path, field))
+        if index is None:
+            index = {}
+            for doc_id, data in self._collections.get(collection_path, {}).items():
+                key = _index_key(_get_path(data, field))
+                if key is not None:
+                    index.setdefault(key, set()).add(doc_id)
+            self._indexes[(collection_path, field)] = index
+        return index
+
+    def _reindex(self, collection_path, doc_id, old, new):
+        """Keeps built indexes in step with a write. Caller holds the lock."""
+        for (path, field), index in self._indexes.items():
+            if path != collection_path:
+                continue
+            old_key = _index_key(_get_path(old, field)) if old is not None else None
+            new_key = _index_key(_get_path(new, field)) if new is not None else None
+            if old_key == new_key:
+                continue
+            if old_key is not None and old_key in index:
+                index[old_key].discard(doc_id)
+                if not index[old_key]:
+                    del index[old_key]
+            if new_key is not None:
+                index.setdefault(new_key, set()).add(doc_id)
+
+    def _collection_paths(self, query):
+        if not query._group:
+            return [query._collection_path]
+        return [path for path in self._collections if path.rsplit('/', 1)[-1] == query._collection_path]
+
+    def _candidates(self, query):
+        equality = [(field, op, value) for field, op, value in query._filters if op in ('==', 'in')]
+        with self._lock:
+            items = []
+            for collection_path in self._collection_paths(query):
+                docs = self._collections.get(collection_path, {})
+                doc_ids = None
+                for field, op, value in equality:
+                    index = self._index(collection_path, field)
+                    values = [value] if op == '==' else list(value)
+                    ids = set()
+                    for v in values:
+                        ids |= index.get(_index_key(_normalise(v)), set())
+                    doc_ids = ids if doc_ids is None else doc_ids & ids
+                pairs = docs.items() if doc_ids is None else ((i, docs[i]) for i in doc_ids)
+                items.extend(
+                    (f"{collection_path}/{doc_id}", doc_id, data)
+                    for doc_id, data in pairs if query._matches(data)
+                )
+            return items
+
+    def _run_query(self, query):
+        self._round_trip()
+        items = query._sort(self._candidates(query))
+        items = query._after_cursor(items)
+        if query._limit is not None:
+            items = items[:query._limit]
+        with self._lock:
+            self.stats['queries'] += 1
+            self.stats['reads'] += max(1, len(items))
+
+        results = []
+        for path, doc_id, data in items:
+            collection_path = path.rsplit('/', 1)[0]
+            reference = MemoryDocumentReference(self, collection_path, doc_id)
+            if query._projection is not None:
+                data = {field: _get_path(data, field) for field in query._projection
+                        if _get_path(data, field) is not _MISSING}
+            results.append(MemorySnapshot(reference, copy.deepcopy(data), _now(), self._update_times.get(path)))
+        return results
+
+    def _count(self, query):
+        self._round_trip()
+        candidates = self._candidates(query)
+        if query._cursor is not None:
+            candidates = query._after_cursor(query._sort(candidates))
+        count = len(candidates)
+        if query._limit is not None:
+            count = min(count, query._limit)
+        with self._lock:
+            self.stats['queries'] += 1
+            # Firestore bills one read per 1000 index entries counted
+            self.stats['reads'] += max(1, (count + 999) // 1000)
+        return count
+
+    def _write(self, ops):
+        self._round_trip()
+        changed = []
+        with self._lock:
+            staged = {}
+            for kind, reference, data, merge_or_option in ops:
+                path = reference.path
+                collection_path, doc_id = path.rsplit('/', 1)
+                existing = staged[path] if path in staged else self._collections.get(collection_path, {}).get(doc_id)
+                if kind == 'set':
+                    new = _merge(existing or {}, data) if merge_or_option else _replace(data)
+                elif kind == 'create':
+                    if existing is not None:
+                        raise AlreadyExists(f"Document already exists: {path}")
+                    new = _replace(data)
+                elif kind == 'update':
+                    if existing is None:
+                        raise NotFound(f"No document to update: {path}")
+                    option = merge_or_option
+                    if option is not None and self._update_times.get(path) != option.last_update_time:
+                        raise FailedPrecondition(f"The document {path} was changed since it was read")
+                    new = copy.deepcopy(existing)
+                    _apply_transforms(new, data, dotted=True)
+                else:
+                    new = None
+                staged[path] = new
+
+            # Strictly increasing, so a write_option never matches a later write
+            written_at = max(_now(), self._last_write_time + timedelta(microseconds=1))
+            self._last_write_time = written_at
+            for path, new in staged.items():
+                collection_path, doc_id = path.rsplit('/', 1)
+                docs = self._collections.setdefault(collection_path, {})
+                old = docs.get(doc_id)
+                if new is None:
+                    docs.pop(doc_id, None)
+                    self._update_times.pop(path, None)
+                else:
+                    docs[doc_id] = new
+                    self._update_times[path] = written_at
+                self._reindex(collection_path, doc_id, old, new)
+                changed.append((path, old, new))
+            self.stats['writes'] += len(ops)
+            watches = list(self._watches)
+
+        self._notify(watches, changed)
+
+    # --- Listeners ---
+    def _watch(self, target, callback):
+        watch = _Watch(self, target, callback)
+        with self._lock:
+            initial = [
+                (f"{collection_path}/{doc_id}", data)
+                for collection_path, docs in self._collections.items()
+                for doc_id, data in docs.items()
+                if target.contains(f"{collection_path}/{doc_id}", data)
+            ]
+            watch.members = {path for path, _ in initial}
+            self._watches.append(watch)
+            self.stats['reads'] += max(1, len(initial))
+        changes = [DocumentChange(ChangeType.ADDED, self._snapshot(path, data), -1, i)
+                   for i, (path, data) in enumerate(initial)]
+        self._dispatch(watch, changes)
+        return watch
+
+    def _unwatch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _snapshot(self, path, data):
+        collection_path, doc_id = path.rsplit('/', 1)
+        return MemorySnapshot(MemoryDocumentReference(self, collection_path, doc_id), copy.deepcopy(data), _now(),
+                              self._update_times.get(path))
+
+    def _notify(self, watches, changed):
+        for watch in watches:
+            changes = []
+            for path, old, new in changed:
+                was_member = path in watch.members
+                is_member = watch.target.contains(path, new)
+                if is_member:
+                    watch.members.add(path)
+                    kind = ChangeType.MODIFIED if was_member else ChangeType.ADDED
+                    changes.append(DocumentChange(kind, self._snapshot(path, new), -1, -1))
+                elif was_member:
+                    watch.members.discard(path)
+                    changes.append(DocumentChange(ChangeType.REMOVED, self._snapshot(path, old), -1, -1))
+            if changes:
+                with self._lock:
+                    self.stats['reads'] += len(changes)
+                self._dispatch(watch, changes)
+
+    def _dispatch(self, watch, changes):
+        """Queues a snapshot for delivery on the listener thread, as the Firestore client does."""
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._deliver, name='memory-store-listeners', daemon=True)
+                self._dispatcher.start()
+        self._events.put((watch, changes))
+
+    def _deliver(self):
+        while True:
+            watch, changes = self._events.get()
+            if watch not in self._watches:
+                continue
+            try:
+                watch.callback([change.document for change in changes], changes, _now())
+            except Exception as e:
+                logger.error(f"Snapshot listener failed: {e}")
+
+
+class MemoryUser:
+    def __init__(self, uid, email, display_name=None, custom_claims=None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+        self.custom_claims = custom_claims or {}
+        self.disabled = False
+
+
+class MemoryAuth:
+    """In-memory stand-in for firebase_admin.auth and Identity Toolkit email/password sign-in."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+        self._by_email = {}
+        self._passwords = {}
+        self._tokens = {}
+
+    def create_user(self, email=None, password=None, display_name=None, uid=None, **kwargs):
+        with self._lock:
+            if email in self._by_email:
+                raise auth.EmailAlreadyExistsError(f"The user with the provided email already exists ({email}).", None, None)
+            uid = uid or uuid.uuid4().hex[:28]
+            self._users[uid] = MemoryUser(uid, email, display_name)
+            self._by_email[email] = uid
+            self._passwords[uid] = password
+            return self._users[uid]
+
+    def get_user(self, uid):
+        with self._lock:
+            if uid not in self._users:
+                raise auth.UserNotFoundError(f"No user record found for the provided user ID: {uid}.")
+            return self._users[uid]
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            uid = self._by_email.get(email)
+            if uid is not None:
+                return self._users[uid]
+        raise auth.UserNotFoundError(f"No user record found for the provided email: {email}.")
+
+    def update_user(self, uid, **kwargs):
+        user = self.get_user(uid)
+        with self._lock:
+            if 'email' in kwargs:
+                self._by_email.pop(user.email, None)
+                user.email = kwargs['email']
+                self._by_email[user.email] = uid
+            if 'display_name' in kwargs:
+                user.display_name = kwargs['display_name']
+            if 'password' in kwargs:
+                self._passwords[uid] = kwargs['password']
+            if 'custom_claims' in kwargs:
+                user.custom_claims = kwargs['custom_claims'] or {}
+        return user
+
+    def delete_user(self, uid):
+        with self._lock:
+            if uid not in self._users:
+                raise auth.UserNotFoundError(f"No user record found for the provided user ID: {uid}.")
+            self._by_email.pop(self._users.pop(uid).email, None)
+            self._passwords.pop(uid, None)
+
+    def set_custom_user_claims(self, uid, custom_claims):
+        self.update_user(uid, custom_claims=custom_claims)
+
+    def sign_in_with_password(self, email, password):
+        """Mirrors the Identity Toolkit response; bad credentials raise HTTPError(400)."""
+        with self._lock:
+            uid = self._by_email.get(email)
+            if uid is not None and self._passwords.get(uid) == password:
+                token = secrets.token_urlsafe(24)
+                self._tokens[token] = uid
+                return {'idToken': token, 'localId': uid, 'email': email}
+        response = requests.Response()
+        response.status_code = 400
+        raise requests.exceptions.HTTPError("INVALID_LOGIN_CREDENTIALS", response=response)
+
+    def verify_id_token(self, id_token, check_revoked=False):
+        with self._lock:
+            uid = self._tokens.get(id_token)
+            user = self._users.get(uid)
+        if user is None:
+            raise auth.InvalidIdTokenError("Invalid ID token.")
+        return {'uid': uid, 'email': user.email, **user.custom_claims}
+
+
+def load_seed(db, users, path):
+    """
+    Loads a JSON seed file into the memory backend:
+    {"collections": {"students": {"<id>": {...}}}, "users": [{"uid", "email", "password", "claims"}]}
+    """
+    with open(path) as f:
+        seed = json.load(f)
+    for collection, documents in seed.get('collections', {}).items():
+        db.bulk_load(collection, documents)
+    for user in seed.get('users', []):
+        users.create_user(uid=user.get('uid'), email=user['email'], password=user.get('password'),
+                          display_name=user.get('display_name'))
+        if user.get('claims'):
+            users.set_custom_user_claims(user['uid'], user['claims'])
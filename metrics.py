@@ -0,0 +1,467 @@
+"""
+Firestore Accounting and Request Metrics
+Wraps the Firestore client so every document read, write, query and round trip
+is charged to the request (or scheduler job) that made it, and exposes the
+totals and latency histograms in Prometheus text format on /metrics.
+
+Configuration via environment variables:
+- READS_PER_REQUEST_BUDGET: log requests that read more documents than this (default 200, 0 disables)
+- METRICS_TOKEN: if set, /metrics requires `Authorization: Bearer <token>` or `?token=<token>`;
+  if unset, /metrics only answers requests from the local host
+
+Reads are counted the way Firestore bills them: one per document returned,
+at least one per query, and one per 1000 index entries for count() queries.
+"""
+
+import contextvars
+import functools
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, g, request
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+READS_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 50000)
+# Clients allowed to scrape /metrics when METRICS_TOKEN is not set
+LOCAL_ADDRESSES = frozenset(['127.0.0.1', '::1'])
+
+# Query methods that return another query to keep wrapping
+_CHAINABLE = frozenset([
+    'where', 'order_by', 'limit', 'limit_to_last', 'offset', 'select',
+    'start_at', 'start_after', 'end_at', 'end_before',
+])
+
+
+# --- Metric types ---
+def _label_text(labels):
+    if not labels:
+        return ''
+    parts = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels
+    )
+    return '{' + parts + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.label_names), 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(zip(self.label_names, key))} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_label_text(labels + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {total:g}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {count}")
+        return lines
+
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests handled.', ('endpoint', 'method', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'HTTP request latency.', ('endpoint',))
+FIRESTORE_READS = Counter('firestore_reads_total', 'Firestore document reads.', ('endpoint',))
+FIRESTORE_WRITES = Counter('firestore_writes_total', 'Firestore document writes.', ('endpoint',))
+FIRESTORE_QUERIES = Counter('firestore_queries_total', 'Firestore queries and batched gets.', ('endpoint',))
+FIRESTORE_RPC_DURATION = Histogram('firestore_rpc_duration_seconds', 'Firestore round-trip time.',
+                                   ('endpoint', 'operation'))
+READS_PER_REQUEST = Histogram('firestore_reads_per_request', 'Firestore document reads per request or job run.',
+                              ('endpoint',), buckets=READS_BUCKETS)
+READ_BUDGET_EXCEEDED = Counter('firestore_read_budget_exceeded_total',
+                               'Requests that read more documents than READS_PER_REQUEST_BUDGET.', ('endpoint',))
+JOB_RUNS = Counter('job_runs_total', 'Scheduler job runs.', ('job', 'status'))
+JOB_DURATION = Histogram('job_duration_seconds', 'Scheduler job duration.', ('job',),
+                         buckets=LATENCY_BUCKETS + (60, 300))
+
+REGISTRY = [
+    REQUESTS, REQUEST_DURATION, FIRESTORE_READS, FIRESTORE_WRITES, FIRESTORE_QUERIES,
+    FIRESTORE_RPC_DURATION, READS_PER_REQUEST, READ_BUDGET_EXCEEDED, JOB_RUNS, JOB_DURATION,
+]
+
+
+def render_metrics():
+    """Returns every registered metric in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Per-request usage ---
+class Usage:
+    """Firestore work done on behalf of one request or job run."""
+
+    __slots__ = ('label', 'reads', 'writes', 'queries', 'firestore_seconds')
+
+    def __init__(self, label):
+        self.label = label
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.firestore_seconds = 0.0
+
+
+_current_usage = contextvars.ContextVar('firestore_usage', default=None)
+
+
+def current_usage():
+    """Returns the Usage being charged in this context, or None outside requests and jobs."""
+    return _current_usage.get()
+
+
+def _charge(operation, seconds, reads=0, writes=0, queries=0):
+    usage = _current_usage.get()
+    label = usage.label if usage is not None else 'background'
+    if usage is not None:
+        usage.reads += reads
+        usage.writes += writes
+        usage.queries += queries
+        usage.firestore_seconds += seconds
+    if reads:
+        FIRESTORE_READS.inc(reads, endpoint=label)
+    if writes:
+        FIRESTORE_WRITES.inc(writes, endpoint=label)
+    if queries:
+        FIRESTORE_QUERIES.inc(queries, endpoint=label)
+    FIRESTORE_RPC_DURATION.observe(seconds, endpoint=label, operation=operation)
+
+
+# --- Client wrappers ---
+def _unwrap(value):
+    return value._target if isinstance(value, _Proxy) else value
+
+
+class _Proxy:
+    __slots__ = ('_target',)
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+
+class _QueryProxy(_Proxy):
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in _CHAINABLE:
+            @functools.wraps(attr)
+            def chain(*args, **kwargs):
+                return _QueryProxy(attr(*args, **kwargs))
+            return chain
+        return attr
+
+    def document(self, *args, **kwargs):
+        return _DocumentProxy(self._target.document(*args, **kwargs))
+
+    def add(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            update_time, ref = self._target.add(*args, **kwargs)
+        finally:
+            _charge('add', time.perf_counter() - start, writes=1)
+        return update_time, _DocumentProxy(ref)
+
+    def stream(self, *args, **kwargs):
+        elapsed = 0.0
+        returned = 0
+        start = time.perf_counter()
+        iterator = iter(self._target.stream(*args, **kwargs))
+        elapsed += time.perf_counter() - start
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    doc = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    return
+                elapsed += time.perf_counter() - start
+                returned += 1
+                yield doc
+        finally:
+            _charge('query', elapsed, reads=max(1, returned), queries=1)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    def count(self, *args, **kwargs):
+        return _AggregationProxy(self._target.count(*args, **kwargs))
+
+
+class _AggregationProxy(_Proxy):
+    __slots__ = ()
+
+    def get(self, *args, **kwargs):
+        start = time.perf_counter()
+        results = self._target.get(*args, **kwargs)
+        counted = sum(getattr(r, 'value', 0) or 0 for group in results for r in group)
+        _charge('aggregate', time.perf_counter() - start, reads=max(1, (int(counted) + 999) // 1000), queries=1)
+        return results
+
+
+class _DocumentProxy(_Proxy):
+    __slots__ = ()
+
+    def collection(self, *args, **kwargs):
+        return _QueryProxy(self._target.collection(*args, **kwargs))
+
+    def get(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._target.get(*args, **kwargs)
+        finally:
+            _charge('get', time.perf_counter() - start, reads=1)
+
+    def _write(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self._target, method)(*args, **kwargs)
+        finally:
+            _charge(method, time.perf_counter() - start, writes=1)
+
+    def set(self, *args, **kwargs):
+        return self._write('set', *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write('create', *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write('update', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+
+class _BatchProxy(_Proxy):
+    __slots__ = ('_operations',)
+
+    def __init__(self, target):
+        super().__init__(target)
+        self._operations = 0
+
+    def _stage(self, method, reference, *args, **kwargs):
+        getattr(self._target, method)(_unwrap(reference), *args, **kwargs)
+        self._operations += 1
+        return self
+
+    def set(self, reference, *args, **kwargs):
+        return self._stage('set', reference, *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._stage('create', reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._stage('update', reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._stage('delete', reference, *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._target.commit(*args, **kwargs)
+        finally:
+            _charge('commit', time.perf_counter() - start, writes=self._operations)
+            self._operations = 0
+
+
+class InstrumentedClient(_Proxy):
+    """Firestore client wrapper that charges every operation to the current request or job."""
+
+    __slots__ = ()
+
+    def collection(self, *args, **kwargs):
+        return _QueryProxy(self._target.collection(*args, **kwargs))
+
+    def collection_group(self, *args, **kwargs):
+        return _QueryProxy(self._target.collection_group(*args, **kwargs))
+
+    def document(self, *args, **kwargs):
+        return _DocumentProxy(self._target.document(*args, **kwargs))
+
+    def batch(self):
+        return _BatchProxy(self._target.batch())
+
+    def get_all(self, references, *args, **kwargs):
+        elapsed = 0.0
+        returned = 0
+        start = time.perf_counter()
+        iterator = iter(self._target.get_all([_unwrap(r) for r in references], *args, **kwargs))
+        elapsed += time.perf_counter() - start
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    snapshot = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    return
+                elapsed += time.perf_counter() - start
+                returned += 1
+                yield snapshot
+        finally:
+            _charge('get_all', elapsed, reads=returned, queries=1)
+
+
+_instrumented = {}
+_instrumented_lock = threading.Lock()
+
+
+def instrument(client):
+    """Returns the instrumented wrapper for a client, creating it once per client."""
+    wrapper = _instrumented.get(id(client))
+    if wrapper is None or wrapper._target is not client:
+        with _instrumented_lock:
+            wrapper = _instrumented.get(id(client))
+            if wrapper is None or wrapper._target is not client:
+                wrapper = _instrumented[id(client)] = InstrumentedClient(client)
+    return wrapper
+
+
+# --- Requests and jobs ---
+def _read_budget():
+    return int(os.getenv('READS_PER_REQUEST_BUDGET', '200'))
+
+
+def _finish_request(response_status):
+    state = g.pop('_metrics_state', None)
+    if state is None:
+        return
+    usage, token, start = state
+    elapsed = time.perf_counter() - start
+    try:
+        _current_usage.reset(token)
+    except ValueError:
+        _current_usage.set(None)
+
+    endpoint = usage.label
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response_status)
+    REQUEST_DURATION.observe(elapsed, endpoint=endpoint)
+    READS_PER_REQUEST.observe(usage.reads, endpoint=endpoint)
+
+    budget = _read_budget()
+    if budget and usage.reads > budget:
+        READ_BUDGET_EXCEEDED.inc(endpoint=endpoint)
+        logger.warning(
+            f"Read budget exceeded: {request.method} {request.path} ({endpoint}) read {usage.reads} documents "
+            f"(budget {budget}) in {usage.queries} queries, {usage.writes} writes, "
+            f"{usage.firestore_seconds * 1000:.1f} ms in Firestore, {elapsed * 1000:.1f} ms total"
+        )
+
+
+def init_metrics(app):
+    """Starts per-request accounting and registers the /metrics endpoint."""
+
+    @app.before_request
+    def _start_request_metrics():
+        usage = Usage(request.endpoint or 'unmatched')
+        g._metrics_state = (usage, _current_usage.set(usage), time.perf_counter())
+
+    @app.after_request
+    def _record_request_metrics(response):
+        _finish_request(str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def _record_failed_request(exc):
+        # Only reached with state still set when after_request did not run
+        _finish_request('500')
+
+    @app.route('/metrics', endpoint='metrics')
+    def metrics_view():
+        token = os.getenv('METRICS_TOKEN')
+        if token:
+            supplied = request.args.get('token') or request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+                abort(403)
+        elif request.remote_addr not in LOCAL_ADDRESSES:
+            abort(403)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def instrument_job(name, func):
+    """Wraps a scheduler job so its Firestore usage and duration are recorded under `job:<name>`."""
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        usage = Usage(f"job:{name}")
+        token = _current_usage.set(usage)
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = func(*args, **kwargs)
+            if not (isinstance(result, dict) and result.get('status') == 'error'):
+                status = 'success'
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_usage.reset(token)
+            JOB_RUNS.inc(job=name, status=status)
+            JOB_DURATION.observe(elapsed, job=name)
+            READS_PER_REQUEST.observe(usage.reads, endpoint=usage.label)
+            logger.info(
+                f"Job {name} finished ({status}) in {elapsed:.2f}s: {usage.reads} reads, "
+                f"{usage.writes} writes, {usage.queries} queries, {usage.firestore_seconds:.2f}s in Firestore"
+            )
+
+    return run
@@ -0,0 +1,131 @@
+"""
+Notification Delivery and Inboxes
+Notifications are stored once with a `target_key` so each user's inbox is a
+single indexed query, and every recipient has a `notification_inbox/{uid}`
+document whose `unread` counter backs the navbar badge with one read.
+
+Target keys:
+- all, students, faculty
+- department:<branch or department>
+- user:<uid>
+
+The inbox query needs a composite index on notifications (target_key ASC, timestamp DESC).
+"""
+
+from firebase_admin import firestore
+
+PAGE_SIZE = 20
+TARGET_TYPES = ('all', 'students', 'faculty', 'department', 'individual')
+
+# Firestore rejects write batches larger than this
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def target_key(target, value=None):
+    """Returns the stored target key for a target type and optional value."""
+    if target == 'department':
+        return f"department:{value}"
+    if target == 'individual':
+        return f"user:{value}"
+    return target
+
+
+def inbox_keys(user_id, role, department=None):
+    """Returns every target key that reaches the given user."""
+    keys = ['all', f"user:{user_id}"]
+    if role == 'student':
+        keys.append('students')
+    elif role == 'faculty':
+        keys.append('faculty')
+    if department:
+        keys.append(f"department:{department}")
+    return keys
+
+
+def _recipient_ids(db, target, value):
+    """Returns the uids a notification is delivered to (document IDs only)."""
+    def ids(query):
+        return [doc.id for doc in query.select([]).stream()]
+
+    if target == 'individual':
+        return [value]
+    if target == 'department':
+        return ids(db.collection('students').where('branch', '==', value)) + \
+            ids(db.collection('faculty').where('department', '==', value))
+    recipients = []
+    if target in ('all', 'students'):
+        recipients += ids(db.collection('students'))
+    if target in ('all', 'faculty'):
+        recipients += ids(db.collection('faculty'))
+    return recipients
+
+
+def send_notification(db, target, message, value=None, sender_id=None):
+    """
+    Stores a notification and bumps the unread counter of every recipient,
+    using batched writes. Returns the number of recipients.
+    """
+    recipients = _recipient_ids(db, target, value)
+
+    batch = db.batch()
+    batch.set(db.collection('notifications').document(), {
+        'message': message,
+        'target': target,
+        'target_value': value,
+        'target_key': target_key(target, value),
+        'sender_id': sender_id,
+        'timestamp': firestore.SERVER_TIMESTAMP
+    })
+    pending = 1
+    inbox = db.collection('notification_inbox')
+    for uid in recipients:
+        batch.set(inbox.document(uid), {
+            'unread': firestore.Increment(1),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        pending += 1
+        if pending == FIRESTORE_BATCH_LIMIT:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    return len(recipients)
+
+
+def list_notifications(db, keys=None, cursor=None, page_size=PAGE_SIZE):
+    """
+    Returns (notifications, next_cursor) for one page, newest first.
+    `keys` limits the page to those target keys; `cursor` is the ID of the
+    last notification on the previous page.
+    """
+    query = db.collection('notifications')
+    if keys:
+        query = query.where('target_key', 'in', keys)
+    query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+
+    if cursor:
+        cursor_doc = db.collection('notifications').document(cursor).get()
+        if cursor_doc.exists:
+            query = query.start_after(cursor_doc)
+
+    docs = list(query.limit(page_size + 1).stream())
+    notifications = [{**doc.to_dict(), 'id': doc.id} for doc in docs[:page_size]]
+    next_cursor = docs[page_size - 1].id if len(docs) > page_size else None
+    return notifications, next_cursor
+
+
+def unread_count(db, user_id):
+    """Returns the user's unread notification count (one document read)."""
+    doc = db.collection('notification_inbox').document(user_id).get()
+    if not doc.exists:
+        return 0
+    return doc.to_dict().get('unread', 0) or 0
+
+
+def mark_all_read(db, user_id):
+    """Resets the user's unread counter."""
+    db.collection('notification_inbox').document(user_id).set({
+        'unread': 0,
+        'last_read_at': firestore.SERVER_TIMESTAMP
+    }, merge=True)
@@ -0,0 +1,167 @@
+"""
+Hot/Cold Pass Archival
+Closed passes (approved, auto-approved, rejected or revoked) older than
+PASS_ARCHIVE_HORIZON_DAYS (default 180) are moved out of the live `passes`
+collection into per-term archives, so live queries and their indexes only
+cover the recent horizon however many years of history pile up.
+
+Terms are half-years: `2025_1` is January to June 2025, `2025_2` July to December.
+A term's passes live in `pass_archives/{term}/archived_passes`. Every term uses the
+same collection ID, so one composite index definition serves all of them, and
+`collection_group('passes')` scans of the live collection never reach the archive.
+
+Two lightweight pointers keep archived passes reachable:
+- `pass_summaries/{uid}.archived_terms`: the terms holding the applicant's
+  archived passes; the pass history (list_passes) continues into them
+  once the live passes run out.
+- `pass_archives/{term}`: a manifest with the number of passes archived in the term.
+
+Each pass is copied and deleted in the same batch as its pointers. Pending passes
+are never archived. Summary and global counts already include archived passes and
+are left untouched; missing summaries are backfilled before their passes leave.
+
+The job runs nightly (PASS_ARCHIVE_HOUR, default 3) and moves at most
+PASS_ARCHIVE_MAX_PER_RUN passes (default 20000); a larger backlog continues the next night.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+
+from audit import record_audit
+from db import get_db
+from metrics import instrument_job
+from pass_summaries import get_global_stats, get_summaries
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ['approved', 'auto_approved', 'rejected', 'revoked']
+ARCHIVE_COLLECTION = 'archived_passes'
+# Passes read per query; each pass costs two writes plus its applicant and term pointers
+ARCHIVE_PAGE = 200
+# Firestore rejects write batches larger than this
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def term_for(date):
+    """Archive term of a pass date: '<year>_1' (January to June) or '<year>_2' (July to December)."""
+    return f"{date.year}_{1 if date.month <= 6 else 2}"
+
+
+def archive_collection(db, term):
+    return db.collection('pass_archives').document(term).collection(ARCHIVE_COLLECTION)
+
+
+def _horizon_days():
+    return int(os.getenv('PASS_ARCHIVE_HORIZON_DAYS', '180'))
+
+
+def _max_per_run():
+    return int(os.getenv('PASS_ARCHIVE_MAX_PER_RUN', '20000'))
+
+
+def _write_chunk(db, docs, archived_at):
+    """Moves `docs` into their term archives. Returns {term: passes moved}."""
+    batch, operations = db.batch(), 0
+    applicant_terms, term_counts, moved = set(), {}, {}
+
+    def flush():
+        for term, count in term_counts.items():
+            batch.set(db.collection('pass_archives').document(term), {
+                'term': term,
+                'passes': firestore.Increment(count),
+                'last_archived_at': archived_at,
+            }, merge=True)
+        batch.commit()
+
+    for doc in docs:
+        pass_data = doc.to_dict()
+        term = term_for(pass_data['date'])
+        applicant_id = pass_data.get('applicant_id')
+        # Two writes for the pass, maybe one for its applicant's pointer, one per term manifest
+        if operations + 3 + len(term_counts) + 1 > FIRESTORE_BATCH_LIMIT:
+            flush()
+            batch, operations = db.batch(), 0
+            applicant_terms, term_counts = set(), {}
+
+        batch.set(archive_collection(db, term).document(doc.id), {**pass_data, 'archived_at': archived_at})
+        batch.delete(doc.reference)
+        operations += 2
+        if applicant_id and (applicant_id, term) not in applicant_terms:
+            batch.set(db.collection('pass_summaries').document(applicant_id),
+                      {'archived_terms': firestore.ArrayUnion([term])}, merge=True)
+            applicant_terms.add((applicant_id, term))
+            operations += 1
+        term_counts[term] = term_counts.get(term, 0) + 1
+        moved[term] = moved.get(term, 0) + 1
+    if operations:
+        flush()
+    return moved
+
+
+def archive_closed_passes(now=None, horizon_days=None, max_passes=None):
+    """
+    Moves closed passes dated before `now` minus the horizon into their term archives.
+    Returns a summary with the number of passes moved, per term, and how long it took.
+    """
+    now = now or datetime.now(timezone.utc)
+    horizon_days = horizon_days or _horizon_days()
+    max_passes = max_passes or _max_per_run()
+    cutoff = now - timedelta(days=horizon_days)
+    moved, by_term = 0, {}
+    started = time.perf_counter()
+    try:
+        db = get_db()
+        # Global counts are backfilled from the live passes; do it while they are all still there
+        get_global_stats(db)
+        query = db.collection('passes') \
+            .where('status', 'in', CLOSED_STATUSES) \
+            .where('date', '<', cutoff) \
+            .order_by('date')
+        while moved < max_passes:
+            # Archived passes leave the live collection, so every page starts from the top again
+            docs = list(query.limit(min(ARCHIVE_PAGE, max_passes - moved)).stream())
+            if not docs:
+                break
+            get_summaries(db, {doc.to_dict().get('applicant_id') for doc in docs} - {None})
+            for term, count in _write_chunk(db, docs, now).items():
+                by_term[term] = by_term.get(term, 0) + count
+                moved += count
+            if len(docs) < ARCHIVE_PAGE:
+                break
+    except Exception as e:
+        logger.error(f"Pass archival failed after moving {moved} passes: {e}")
+        return {'status': 'error', 'message': str(e), 'moved': moved, 'by_term': by_term}
+
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+    if moved:
+        record_audit('pass_archival', actor_id='system', moved=moved, by_term=by_term, cutoff=cutoff)
+    logger.info(f"Pass archival: moved {moved} passes closed before {cutoff:%Y-%m-%d} "
+                f"({by_term}) in {elapsed_ms} ms")
+    return {'status': 'success', 'moved': moved, 'by_term': by_term, 'cutoff': cutoff.isoformat(),
+            'elapsed_ms': elapsed_ms}
+
+
+def schedule_pass_archival(scheduler, hour=None):
+    """Schedules the archival job nightly at PASS_ARCHIVE_HOUR (default 3) local time."""
+    hour = hour if hour is not None else int(os.getenv('PASS_ARCHIVE_HOUR', '3'))
+    try:
+        scheduler.add_job(
+            func=instrument_job('pass_archival', archive_closed_passes),
+            trigger='cron',
+            hour=hour,
+            minute=15,
+            id='pass_archival',
+            name='Closed Pass Archival',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        logger.info(f"Scheduled pass archival nightly at {hour:02d}:15")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to schedule pass archival: {e}")
+        return False
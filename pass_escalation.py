@@ -0,0 +1,238 @@
+"""
+Escalation of Stale Pending Passes
+Every pending pass carries an `escalate_at` deadline. It is set whenever the pass
+moves to an approver: the approver role's SLA (`roles.sla_minutes`, default
+ESCALATION_SLA_MINUTES = 60), cut short by the end of that day's student pass
+window (`student_pass_end_time`).
+
+A periodic sweep reads the overdue passes with one query,
+status == 'pending' AND escalate_at <= now
+(composite index on passes: status ASC, escalate_at ASC). For each overdue pass:
+
+1. Hand the step to the next fallback role with a present holder, with a fresh deadline.
+2. Otherwise, if `auto_approve_absent_faculty` is on, auto-approve the step and
+   move the pass on (or approve it when no steps remain).
+3. Otherwise stop escalating it (`escalate_at` cleared); it waits for its approver.
+
+Passes created before `escalate_at` existed are not swept.
+
+All transitions are written in batches, together with the summary updates of
+passes that end up approved. Each pass is only updated if it is unchanged since
+the sweep read it, so an approver's decision in the meantime is never overwritten;
+such passes are skipped and counted as `conflicts`. The sweep reports how many
+passes it moved and how long each stage took.
+"""
+
+import copy
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+
+from approval_routing import approval_router, first_pending
+from audit import record_audit
+from db import get_db, get_system_settings
+from metrics import instrument_job
+from pass_summaries import get_summaries, record_global_counts, record_status_change
+from pass_tokens import issue_token
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects write batches larger than this
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def _default_sla_minutes():
+    return int(os.getenv('ESCALATION_SLA_MINUTES', '60'))
+
+
+def _window_end(settings, since):
+    """End of the student pass window on the (local) day of `since`, or None."""
+    end_time_str = (settings or {}).get('student_pass_end_time')
+    if not end_time_str:
+        return None
+    try:
+        end_time = datetime.strptime(end_time_str, '%H:%M').time()
+    except ValueError:
+        return None
+    local_day = since.astimezone().date()
+    return datetime.combine(local_day, end_time).astimezone(timezone.utc)
+
+
+def escalation_deadline(role_key, since=None, settings=None):
+    """Returns when a pass waiting on `role_key` since `since` becomes overdue."""
+    since = since or datetime.now(timezone.utc)
+    if settings is None:
+        settings = get_system_settings()
+    deadline = since + timedelta(minutes=approval_router.sla_minutes(role_key, _default_sla_minutes()))
+    window_end = _window_end(settings, since)
+    if window_end and since < window_end < deadline:
+        deadline = window_end
+    return deadline
+
+
+def _plan_escalation(pass_id, pass_data, now, settings, auto_approve):
+    """Returns (outcome, field updates) for one overdue pass."""
+    approvals = [dict(step) for step in pass_data.get('approvals') or []]
+    index = next((i for i, step in enumerate(approvals)
+                  if step.get('role') == pass_data.get('current_approver') and step.get('status') == 'pending'), None)
+    if index is None:
+        # Approval chain out of step with current_approver; stop re-reading it every sweep
+        return 'skipped', {'escalate_at': None}
+
+    step = approvals[index]
+    tried = list(step.get('escalated_from') or []) + [step['role']]
+    origin = step.get('routed_from') or tried[0]
+    target = approval_router.escalation_target(origin, pass_data.get('department'), tried)
+    if target:
+        approvals[index] = {**step, 'role': target, 'escalated_from': tried, 'escalated_at': now}
+        return 'escalated', {
+            'approvals': approvals,
+            'current_approver': target,
+            'escalate_at': escalation_deadline(target, now, settings),
+        }
+
+    if not auto_approve:
+        return 'exhausted', {'escalate_at': None}
+
+    approvals[index] = {**step, 'status': 'auto_approved', 'reason': 'approval_timeout', 'timestamp': now}
+    next_index = first_pending(approvals, index + 1)
+    if next_index is None:
+        return 'approved', {'approvals': approvals, 'status': 'approved', 'current_approver': None, 'escalate_at': None,
+                            'gate_token': issue_token(pass_id, pass_data, now)}
+    next_role = approvals[next_index]['role']
+    return 'auto_approved', {
+        'approvals': approvals,
+        'current_approver': next_role,
+        'escalate_at': escalation_deadline(next_role, now, settings),
+    }
+
+
+def _commit_transitions(db, transitions, summaries):
+    """
+    Writes (doc, outcome, pass_data, updates) transitions in one batch, each pass guarded by
+    the update time it was read at. Summaries are only kept if the batch commits.
+    """
+    attempt = {applicant_id: copy.deepcopy(summary) for applicant_id, summary in summaries.items()}
+    batch, status_counts = db.batch(), Counter()
+    for doc, _, pass_data, updates in transitions:
+        batch.update(doc.reference, updates, option=db.write_option(last_update_time=doc.update_time))
+        if updates.get('status') and pass_data.get('applicant_id'):
+            record_status_change(batch, db, doc.id, pass_data, updates['status'],
+                                 summary=attempt.get(pass_data['applicant_id']), global_counts=status_counts)
+    record_global_counts(batch, db, status_counts)
+    batch.commit()
+    summaries.update(attempt)
+
+
+def _write_transitions(db, transitions, summaries):
+    """
+    Writes transitions in batches. A batch holding a pass that changed since it was read
+    fails as a whole; its passes are then written one by one and the changed ones skipped.
+    Returns the transitions skipped.
+    """
+    chunks, chunk, operations = [], [], 0
+    for transition in transitions:
+        # An approval also writes the applicant's summary; keep room for the global counts
+        cost = 2 if transition[3].get('status') else 1
+        if chunk and operations + cost + 1 > FIRESTORE_BATCH_LIMIT:
+            chunks.append(chunk)
+            chunk, operations = [], 0
+        chunk.append(transition)
+        operations += cost
+    if chunk:
+        chunks.append(chunk)
+
+    skipped = []
+    for chunk in chunks:
+        try:
+            _commit_transitions(db, chunk, summaries)
+            continue
+        except (FailedPrecondition, NotFound):
+            logger.info("Escalation batch hit a pass changed since the sweep read it; writing passes one by one")
+        for transition in chunk:
+            try:
+                _commit_transitions(db, [transition], summaries)
+            except (FailedPrecondition, NotFound):
+                skipped.append(transition)
+    return skipped
+
+
+def sweep_stale_passes(now=None):
+    """
+    Escalates or auto-approves every pending pass past its deadline.
+    Returns a summary with counts per outcome and per-stage timings in milliseconds.
+    """
+    now = now or datetime.now(timezone.utc)
+    counts = {'overdue': 0, 'escalated': 0, 'auto_approved': 0, 'approved': 0, 'exhausted': 0, 'skipped': 0,
+              'conflicts': 0}
+    timings = {}
+    try:
+        db = get_db()
+        settings = get_system_settings()
+        auto_approve = bool(settings.get('auto_approve_absent_faculty'))
+
+        started = time.perf_counter()
+        overdue = list(db.collection('passes')
+                       .where('status', '==', 'pending')
+                       .where('escalate_at', '<=', now)
+                       .stream())
+        timings['query_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        counts['overdue'] = len(overdue)
+
+        started = time.perf_counter()
+        if overdue and not approval_router.wait_ready():
+            logger.warning("Approval routing index not ready; overdue passes can only be auto-approved")
+        transitions = []
+        for doc in overdue:
+            pass_data = doc.to_dict()
+            outcome, updates = _plan_escalation(doc.id, pass_data, now, settings, auto_approve)
+            counts[outcome] += 1
+            transitions.append((doc, outcome, pass_data, updates))
+        timings['plan_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+        started = time.perf_counter()
+        # Approved passes change their applicants' summaries; read those in one round trip
+        approved_applicants = {pass_data['applicant_id'] for _, _, pass_data, updates in transitions
+                               if updates.get('status') and pass_data.get('applicant_id')}
+        summaries = get_summaries(db, approved_applicants) if approved_applicants else {}
+        for _, outcome, _, _ in _write_transitions(db, transitions, summaries):
+            counts[outcome] -= 1
+            counts['conflicts'] += 1
+        timings['write_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    except Exception as e:
+        logger.error(f"Escalation sweep failed: {e}")
+        return {'status': 'error', 'message': str(e), **counts, 'timings_ms': timings}
+
+    moved = counts['escalated'] + counts['auto_approved'] + counts['approved']
+    if overdue:
+        record_audit('pass_escalation_sweep', actor_id='system', moved=moved, **counts)
+    logger.info(f"Escalation sweep: {counts['overdue']} overdue, {moved} moved "
+                f"({counts['escalated']} escalated, {counts['auto_approved']} steps auto-approved, "
+                f"{counts['approved']} approved), {counts['exhausted']} exhausted, "
+                f"{counts['conflicts']} changed meanwhile; timings {timings}")
+    return {'status': 'success', 'moved': moved, **counts, 'timings_ms': timings}
+
+
+def schedule_escalation_sweep(scheduler, interval_minutes=None):
+    """Schedules the sweep every ESCALATION_SWEEP_MINUTES minutes (default 5)."""
+    interval_minutes = interval_minutes or int(os.getenv('ESCALATION_SWEEP_MINUTES', '5'))
+    try:
+        scheduler.add_job(
+            func=instrument_job('pass_escalation_sweep', sweep_stale_passes),
+            trigger='interval',
+            minutes=interval_minutes,
+            id='pass_escalation_sweep',
+            name='Pending Pass Escalation Sweep',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        logger.info(f"Scheduled pass escalation sweep every {interval_minutes} minutes")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to schedule pass escalation sweep: {e}")
+        return False
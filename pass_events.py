@@ -0,0 +1,221 @@
+"""
+Live Pass Events
+A single Firestore listener per process on pending passes. Status changes are
+fanned out to the students they belong to over Server-Sent Events, so nobody
+has to reload a page to learn their pass was approved.
+
+The listener also keeps an in-memory index of pending passes keyed by
+`current_approver`, which serves faculty approval queues without Firestore reads.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from db import get_db
+
+logger = logging.getLogger(__name__)
+
+# Seconds between SSE keep-alive comments on an idle stream
+KEEPALIVE_SECONDS = 20
+# Events kept for a slow client before new ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+# After the listener fails to start, callers fall back at once for this long before it is retried
+START_RETRY_SECONDS = 30
+
+
+class PendingPassWatcher:
+    """Watches `passes` where status == 'pending' and publishes changes to subscribers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watch = None
+        self._initialised = False
+        self._ready = threading.Event()
+        self._start_failed_at = None
+        self._pending = {}
+        self._by_approver = defaultdict(set)
+        self._applicant_subscribers = defaultdict(set)
+        self._approver_subscribers = defaultdict(set)
+
+    # --- Subscriptions ---
+    def subscribe_applicant(self, applicant_id):
+        """Returns a queue that receives status events for the applicant's passes."""
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._applicant_subscribers[applicant_id].add(subscription)
+        self.start()
+        return subscription
+
+    def unsubscribe_applicant(self, applicant_id, subscription):
+        with self._lock:
+            subscribers = self._applicant_subscribers.get(applicant_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._applicant_subscribers[applicant_id]
+
+    def subscribe_approvers(self, role_ids):
+        """Returns a queue that receives an event whenever any of these approver queues changes."""
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            for role_id in role_ids:
+                self._approver_subscribers[role_id].add(subscription)
+        self.start()
+        return subscription
+
+    def unsubscribe_approvers(self, role_ids, subscription):
+        with self._lock:
+            for role_id in role_ids:
+                subscribers = self._approver_subscribers.get(role_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._approver_subscribers[role_id]
+
+    # --- Approver index ---
+    def wait_ready(self, timeout=5):
+        """
+        Starts the listener if needed and waits for its first snapshot. Returns True once
+        the index is usable, and False at once while the listener cannot be started.
+        """
+        self.start()
+        if self._watch is None:
+            return False
+        return self._ready.wait(timeout)
+
+    def pending_for_approvers(self, role_ids):
+        """Returns copies of the pending passes waiting on any of the given approver roles, oldest first."""
+        with self._lock:
+            passes = [
+                {**self._pending[pass_id], 'id': pass_id}
+                for role_id in role_ids
+                for pass_id in self._by_approver.get(role_id, ())
+            ]
+        passes.sort(key=lambda p: (p.get('date') is None, p.get('date') or datetime.min))
+        return passes
+
+    # --- Listener ---
+    def start(self):
+        """Starts the shared listener if it is not already running."""
+        with self._lock:
+            if self._watch is not None:
+                return
+            if self._start_failed_at is not None and time.monotonic() - self._start_failed_at < START_RETRY_SECONDS:
+                return
+            try:
+                query = get_db().collection('passes').where('status', '==', 'pending')
+                self._watch = query.on_snapshot(self._on_snapshot)
+                self._start_failed_at = None
+                logger.info("Pending pass listener started")
+            except Exception as e:
+                self._start_failed_at = time.monotonic()
+                logger.error(f"Could not start pending pass listener, retrying in {START_RETRY_SECONDS}s: {e}")
+
+    def stop(self):
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+            self._watch = None
+            self._initialised = False
+            self._ready.clear()
+            self._pending.clear()
+            self._by_approver.clear()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        initial = not self._initialised
+        self._initialised = True
+
+        for change in changes:
+            pass_id = change.document.id
+            kind = change.type.name
+            if kind in ('ADDED', 'MODIFIED'):
+                data = change.document.to_dict()
+                with self._lock:
+                    previous = self._pending.get(pass_id)
+                    old_approver = previous.get('current_approver') if previous else None
+                    self._pending[pass_id] = data
+                    self._index_remove(pass_id, old_approver)
+                    self._by_approver[data.get('current_approver')].add(pass_id)
+                if not initial:
+                    # Students only hear about a pending pass when it moves to another approver,
+                    # not when they submit it or it is edited in place
+                    if previous is not None and old_approver != data.get('current_approver'):
+                        self._publish(data.get('applicant_id'), pass_id, 'pending', data.get('current_approver'))
+                    self._publish_queue_change(pass_id, old_approver, data.get('current_approver'))
+            elif kind == 'REMOVED':
+                with self._lock:
+                    data = self._pending.pop(pass_id, None) or change.document.to_dict() or {}
+                    self._index_remove(pass_id, data.get('current_approver'))
+                self._publish_final_status(data.get('applicant_id'), pass_id)
+                self._publish_queue_change(pass_id, data.get('current_approver'))
+
+        self._ready.set()
+
+    def _index_remove(self, pass_id, approver):
+        """Drops a pass from an approver's set. Caller holds the lock."""
+        approver_passes = self._by_approver.get(approver)
+        if approver_passes is not None:
+            approver_passes.discard(pass_id)
+            if not approver_passes:
+                del self._by_approver[approver]
+
+    def _publish_queue_change(self, pass_id, *approvers):
+        """Tells faculty watching any of these approver roles that their queue changed."""
+        with self._lock:
+            subscribers = {
+                subscription
+                for approver in approvers if approver
+                for subscription in self._approver_subscribers.get(approver, ())
+            }
+        event = {'pass_id': pass_id, 'approvers': [a for a in approvers if a]}
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def _publish_final_status(self, applicant_id, pass_id):
+        """A pass left the pending set; look up where it went, but only if someone is listening."""
+        with self._lock:
+            if not self._applicant_subscribers.get(applicant_id):
+                return
+        try:
+            doc = get_db().collection('passes').document(pass_id).get()
+            status = doc.to_dict().get('status') if doc.exists else 'deleted'
+        except Exception as e:
+            logger.warning(f"Could not read final status of pass {pass_id}: {e}")
+            return
+        self._publish(applicant_id, pass_id, status, None)
+
+    def _publish(self, applicant_id, pass_id, status, current_approver):
+        event = {'pass_id': pass_id, 'status': status, 'current_approver': current_approver}
+        with self._lock:
+            subscribers = list(self._applicant_subscribers.get(applicant_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                logger.warning(f"Dropping pass event for slow subscriber of {applicant_id}")
+
+
+pass_watcher = PendingPassWatcher()
+
+
+def sse_stream(subscription, on_close, event_name='pass_status'):
+    """Yields Server-Sent Events from a subscription queue, with keep-alives, until the client leaves."""
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event = subscription.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield f"event: {event_name}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        on_close()
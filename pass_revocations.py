@@ -0,0 +1,161 @@
+"""
+Gate Pass Revocations
+Gate tokens are checked offline, so a pass revoked after approval has to be
+caught from a list rather than a per-scan lookup. Each revocation is a document
+in `pass_revocations/{pass_id}`:
+
+    {pass_id, version, reason, revoked_by, revoked_at, expires_at}
+
+`version` is the revocation time in epoch microseconds. Clients keep the highest
+version they have seen and ask for everything newer; entries from the last
+REFRESH_OVERLAP_US before that are sent again, so a revocation committed slightly
+out of order by another server process is not missed. `expires_at` is when the
+revoked token would have expired anyway; expired entries drop out of snapshots,
+which keeps the list down to the passes that could still be scanned today. The
+server keeps them a day longer to judge scans that offline scanners sync late.
+
+Every server process keeps the list in memory, fed by one listener, so verifying
+a scan against it is a set lookup.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from db import get_db
+from pass_tokens import token_expiry, verify_token
+
+logger = logging.getLogger(__name__)
+
+REVOCATIONS_COLLECTION = 'pass_revocations'
+# Window of already-seen versions resent with every incremental refresh
+REFRESH_OVERLAP_US = 5_000_000
+# Expired entries are kept this long for scans synced late by offline scanners
+RETAIN_EXPIRED = timedelta(days=1)
+# After the listener fails to start, scans are refused at once for this long before it is retried
+START_RETRY_SECONDS = 30
+
+
+def _version_now():
+    return time.time_ns() // 1000
+
+
+def revoke_pass(batch, db, pass_id, pass_data, reason, actor_id=None):
+    """
+    Adds the revocation of a pass to `batch`, alongside whatever else the caller
+    writes for the pass. Returns the revocation version.
+    """
+    version = _version_now()
+    now = datetime.now(timezone.utc)
+    batch.set(db.collection(REVOCATIONS_COLLECTION).document(pass_id), {
+        'pass_id': pass_id,
+        'version': version,
+        'reason': reason,
+        'revoked_by': actor_id,
+        'revoked_at': now,
+        'expires_at': token_expiry(pass_data.get('gate_token')) or now,
+    })
+    return version
+
+
+class RevocationIndex:
+    """Revoked pass IDs of this process, kept current by a listener on `pass_revocations`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watch = None
+        self._ready = threading.Event()
+        self._entries = {}          # pass_id -> (version, expires_at epoch seconds)
+        self._version = 0
+        self._start_failed_at = None
+
+    def start(self):
+        if self._watch is not None:
+            return
+        with self._lock:
+            if self._watch is not None:
+                return
+            if self._start_failed_at is not None and time.monotonic() - self._start_failed_at < START_RETRY_SECONDS:
+                return
+            try:
+                self._watch = (get_db().collection(REVOCATIONS_COLLECTION)
+                               .where('expires_at', '>', datetime.now(timezone.utc) - RETAIN_EXPIRED)
+                               .on_snapshot(self._on_snapshot))
+                self._start_failed_at = None
+                logger.info("Pass revocation listener started")
+            except Exception as e:
+                self._start_failed_at = time.monotonic()
+                logger.error(f"Could not start pass revocation listener, retrying in {START_RETRY_SECONDS}s: {e}")
+
+    def stop(self):
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
+            self._ready.clear()
+            self._entries.clear()
+            self._version = 0
+
+    def wait_ready(self, timeout=5):
+        """
+        Starts the listener if needed and waits for its first snapshot. Returns False
+        (at once while the listener cannot be started) if the list is not loaded.
+        """
+        self.start()
+        if self._watch is None:
+            return False
+        return self._ready.wait(timeout)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    self._entries.pop(change.document.id, None)
+                    continue
+                data = change.document.to_dict() or {}
+                expires_at = data.get('expires_at')
+                expires = expires_at.timestamp() if isinstance(expires_at, datetime) else 0
+                version = int(data.get('version') or 0)
+                self._entries[change.document.id] = (version, expires)
+                self._version = max(self._version, version)
+        self._ready.set()
+
+    @property
+    def version(self):
+        return self._version
+
+    def is_revoked(self, pass_id):
+        return pass_id in self._entries
+
+    def snapshot(self, since=None, now=None):
+        """
+        Returns {'version', 'full', 'revoked'} where `revoked` is a sorted array of pass IDs:
+        every live revocation when `since` is None, otherwise those newer than `since`
+        (less the refresh overlap).
+        """
+        now = (now or datetime.now(timezone.utc)).timestamp()
+        floor = -1 if since is None else since - REFRESH_OVERLAP_US
+        with self._lock:
+            stale = [pass_id for pass_id, (_, expires) in self._entries.items()
+                     if expires <= now - RETAIN_EXPIRED.total_seconds()]
+            for pass_id in stale:
+                del self._entries[pass_id]
+            revoked = sorted(pass_id for pass_id, (version, expires) in self._entries.items()
+                             if expires > now and version > floor)
+            return {'version': self._version, 'full': since is None, 'revoked': revoked}
+
+
+revocation_index = RevocationIndex()
+
+
+def verify_scan(token, now=None):
+    """
+    Verifies a scanned token as of `now` (the scan time) and checks it against the
+    revocation list. Returns (claims, reason) like verify_token, with the extra
+    reason 'revoked'.
+    """
+    claims, reason = verify_token(token, now)
+    if reason is None and revocation_index.is_revoked(claims.get('p')):
+        reason = 'revoked'
+    return claims, reason
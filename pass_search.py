@@ -0,0 +1,291 @@
+"""
+Pass Search
+Full-text search over passes for admins, served from a local SQLite FTS5 index
+instead of scanning Firestore.
+
+Indexed text per pass: reason, applicant name, roll number (or faculty ID), pass
+type and department, and its approvers (role keys, approver IDs and, once the
+approval router has loaded the faculty, their names). Results are ranked with
+bm25, weighting the applicant and reason above the rest, and can be limited to a
+date range. Pages are fetched with a cursor (score and row of the last result),
+so page N costs the same as page 1.
+
+The index is fed by one listener on `passes`: its first snapshot indexes the live
+passes and every later write re-indexes just that pass. Text is only rewritten
+when it changed, so status changes touch one row. Passes moved to the archive
+(pass_archive.py) stay in the index, flagged `archived`; archives older than the
+index are indexed once from `archived_passes` when the index file is new.
+
+The index lives in PASS_SEARCH_DB (default instance/pass_search.db; ':memory:'
+keeps it in memory). Writes are idempotent upserts, so processes may share the file.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from approval_routing import approval_router
+from db import get_db
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 25
+# bm25 column weights: reason, applicant, roll number, approvers, pass type, department
+BM25_WEIGHTS = (4.0, 6.0, 6.0, 2.0, 1.0, 1.0)
+TEXT_FIELDS = ('reason', 'applicant', 'roll_number', 'approvers', 'pass_type', 'department')
+DISPLAY_FIELDS = ('applicant_name', 'applicant_type', 'roll_number', 'department', 'pass_type', 'reason', 'status')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pass_docs (
+    id INTEGER PRIMARY KEY,
+    pass_id TEXT NOT NULL UNIQUE,
+    date REAL,
+    status TEXT,
+    archived INTEGER NOT NULL DEFAULT 0,
+    text_hash TEXT,
+    display TEXT
+);
+CREATE INDEX IF NOT EXISTS pass_docs_date ON pass_docs (date);
+CREATE VIRTUAL TABLE IF NOT EXISTS pass_fts USING fts5(
+    reason, applicant, roll_number, approvers, pass_type, department,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+);
+CREATE TABLE IF NOT EXISTS search_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _default_path():
+    return os.getenv('PASS_SEARCH_DB',
+                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'pass_search.db'))
+
+
+def match_expression(text):
+    """Turns free text into an FTS5 query: every word must match, as a prefix. None when there are no words."""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words[:16])
+
+
+def _encode_cursor(score, row_id):
+    return f"{score!r}:{row_id}"
+
+
+def _decode_cursor(cursor):
+    try:
+        score, row_id = cursor.rsplit(':', 1)
+        return float(score), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+class PassSearchIndex:
+    """SQLite FTS5 index of passes, kept current by a listener on `passes`."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._watch = None
+        self._ready = threading.Event()
+        self._stats = {'indexed': 0, 'text_updates': 0, 'archived': 0, 'last_batch_ms': None}
+
+    # --- Listener ---
+    def start(self):
+        if self._watch is not None:
+            return
+        with self._lock:
+            if self._watch is not None:
+                return
+            try:
+                self._open()
+                self._watch = get_db().collection('passes').on_snapshot(self._on_snapshot)
+                logger.info("Pass search listener started")
+            except Exception as e:
+                logger.error(f"Could not start pass search listener: {e}")
+                return
+        if self._meta('archives_indexed') is None:
+            threading.Thread(target=self._index_archives, name='pass-search-archives', daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
+            self._ready.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def wait_ready(self, timeout=5):
+        """Starts the listener if needed and waits until the live passes are indexed."""
+        self.start()
+        return self._ready.wait(timeout)
+
+    def summary(self):
+        with self._lock:
+            documents = self._conn.execute('SELECT COUNT(*) FROM pass_docs').fetchone()[0] if self._conn else 0
+            return {**self._stats, 'documents': documents, 'ready': self._ready.is_set()}
+
+    def _on_snapshot(self, docs, changes, read_time):
+        started = time.perf_counter()
+        upserts, removed = [], []
+        for change in changes:
+            if change.type.name == 'REMOVED':
+                removed.append(change.document.id)
+            else:
+                upserts.append((change.document.id, change.document.to_dict() or {}))
+        with self._lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                self._upsert(upserts, archived=False)
+                # Passes only leave `passes` when they are archived; keep them searchable
+                self._conn.executemany('UPDATE pass_docs SET archived = 1 WHERE pass_id = ?',
+                                       [(pass_id,) for pass_id in removed])
+            self._stats['archived'] += len(removed)
+            self._stats['last_batch_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        self._ready.set()
+
+    def _index_archives(self):
+        """Indexes the passes archived before this index existed, once."""
+        try:
+            db = get_db()
+            batch = []
+            for doc in db.collection_group('archived_passes').stream():
+                batch.append((doc.id, doc.to_dict() or {}))
+                if len(batch) >= 1000:
+                    self._upsert_locked(batch)
+                    batch = []
+            self._upsert_locked(batch)
+            with self._lock:
+                if self._conn is not None:
+                    with self._conn:
+                        self._conn.execute("INSERT OR REPLACE INTO search_meta VALUES ('archives_indexed', ?)",
+                                           (datetime.now(timezone.utc).isoformat(),))
+            logger.info("Pass search: archived passes indexed")
+        except Exception as e:
+            logger.error(f"Pass search could not index archived passes: {e}")
+
+    def _upsert_locked(self, passes):
+        with self._lock:
+            if self._conn is not None and passes:
+                with self._conn:
+                    self._upsert(passes, archived=True)
+
+    # --- Storage ---
+    def _open(self):
+        """Opens the index file and creates its tables. Caller holds the lock."""
+        if self._conn is not None:
+            return
+        self.path = self.path or _default_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        if self.path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def _meta(self, key):
+        with self._lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute('SELECT value FROM search_meta WHERE key = ?', (key,)).fetchone()
+            return row[0] if row else None
+
+    def _text(self, pass_data):
+        approvers = []
+        for step in pass_data.get('approvals') or []:
+            if not isinstance(step, dict):
+                continue
+            approvers += [step.get('role'), step.get('approved_by'), approval_router.faculty_name(step.get('approved_by'))]
+        return (
+            pass_data.get('reason'),
+            pass_data.get('applicant_name') or pass_data.get('name'),
+            pass_data.get('roll_number') or pass_data.get('faculty_id'),
+            ' '.join(str(value) for value in approvers if value),
+            pass_data.get('pass_type'),
+            pass_data.get('department'),
+        )
+
+    def _upsert(self, passes, archived):
+        """Indexes [(pass_id, pass_data)]. Caller holds the lock inside a transaction."""
+        for pass_id, pass_data in passes:
+            date = pass_data.get('date')
+            text = self._text(pass_data)
+            text_hash = hashlib.blake2b(json.dumps(text, default=str).encode('utf-8'), digest_size=12).hexdigest()
+            display = json.dumps({field: pass_data.get(field) for field in DISPLAY_FIELDS}, default=str)
+            previous = self._conn.execute('SELECT text_hash FROM pass_docs WHERE pass_id = ?', (pass_id,)).fetchone()
+            row_id = self._conn.execute(
+                'INSERT INTO pass_docs (pass_id, date, status, archived, text_hash, display) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(pass_id) DO UPDATE SET date = excluded.date, status = excluded.status, '
+                'archived = excluded.archived, text_hash = excluded.text_hash, display = excluded.display '
+                'RETURNING id',
+                (pass_id, date.timestamp() if isinstance(date, datetime) else None, pass_data.get('status'),
+                 int(archived), text_hash, display)).fetchone()[0]
+            self._stats['indexed'] += 1
+            if previous is not None and previous[0] == text_hash:
+                continue
+            self._conn.execute('DELETE FROM pass_fts WHERE rowid = ?', (row_id,))
+            self._conn.execute(f"INSERT INTO pass_fts (rowid, {', '.join(TEXT_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (row_id, *[str(value) if value is not None else None for value in text]))
+            self._stats['text_updates'] += 1
+
+    # --- Queries ---
+    def search(self, text, date_from=None, date_to=None, cursor=None, limit=SEARCH_PAGE_SIZE):
+        """
+        Returns {'results', 'next_cursor', 'took_ms'} for passes matching every word
+        of `text` (as prefixes), best first, dated in [date_from, date_to) when given.
+        """
+        started = time.perf_counter()
+        expression = match_expression(text)
+        if expression is None:
+            return {'results': [], 'next_cursor': None, 'took_ms': 0.0}
+        clauses, params = ['pass_fts MATCH ?'], [expression]
+        if date_from is not None:
+            clauses.append('d.date >= ?')
+            params.append(date_from.timestamp())
+        if date_to is not None:
+            clauses.append('d.date < ?')
+            params.append(date_to.timestamp())
+        query = (f"SELECT d.id, d.pass_id, d.date, d.status, d.archived, d.display, "
+                 f"bm25(pass_fts, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS score "
+                 f"FROM pass_fts JOIN pass_docs d ON d.id = pass_fts.rowid WHERE {' AND '.join(clauses)}")
+        after = _decode_cursor(cursor) if cursor else None
+        outer, outer_params = '', []
+        if after is not None:
+            # Lower bm25 scores rank higher; ties are broken by row
+            outer, outer_params = 'WHERE (score, id) > (?, ?)', list(after)
+        sql = f"SELECT * FROM ({query}) {outer} ORDER BY score, id LIMIT ?"
+
+        with self._lock:
+            if self._conn is None:
+                return {'results': [], 'next_cursor': None, 'took_ms': 0.0}
+            rows = self._conn.execute(sql, params + outer_params + [limit + 1]).fetchall()
+
+        results = []
+        for row_id, pass_id, date, status, archived, display, score in rows[:limit]:
+            results.append({
+                **json.loads(display),
+                'id': pass_id,
+                'status': status,
+                'date': datetime.fromtimestamp(date, timezone.utc) if date is not None else None,
+                'archived': bool(archived),
+                'score': round(-score, 3),
+            })
+        next_cursor = None
+        if len(rows) > limit:
+            row_id, score = rows[limit - 1][0], rows[limit - 1][6]
+            next_cursor = _encode_cursor(score, row_id)
+        return {'results': results, 'next_cursor': next_cursor,
+                'took_ms': round((time.perf_counter() - started) * 1000, 3)}
+
+
+pass_search_index = PassSearchIndex()
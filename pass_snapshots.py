@@ -0,0 +1,344 @@
+"""
+Columnar Pass Snapshots (Parquet)
+Exports passes, students and faculty to Parquet files so analysts and the in-app
+reports read them with pandas instead of querying Firestore.
+
+Layout under PASS_SNAPSHOT_DIR (default instance/pass_snapshots):
+- passes/month=YYYY-MM/department=<dept>/part-<from>.parquet: one file per
+  partition per export run; `<from>` is the run's starting watermark in µs
+- approvals/...: one row per approval step of those passes, partitioned the same
+  way, with when the step was waiting from and when it was decided
+- students.parquet, faculty.parquet: the current people, rewritten every run
+- _snapshot.json: the manifest (watermark, version, recent runs)
+
+The first run pages through every pass, live and archived. Later runs only append
+passes created since the watermark. A run stops PASS_SNAPSHOT_SETTLE_HOURS
+(default 24) before now: by then a pass has been decided and its gate scans written,
+so exported rows never change. A revocation or status change made after that is not
+reflected; run export_snapshot(full=True) to rebuild.
+
+Files are written before the manifest moves the watermark on. A run that fails in
+between is repeated from the same watermark, and writes the same file names again,
+so it never duplicates rows.
+
+Names, reasons and contact details are left out; rows carry IDs and the attributes
+reports group by. Needs pyarrow (pandas reads the files through it).
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from db import get_db
+from metrics import instrument_job
+
+logger = logging.getLogger(__name__)
+
+# Documents read per query page
+EXPORT_PAGE = 1000
+# Export runs kept in the manifest
+MANIFEST_RUNS = 20
+MANIFEST_NAME = '_snapshot.json'
+
+PASS_FIELDS = {
+    'pass_id': 'string', 'applicant_id': 'string', 'applicant_type': 'string',
+    'academic_year': 'int', 'pass_out_year': 'int', 'section': 'string',
+    'pass_type': 'string', 'status': 'string', 'is_automatic': 'bool',
+    'date': 'timestamp', 'out_time': 'string', 'in_time': 'string',
+    'actual_out': 'timestamp', 'actual_in': 'timestamp',
+    'late_return': 'bool', 'late_by_minutes': 'int', 'overdue_return': 'bool',
+}
+APPROVAL_FIELDS = {
+    'pass_id': 'string', 'step': 'int', 'role': 'string', 'status': 'string', 'approved_by': 'string',
+    'reason': 'string', 'escalated': 'bool', 'requested_at': 'timestamp', 'decided_at': 'timestamp',
+}
+STUDENT_FIELDS = {
+    'id': 'string', 'branch': 'string', 'section': 'string', 'academic_year': 'int',
+    'pass_out_year': 'int', 'gender': 'string',
+}
+FACULTY_FIELDS = {
+    'id': 'string', 'department': 'string', 'status': 'string', 'gender': 'string',
+}
+
+_export_lock = threading.Lock()
+
+
+def snapshot_dir():
+    return os.getenv('PASS_SNAPSHOT_DIR',
+                     os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'pass_snapshots'))
+
+
+def _settle_hours():
+    return float(os.getenv('PASS_SNAPSHOT_SETTLE_HOURS', '24'))
+
+
+def _schema(fields):
+    import pyarrow as pa
+
+    types = {'string': pa.string(), 'int': pa.int64(), 'bool': pa.bool_(), 'timestamp': pa.timestamp('us', tz='UTC')}
+    return pa.schema([(name, types[kind]) for name, kind in fields.items()])
+
+
+def _value(value, kind):
+    """Coerces a Firestore value to the column type, or None when it does not fit."""
+    if value is None:
+        return None
+    if kind == 'timestamp':
+        return value if isinstance(value, datetime) else None
+    if kind == 'int':
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if kind == 'bool':
+        return bool(value)
+    return str(value)
+
+
+def _row(doc_id, data, fields, id_field):
+    row = {name: _value(data.get(name), kind) for name, kind in fields.items()}
+    row[id_field] = doc_id
+    return row
+
+
+def _approval_rows(pass_id, pass_data):
+    """One row per approval step; a step waits from the previous decision (or the pass date)."""
+    rows = []
+    requested_at = pass_data.get('date')
+    for i, step in enumerate(pass_data.get('approvals') or []):
+        decided_at = step.get('timestamp')
+        rows.append({
+            **{name: _value(step.get(name), kind) for name, kind in APPROVAL_FIELDS.items()},
+            'pass_id': pass_id,
+            'step': i,
+            'escalated': bool(step.get('escalated_from')),
+            'requested_at': _value(requested_at, 'timestamp'),
+            'decided_at': _value(decided_at, 'timestamp'),
+        })
+        if isinstance(decided_at, datetime):
+            requested_at = decided_at
+    return rows
+
+
+def _write_dataset(directory, name, fields, partitions, part, full):
+    """Writes {(month, department): rows} under directory/name. A full export replaces the dataset."""
+    dataset_dir = os.path.join(directory, name)
+    # A full export is built next to the current one and swapped in, so readers never see half of it
+    target_dir = dataset_dir + '.new' if full else dataset_dir
+    if full:
+        shutil.rmtree(target_dir, ignore_errors=True)
+    for (month, department), rows in partitions.items():
+        if not rows:
+            continue
+        partition_dir = os.path.join(target_dir, f"month={month}", f"department={department}")
+        os.makedirs(partition_dir, exist_ok=True)
+        _write_table(rows, fields, os.path.join(partition_dir, part))
+    if full:
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        if os.path.isdir(target_dir):
+            os.replace(target_dir, dataset_dir)
+
+
+def _partition_value(value):
+    """Directory-safe partition value."""
+    text = str(value or 'unknown').strip() or 'unknown'
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in text)
+
+
+def _paged(query, page_size=EXPORT_PAGE):
+    """Streams a query in pages, resuming each page after the last document of the previous one."""
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def read_manifest(directory=None):
+    """Returns the snapshot manifest, or an empty one before the first export."""
+    path = os.path.join(directory or snapshot_dir(), MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'version': 0, 'watermark': None, 'runs': []}
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _write_table(rows, fields, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pylist(rows, schema=_schema(fields))
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+
+def _export_people(db, directory):
+    """
+    Rewrites students.parquet and faculty.parquet. Returns ({uid: (department, section)},
+    student count, faculty count); passes missing a department take their applicant's.
+    """
+    people = {}
+    students = []
+    for doc in _paged(db.collection('students')):
+        data = doc.to_dict()
+        students.append(_row(doc.id, data, STUDENT_FIELDS, 'id'))
+        people[doc.id] = (data.get('branch'), data.get('section'))
+    _write_table(students, STUDENT_FIELDS, os.path.join(directory, 'students.parquet'))
+
+    faculty = []
+    for doc in _paged(db.collection('faculty')):
+        data = doc.to_dict()
+        faculty.append(_row(doc.id, data, FACULTY_FIELDS, 'id'))
+        people[doc.id] = (data.get('department'), None)
+    _write_table(faculty, FACULTY_FIELDS, os.path.join(directory, 'faculty.parquet'))
+    return people, len(students), len(faculty)
+
+
+def export_snapshot(full=False, now=None, directory=None):
+    """
+    Appends passes created since the watermark (every pass when `full`) to the
+    Parquet snapshot and rewrites the people tables.
+    Returns a summary with the rows and files written and the new version.
+    """
+    now = now or datetime.now(timezone.utc)
+    directory = directory or snapshot_dir()
+    if not _export_lock.acquire(blocking=False):
+        return {'status': 'skipped', 'message': 'An export is already running'}
+    started = time.perf_counter()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        manifest = read_manifest(directory)
+        since = None if full or not manifest.get('watermark') else datetime.fromisoformat(manifest['watermark'])
+        until = now - timedelta(hours=_settle_hours())
+        if since is not None and since >= until:
+            return {'status': 'success', 'rows': 0, 'files': 0, 'version': manifest.get('version', 0)}
+
+        db = get_db()
+        people, students, faculty = _export_people(db, directory)
+
+        partitions, approvals = {}, {}
+        seen = set()
+        # Passes older than the archive horizon have left `passes` (see pass_archive.py)
+        for query in (db.collection('passes'), db.collection_group('archived_passes')):
+            if since is not None:
+                query = query.where('date', '>=', since)
+            query = query.where('date', '<', until).order_by('date')
+            for doc in _paged(query):
+                if doc.id in seen:
+                    continue
+                seen.add(doc.id)
+                data = doc.to_dict()
+                department, section = people.get(data.get('applicant_id'), (None, None))
+                row = _row(doc.id, {'section': section, **data}, PASS_FIELDS, 'pass_id')
+                key = (data['date'].astimezone(timezone.utc).strftime('%Y-%m'),
+                       _partition_value(data.get('department') or department))
+                partitions.setdefault(key, []).append(row)
+                approvals.setdefault(key, []).extend(_approval_rows(doc.id, data))
+
+        part = f"part-{int(since.timestamp() * 1e6) if since else 0}.parquet"
+        _write_dataset(directory, 'passes', PASS_FIELDS, partitions, part, full=since is None)
+        _write_dataset(directory, 'approvals', APPROVAL_FIELDS, approvals, part, full=since is None)
+
+        rows = sum(len(rows) for rows in partitions.values())
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        run = {'from': since.isoformat() if since else None, 'to': until.isoformat(), 'rows': rows,
+               'files': len(partitions), 'students': students, 'faculty': faculty, 'full': since is None,
+               'finished_at': datetime.now(timezone.utc).isoformat(), 'elapsed_ms': elapsed_ms}
+        manifest = {
+            'version': manifest.get('version', 0) + 1,
+            'watermark': until.isoformat(),
+            'total_rows': (0 if since is None else manifest.get('total_rows', 0)) + rows,
+            'runs': ([run] + manifest.get('runs', []))[:MANIFEST_RUNS],
+        }
+        _write_manifest(directory, manifest)
+    except Exception as e:
+        logger.error(f"Pass snapshot export failed: {e}")
+        return {'status': 'error', 'message': str(e)}
+    finally:
+        _export_lock.release()
+
+    logger.info(f"Pass snapshot v{manifest['version']}: {rows} passes in {len(partitions)} files "
+                f"up to {until:%Y-%m-%d %H:%M} in {elapsed_ms} ms")
+    return {'status': 'success', 'rows': rows, 'files': len(partitions), 'version': manifest['version'],
+            'elapsed_ms': elapsed_ms}
+
+
+def _read_dataset(name, fields, directory, months, departments, columns):
+    import pandas as pd
+
+    path = os.path.join(directory or snapshot_dir(), name)
+    if not os.path.isdir(path):
+        # Typed empty frame, so readers can use .dt and the like before the first export
+        empty = _schema(fields).empty_table().to_pandas().assign(month=pd.Series(dtype=str),
+                                                                 department=pd.Series(dtype=str))
+        return empty[columns] if columns else empty
+    filters = []
+    if months:
+        filters.append(('month', 'in', list(months)))
+    if departments:
+        filters.append(('department', 'in', [_partition_value(d) for d in departments]))
+    return pd.read_parquet(path, engine='pyarrow', columns=columns, filters=filters or None)
+
+
+def read_passes(directory=None, months=None, departments=None, columns=None):
+    """
+    Returns the exported passes as a pandas DataFrame, with `month` and `department`
+    columns from the partitions. `months` ('YYYY-MM') and `departments` only read the
+    matching partitions. Empty before the first export.
+    """
+    return _read_dataset('passes', PASS_FIELDS, directory, months, departments, columns)
+
+
+def read_approvals(directory=None, months=None, departments=None, columns=None):
+    """Returns the exported approval steps as a pandas DataFrame; arguments as for read_passes()."""
+    return _read_dataset('approvals', APPROVAL_FIELDS, directory, months, departments, columns)
+
+
+def read_people(kind, directory=None):
+    """Returns the exported 'students' or 'faculty' table as a pandas DataFrame."""
+    import pandas as pd
+
+    path = os.path.join(directory or snapshot_dir(), f"{kind}.parquet")
+    fields = STUDENT_FIELDS if kind == 'students' else FACULTY_FIELDS
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=list(fields))
+    return pd.read_parquet(path, engine='pyarrow')
+
+
+def schedule_snapshot_export(scheduler, hour=None):
+    """Schedules the incremental export nightly at PASS_SNAPSHOT_HOUR (default 2) local time."""
+    hour = hour if hour is not None else int(os.getenv('PASS_SNAPSHOT_HOUR', '2'))
+    try:
+        scheduler.add_job(
+            func=instrument_job('pass_snapshot_export', export_snapshot),
+            trigger='cron',
+            hour=hour,
+            minute=30,
+            id='pass_snapshot_export',
+            name='Pass Snapshot Export',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+        logger.info(f"Scheduled pass snapshot export nightly at {hour:02d}:30")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to schedule pass snapshot export: {e}")
+        return False
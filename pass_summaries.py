@@ -0,0 +1,313 @@
+"""
+Per-Applicant Pass Summaries and History
+Every applicant (student or faculty) has a `pass_summaries/{uid}` document, so
+dashboards can show "how many passes, what's pending, what was the last one"
+from one read instead of querying the passes collection. Admin dashboards read
+the institution-wide counterpart, `pass_stats/global`.
+
+Both are written in the same batch as the pass itself: on creation
+(record_pass_created) and on every status change (record_status_change).
+
+Fields of `pass_summaries/{uid}`:
+- total_passes: number of passes ever created for the applicant
+- counts_by_status / counts_by_type: {status or pass_type: count}
+- last_pass_date: when the latest pass was created
+- today_pass_id / today_pass_day: the latest pass and the local date (YYYY-MM-DD) it was created on
+- recent_passes: stubs of the latest RECENT_PASSES passes, newest first
+- archived_terms: terms whose archives hold the applicant's older passes (written by pass_archive.py)
+
+`pass_stats/global` holds total_passes, counts_by_status and counts_by_type.
+
+Counts are kept with Firestore increments, so concurrent writers cannot lose
+updates. `recent_passes` is rewritten from the summary read just before the
+batch; a write racing with another write for the same applicant can leave a
+stub one status behind until that pass changes again.
+
+Summaries missing for older accounts (or written before counts existed) are
+backfilled from the passes collection on first use. Counters only change in the
+same batch as the pass they count, so a backfill is written only if its document
+is unchanged since it was read before the scan (create() when it was missing);
+otherwise the scan is redone, and increments landing mid-scan are never overwritten. The full pass history is
+paged separately by list_passes() (list_approved_passes() for students), which
+continues into the applicant's `archived_terms` once the live passes run out.
+"""
+
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PAGE_SIZE = 10
+# Scans redone when passes keep changing under a backfill
+BACKFILL_ATTEMPTS = 3
+# Pass stubs kept on each summary for dashboards
+RECENT_PASSES = 5
+STUB_FIELDS = ('pass_type', 'reason', 'status', 'out_time', 'in_time')
+
+
+def _today():
+    return datetime.now().date().isoformat()
+
+
+def _summary_ref(db, applicant_id):
+    return db.collection('pass_summaries').document(applicant_id)
+
+
+def _global_ref(db):
+    return db.collection('pass_stats').document('global')
+
+
+def _stub(pass_id, pass_data, created_at=None):
+    """Dashboard-sized copy of a pass. Dates must be concrete: sentinels are not allowed inside arrays."""
+    date = pass_data.get('date')
+    if not isinstance(date, datetime):
+        date = created_at or datetime.now(timezone.utc)
+    return {'id': pass_id, 'date': date, **{field: pass_data.get(field) for field in STUB_FIELDS}}
+
+
+def _increments(counts):
+    return {key: firestore.Increment(value) for key, value in counts.items() if value}
+
+
+def summarise(passes):
+    """Builds applicant summary fields from [(pass_id, pass_data)]. Used for backfills and seeding."""
+    def sort_key(item):
+        date = item[1].get('date')
+        return date.timestamp() if isinstance(date, datetime) else 0
+
+    passes = sorted(passes, key=sort_key, reverse=True)
+    summary = {
+        'total_passes': len(passes),
+        'counts_by_status': dict(Counter(p.get('status') or 'unknown' for _, p in passes)),
+        'counts_by_type': dict(Counter(p.get('pass_type') or 'unknown' for _, p in passes)),
+        'last_pass_date': None,
+        'today_pass_id': None,
+        'today_pass_day': None,
+        'recent_passes': [_stub(pass_id, data) for pass_id, data in passes[:RECENT_PASSES]],
+    }
+    if passes:
+        latest_id, latest = passes[0]
+        latest_date = latest.get('date')
+        summary['last_pass_date'] = latest_date
+        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if isinstance(latest_date, datetime) and latest_date.astimezone().replace(tzinfo=None) >= today_start:
+            summary['today_pass_id'] = latest_id
+            summary['today_pass_day'] = _today()
+    return summary
+
+
+def record_pass_created(batch, db, pass_id, pass_data, summary=None, created_at=None):
+    """
+    Adds the summary updates for a newly created pass to `batch`. `summary` is the
+    applicant's current summary; it is read when not supplied.
+    """
+    applicant_id = pass_data['applicant_id']
+    if summary is None:
+        summary = get_summary(db, applicant_id)
+    status = pass_data.get('status') or 'pending'
+    pass_type = pass_data.get('pass_type') or 'unknown'
+    recent = [_stub(pass_id, pass_data, created_at)] + [
+        stub for stub in summary.get('recent_passes') or [] if stub.get('id') != pass_id][:RECENT_PASSES - 1]
+
+    batch.set(_summary_ref(db, applicant_id), {
+        'total_passes': firestore.Increment(1),
+        'counts_by_status': {status: firestore.Increment(1)},
+        'counts_by_type': {pass_type: firestore.Increment(1)},
+        'last_pass_date': created_at or firestore.SERVER_TIMESTAMP,
+        'today_pass_id': pass_id,
+        'today_pass_day': _today(),
+        'recent_passes': recent,
+    }, merge=True)
+    batch.set(_global_ref(db), {
+        'total_passes': firestore.Increment(1),
+        'counts_by_status': {status: firestore.Increment(1)},
+        'counts_by_type': {pass_type: firestore.Increment(1)},
+    }, merge=True)
+
+
+def record_status_change(batch, db, pass_id, pass_data, new_status, summary=None, global_counts=None):
+    """
+    Adds the summary updates for a pass moving from pass_data['status'] to `new_status`
+    to `batch`. `summary` is read when not supplied. Callers moving many passes in one
+    batch pass a Counter as `global_counts` and write it once with record_global_counts().
+    """
+    old_status = pass_data.get('status') or 'pending'
+    if old_status == new_status:
+        return
+    if summary is None:
+        summary = get_summary(db, pass_data['applicant_id'])
+    counts = {old_status: -1, new_status: 1}
+
+    update = {'counts_by_status': _increments(counts)}
+    recent = summary.get('recent_passes') or []
+    if any(stub.get('id') == pass_id for stub in recent):
+        update['recent_passes'] = [{**stub, 'status': new_status} if stub.get('id') == pass_id else stub
+                                   for stub in recent]
+        summary['recent_passes'] = update['recent_passes']
+    batch.set(_summary_ref(db, pass_data['applicant_id']), update, merge=True)
+
+    if global_counts is not None:
+        global_counts.update(counts)
+    else:
+        record_global_counts(batch, db, counts)
+
+
+def record_global_counts(batch, db, status_counts):
+    """Adds accumulated status count changes for `pass_stats/global` to `batch`."""
+    increments = _increments(status_counts)
+    if increments:
+        batch.set(_global_ref(db), {'counts_by_status': increments}, merge=True)
+
+
+def _backfill(db, ref, snapshot, build, complete):
+    """
+    Writes the fields build() counts from the passes to `ref`, only if the document is
+    unchanged since `snapshot` was read (created when it was missing). A pass written
+    during the scan also changed the document, so the scan is redone; once complete(data)
+    holds for the current document, another process has finished the backfill.
+    Returns the document data.
+    """
+    for _ in range(BACKFILL_ATTEMPTS):
+        fields = build()
+        try:
+            if snapshot.exists:
+                ref.update(fields, option=db.write_option(last_update_time=snapshot.update_time))
+                return {**snapshot.to_dict(), **fields}
+            ref.create(fields)
+            return fields
+        except (AlreadyExists, FailedPrecondition):
+            snapshot = ref.get()
+            if snapshot.exists and complete(snapshot.to_dict()):
+                return snapshot.to_dict()
+    logger.warning(f"Backfill of {ref.path} kept racing pass writes; it will be retried on next use")
+    return fields
+
+
+def _has_counts(summary):
+    return 'counts_by_status' in summary
+
+
+def _backfill_summary(db, applicant_id, snapshot):
+    """Builds the summary of an applicant who predates summaries from their passes."""
+    def build():
+        passes = db.collection('passes').where('applicant_id', '==', applicant_id).stream()
+        return summarise([(doc.id, doc.to_dict()) for doc in passes])
+    return _backfill(db, _summary_ref(db, applicant_id), snapshot, build, _has_counts)
+
+
+def get_summary(db, applicant_id):
+    """Returns the applicant's pass summary (one read, plus a one-off backfill for older accounts)."""
+    doc = _summary_ref(db, applicant_id).get()
+    if doc.exists:
+        summary = doc.to_dict()
+        if _has_counts(summary):
+            return summary
+    return _backfill_summary(db, applicant_id, doc)
+
+
+def get_summaries(db, applicant_ids):
+    """Returns {applicant_id: summary} with one batched read, backfilling the ones missing."""
+    refs = [_summary_ref(db, applicant_id) for applicant_id in applicant_ids]
+    summaries = {}
+    for doc in db.get_all(refs):
+        data = doc.to_dict() if doc.exists else None
+        summaries[doc.id] = data if data and _has_counts(data) else _backfill_summary(db, doc.id, doc)
+    return summaries
+
+
+def get_global_stats(db):
+    """
+    Returns institution-wide pass counts (one read). The first call on a database
+    with older passes counts them once, without losing increments that land meanwhile.
+    """
+    doc = _global_ref(db).get()
+    stats = doc.to_dict() if doc.exists else {}
+    if stats.get('backfilled_at'):
+        return stats
+
+    def build():
+        passes = db.collection('passes').select(['status', 'pass_type']).stream()
+        summary = summarise([(doc.id, doc.to_dict()) for doc in passes])
+        stats = {key: summary[key] for key in ('total_passes', 'counts_by_status', 'counts_by_type')}
+        stats['backfilled_at'] = datetime.now(timezone.utc)
+        return stats
+    return _backfill(db, _global_ref(db), doc, build, lambda stats: bool(stats.get('backfilled_at')))
+
+
+def has_pass_today(summary):
+    """True when the summary points at a pass created today. No reads."""
+    return bool(summary and summary.get('today_pass_day') == _today() and summary.get('today_pass_id'))
+
+
+def todays_stub(summary):
+    """Returns the stub of today's pass from a summary, or None. No reads."""
+    if not summary or summary.get('today_pass_day') != _today():
+        return None
+    return next((stub for stub in summary.get('recent_passes') or []
+                 if stub.get('id') == summary.get('today_pass_id')), None)
+
+
+def get_todays_pass(db, summary):
+    """Returns today's pass (with its `id`) from a summary, or None without a read when there is none."""
+    if not summary or summary.get('today_pass_day') != _today() or not summary.get('today_pass_id'):
+        return None
+    doc = db.collection('passes').document(summary['today_pass_id']).get()
+    if not doc.exists:
+        return None
+    return {**doc.to_dict(), 'id': doc.id}
+
+
+def list_approved_passes(db, applicant_id, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Returns (passes, next_cursor) for one page of the applicant's approved passes,
+    newest first. Paged like list_passes().
+    Needs a composite index on passes and archived_passes (applicant_id ASC, status ASC, date DESC).
+    """
+    return list_passes(db, applicant_id, cursor=cursor, page_size=page_size, status='approved')
+
+
+def list_passes(db, applicant_id, cursor=None, page_size=HISTORY_PAGE_SIZE, status=None):
+    """
+    Returns (passes, next_cursor) for one page of the applicant's passes (only those
+    with `status` when given), newest first. `cursor` is the ID of the last pass on
+    the previous page, or '<term>/<ID>' once the page has moved past the live passes
+    into the applicant's archived terms (see pass_archive.py); the summary is only
+    read at that point.
+    Needs a composite index on passes and archived_passes (applicant_id ASC, date DESC).
+    """
+    from pass_archive import archive_collection
+
+    term, _, last_id = (cursor or '').rpartition('/')
+    term = term or None
+    found = []  # (term or None for live passes, snapshot)
+    archived_terms = None
+    while True:
+        collection = db.collection('passes') if term is None else archive_collection(db, term)
+        query = collection.where('applicant_id', '==', applicant_id)
+        if status is not None:
+            query = query.where('status', '==', status)
+        query = query.order_by('date', direction=firestore.Query.DESCENDING)
+        if last_id:
+            cursor_doc = collection.document(last_id).get()
+            if cursor_doc.exists:
+                query = query.start_after(cursor_doc)
+        found += [(term, doc) for doc in query.limit(page_size + 1 - len(found)).stream()]
+        if len(found) > page_size:
+            break
+        if archived_terms is None:
+            archived_terms = sorted(get_summary(db, applicant_id).get('archived_terms') or [], reverse=True)
+        older = [archived for archived in archived_terms if term is None or archived < term]
+        if not older:
+            break
+        term, last_id = older[0], None
+
+    passes = [{**doc.to_dict(), 'id': doc.id} for _, doc in found[:page_size]]
+    next_cursor = None
+    if len(found) > page_size:
+        term, doc = found[page_size - 1]
+        next_cursor = doc.id if term is None else f"{term}/{doc.id}"
+    return passes, next_cursor
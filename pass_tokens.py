@@ -0,0 +1,163 @@
+"""
+Signed Gate Pass Tokens
+Approved passes carry a compact token that a gate can verify without a database
+read. The token is `<payload>.<signature>`, both base64url without padding:
+
+- payload: JSON {"p": pass_id, "a": applicant_id, "t": pass_type, "nbf": epoch, "exp": epoch,
+  "r": epoch of the expected return (`in_time` on the pass day), only when the pass has one}
+- signature: HMAC-SHA256 of the encoded payload
+
+The key comes from PASS_TOKEN_SECRET (falling back to SECRET_KEY). Tokens signed
+with PASS_TOKEN_PREVIOUS_SECRET are still accepted, so the key can be rotated
+without invalidating passes issued earlier the same day. With neither secret set
+(or only the app's built-in development SECRET_KEY), no tokens are issued and
+every token fails verification as 'not_configured'.
+
+A token is valid from its approval until the end of the pass's day (local time),
+plus PASS_TOKEN_GRACE_MINUTES (default 0).
+"""
+
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# The app's SECRET_KEY when none is configured; public, so never used to sign passes
+DEVELOPMENT_SECRET_KEY = 'a-default-fallback-secret-key'
+
+# Clock skew tolerated between the server that signed a token and the gate verifying it
+CLOCK_SKEW_SECONDS = 60
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+@functools.lru_cache(maxsize=8)
+def _derive_keys(secret, previous):
+    signing = hmac.new(secret.encode(), b'gate-pass-token-v1', hashlib.sha256).digest()
+    verification = [signing]
+    if previous:
+        verification.append(hmac.new(previous.encode(), b'gate-pass-token-v1', hashlib.sha256).digest())
+    return signing, tuple(verification)
+
+
+def _keys():
+    """Returns (signing key, keys accepted for verification), or None when no real secret is configured."""
+    secret = os.getenv('PASS_TOKEN_SECRET') or os.getenv('SECRET_KEY')
+    if not secret or secret == DEVELOPMENT_SECRET_KEY:
+        return None
+    return _derive_keys(secret, os.getenv('PASS_TOKEN_PREVIOUS_SECRET'))
+
+
+def _end_of_day(moment):
+    """Last second of `moment`'s local day, plus the configured grace period, in UTC."""
+    local_day = moment.astimezone().date()
+    end = datetime.combine(local_day, dt_time(23, 59, 59)).astimezone(timezone.utc)
+    return end + timedelta(minutes=int(os.getenv('PASS_TOKEN_GRACE_MINUTES', '0')))
+
+
+def _return_by(pass_date, in_time):
+    """Epoch of `in_time` ('HH:MM', local) on the pass's local day, or None."""
+    try:
+        expected = datetime.strptime(in_time, '%H:%M').time()
+    except (TypeError, ValueError):
+        return None
+    return int(datetime.combine(pass_date.astimezone().date(), expected).astimezone(timezone.utc).timestamp())
+
+
+def issue_token(pass_id, pass_data, approved_at=None):
+    """
+    Returns the signed token for an approved pass, valid until the end of its day,
+    or None when no token secret is configured.
+    """
+    keys = _keys()
+    if keys is None:
+        logger.error(f"No gate token issued for pass {pass_id}: set PASS_TOKEN_SECRET or SECRET_KEY")
+        return None
+    approved_at = approved_at or datetime.now(timezone.utc)
+    pass_date = pass_data.get('date')
+    if not isinstance(pass_date, datetime):
+        pass_date = approved_at
+    elif pass_date.tzinfo is None:
+        pass_date = pass_date.replace(tzinfo=timezone.utc)
+    claims = {
+        'p': pass_id,
+        'a': pass_data.get('applicant_id'),
+        't': pass_data.get('pass_type'),
+        'nbf': int(approved_at.timestamp()),
+        'exp': int(_end_of_day(max(pass_date, approved_at)).timestamp()),
+    }
+    return_by = _return_by(pass_date, pass_data.get('in_time'))
+    if return_by:
+        claims['r'] = return_by
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode())
+    signing_key, _ = keys
+    signature = _b64encode(hmac.digest(signing_key, payload.encode('ascii'), 'sha256'))
+    return f"{payload}.{signature}"
+
+
+def verify_token(token, now=None):
+    """
+    Checks a token's signature and validity window without touching the database.
+    Returns (claims, None) for a valid token, or (claims or None, reason) where reason
+    is one of 'not_configured', 'malformed', 'bad_signature', 'not_yet_valid', 'expired'.
+    """
+    keys = _keys()
+    if keys is None:
+        logger.error("Cannot verify gate tokens: set PASS_TOKEN_SECRET or SECRET_KEY")
+        return None, 'not_configured'
+
+    try:
+        payload, signature = token.strip().split('.')
+        supplied = _b64decode(signature)
+    except (AttributeError, ValueError):
+        return None, 'malformed'
+
+    _, verification_keys = keys
+    message = payload.encode('ascii', 'ignore')
+    if not any(hmac.compare_digest(hmac.digest(key, message, 'sha256'), supplied)
+               for key in verification_keys):
+        return None, 'bad_signature'
+
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None, 'malformed'
+
+    now = (now or datetime.now(timezone.utc)).timestamp()
+    if now + CLOCK_SKEW_SECONDS < claims.get('nbf', 0):
+        return claims, 'not_yet_valid'
+    if now - CLOCK_SKEW_SECONDS > claims.get('exp', 0):
+        return claims, 'expired'
+    return claims, None
+
+
+def token_expiry(token):
+    """Returns the expiry of a token as a UTC datetime without checking its signature, or None."""
+    try:
+        claims = json.loads(_b64decode(token.split('.')[0]))
+        return datetime.fromtimestamp(claims['exp'], timezone.utc)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def qr_svg(token):
+    """Returns the token as an inline SVG QR code, or None if the qrcode package is not installed."""
+    try:
+        import qrcode
+        import qrcode.image.svg
+    except ImportError:
+        return None
+    image = qrcode.make(token, image_factory=qrcode.image.svg.SvgPathImage, box_size=8, border=2)
+    return image.to_string(encoding='unicode')
@@ -0,0 +1,332 @@
+"""
+On-Demand Request Profiling
+A sampling profiler that main admins can switch on for a single request
+(append `?__profile=1`) or for a fraction of all requests. Each profiled
+request produces:
+
+- <id>.json: summary with wall, CPU, Firestore and template render time
+- <id>.speedscope.json: wall-clock and CPU profiles for https://www.speedscope.app
+- <id>.collapsed.txt / <id>.cpu.collapsed.txt: collapsed stacks for flamegraph.pl
+
+Files are written to PROFILE_DIR (default instance/profiles) and the newest
+PROFILE_KEEP (default 50) are kept. PROFILE_INTERVAL_MS sets the sampling interval (default 2).
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from flask import before_render_template, g, request, session, template_rendered
+
+from metrics import current_usage
+
+logger = logging.getLogger(__name__)
+
+# Streaming and self-referential endpoints are never profiled
+EXCLUDED_ENDPOINTS = frozenset(['static', 'metrics', 'student.pass_events', 'faculty.queue_events'])
+PROFILE_FILES = {
+    'summary': ('.json', 'application/json'),
+    'speedscope': ('.speedscope.json', 'application/json'),
+    'collapsed': ('.collapsed.txt', 'text/plain'),
+    'cpu_collapsed': ('.cpu.collapsed.txt', 'text/plain'),
+}
+
+
+def _thread_cpu_clock(thread_id):
+    """Returns a callable reading the CPU time of another thread, or None where unsupported."""
+    try:
+        clock_id = time.pthread_getcpuclockid(thread_id)
+        return lambda: time.clock_gettime(clock_id)
+    except (AttributeError, OSError):
+        return None
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval, weighting each stack by wall and CPU time."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.wall = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.samples = 0
+        self._cpu_clock = _thread_cpu_clock(thread_id)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _stack(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _run(self):
+        last_wall = time.perf_counter()
+        last_cpu = self._cpu_clock() if self._cpu_clock else 0.0
+        while not self._stop.wait(self.interval):
+            now_wall = time.perf_counter()
+            now_cpu = self._cpu_clock() if self._cpu_clock else 0.0
+            stack = self._stack()
+            if stack:
+                self.wall[stack] += now_wall - last_wall
+                self.cpu[stack] += now_cpu - last_cpu
+                self.samples += 1
+            last_wall, last_cpu = now_wall, now_cpu
+
+
+class ProfilingSettings:
+    """Process-wide sampling configuration, changed by main admins at runtime."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.endpoint_prefix = ''
+        self.remaining = None
+
+    def update(self, rate, endpoint_prefix='', remaining=None):
+        with self._lock:
+            self.rate = max(0.0, min(1.0, rate))
+            self.endpoint_prefix = endpoint_prefix or ''
+            self.remaining = remaining
+
+    def snapshot(self):
+        return {'rate': self.rate, 'endpoint_prefix': self.endpoint_prefix, 'remaining': self.remaining}
+
+    def should_sample(self, endpoint):
+        if not self.rate or not endpoint.startswith(self.endpoint_prefix):
+            return False
+        if random.random() >= self.rate:
+            return False
+        with self._lock:
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    self.rate = 0.0
+                    return False
+                self.remaining -= 1
+        return True
+
+
+profiling_settings = ProfilingSettings()
+
+
+# --- Output ---
+def profile_dir():
+    default = os.path.join(os.path.dirname(__file__), 'instance', 'profiles')
+    return os.getenv('PROFILE_DIR', default)
+
+
+def _short_path(filename, root):
+    """App files relative to the project, libraries relative to site-packages."""
+    if filename.startswith(root):
+        return os.path.relpath(filename, root)
+    if 'site-packages' + os.sep in filename:
+        return filename.split('site-packages' + os.sep, 1)[1]
+    return filename
+
+
+def _frame_name(frame, root):
+    name, filename, line = frame
+    return f"{name} ({_short_path(filename, root)}:{line})"
+
+
+def _collapsed(weights, root, label):
+    lines = []
+    for stack, seconds in sorted(weights.items(), key=lambda item: -item[1]):
+        micros = int(seconds * 1e6)
+        if micros:
+            frames = [label] + [_frame_name(f, root).replace(';', ':') for f in stack]
+            lines.append(f"{';'.join(frames)} {micros}")
+    return '\n'.join(lines) + '\n'
+
+
+def _speedscope(sampler, root, label):
+    frame_index = {}
+    frames = []
+
+    def index(frame):
+        if frame not in frame_index:
+            name, filename, line = frame
+            frame_index[frame] = len(frames)
+            frames.append({'name': name, 'file': _short_path(filename, root), 'line': line})
+        return frame_index[frame]
+
+    def profile(name, weights):
+        stacks = [(stack, seconds) for stack, seconds in weights.items() if seconds > 0]
+        total = sum(seconds for _, seconds in stacks)
+        return {
+            'type': 'sampled',
+            'name': name,
+            'unit': 'microseconds',
+            'startValue': 0,
+            'endValue': int(total * 1e6),
+            'samples': [[index(f) for f in stack] for stack, _ in stacks],
+            'weights': [int(seconds * 1e6) for _, seconds in stacks],
+        }
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': label,
+        'exporter': 'gate-pass profiling.py',
+        'activeProfileIndex': 0,
+        'profiles': [profile(f"{label} (wall)", sampler.wall), profile(f"{label} (cpu)", sampler.cpu)],
+        'shared': {'frames': frames},
+    }
+
+
+def _prune(directory, keep):
+    summaries = sorted(
+        (name for name in os.listdir(directory) if name.endswith('.json') and not name.endswith('.speedscope.json')),
+        key=lambda name: os.path.getmtime(os.path.join(directory, name)),
+        reverse=True,
+    )
+    for stale in summaries[keep:]:
+        profile_id = stale[:-len('.json')]
+        for suffix, _ in PROFILE_FILES.values():
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def save_profile(sampler, summary):
+    """Writes the summary, speedscope and collapsed-stack files for one profiled request."""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    root = os.path.dirname(os.path.abspath(__file__)) + os.sep
+    label = summary['endpoint']
+    profile_id = summary['id']
+    outputs = {
+        'summary': json.dumps(summary, indent=2),
+        'speedscope': json.dumps(_speedscope(sampler, root, label)),
+        'collapsed': _collapsed(sampler.wall, root, label),
+        'cpu_collapsed': _collapsed(sampler.cpu, root, label),
+    }
+    # Summary last, so a listed profile always has its stack files
+    for kind in ('speedscope', 'collapsed', 'cpu_collapsed', 'summary'):
+        with open(os.path.join(directory, profile_id + PROFILE_FILES[kind][0]), 'w') as f:
+            f.write(outputs[kind])
+    _prune(directory, int(os.getenv('PROFILE_KEEP', '50')))
+
+
+def list_profiles():
+    """Returns saved profile summaries, newest first."""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    summaries = []
+    for name in os.listdir(directory):
+        if name.endswith('.json') and not name.endswith('.speedscope.json'):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    summaries.sort(key=lambda s: s.get('started_at', ''), reverse=True)
+    return summaries
+
+
+def profile_file(profile_id, kind):
+    """Returns (path, mimetype) for one output of a saved profile, or None."""
+    if kind not in PROFILE_FILES or not profile_id.replace('-', '').isalnum():
+        return None
+    suffix, mimetype = PROFILE_FILES[kind]
+    path = os.path.join(profile_dir(), profile_id + suffix)
+    return (path, mimetype) if os.path.exists(path) else None
+
+
+# --- Request hooks ---
+def _wants_profile(endpoint):
+    if endpoint is None or endpoint in EXCLUDED_ENDPOINTS or endpoint.startswith('admin.profiling'):
+        return False
+    if request.args.get('__profile') == '1' and session.get('is_main_admin'):
+        return True
+    return profiling_settings.should_sample(endpoint)
+
+
+def _on_before_render(sender, template, context, **extra):
+    state = g.get('_profile_state')
+    if state is not None:
+        state['render_started'].append(time.perf_counter())
+
+
+def _on_rendered(sender, template, context, **extra):
+    state = g.get('_profile_state')
+    if state is not None and state['render_started']:
+        elapsed = time.perf_counter() - state['render_started'].pop()
+        state['templates'].append({'name': template.name, 'ms': round(elapsed * 1000, 3)})
+
+
+def init_profiling(app):
+    """Registers the request hooks that start and finish opt-in profiles."""
+
+    @app.before_request
+    def _start_profile():
+        if not _wants_profile(request.endpoint):
+            return
+        sampler = StackSampler(threading.get_ident(), float(os.getenv('PROFILE_INTERVAL_MS', '2')) / 1000)
+        g._profile_state = {
+            'sampler': sampler,
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'wall_start': time.perf_counter(),
+            'cpu_start': time.thread_time(),
+            'render_started': [],
+            'templates': [],
+        }
+        sampler.start()
+
+    @app.after_request
+    def _finish_profile(response):
+        state = g.pop('_profile_state', None)
+        if state is None:
+            return response
+        wall = time.perf_counter() - state['wall_start']
+        cpu = time.thread_time() - state['cpu_start']
+        sampler = state['sampler']
+        sampler.stop()
+
+        usage = current_usage()
+        summary = {
+            'id': uuid.uuid4().hex[:12],
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'started_at': state['started_at'],
+            'requested_by': session.get('user_id'),
+            'wall_ms': round(wall * 1000, 3),
+            'cpu_ms': round(cpu * 1000, 3),
+            'firestore_ms': round(usage.firestore_seconds * 1000, 3) if usage else None,
+            'firestore_reads': usage.reads if usage else None,
+            'firestore_writes': usage.writes if usage else None,
+            'firestore_queries': usage.queries if usage else None,
+            'template_ms': round(sum(t['ms'] for t in state['templates']), 3),
+            'templates': state['templates'],
+            'samples': sampler.samples,
+        }
+        try:
+            save_profile(sampler, summary)
+            response.headers['X-Profile-Id'] = summary['id']
+        except Exception as e:
+            logger.error(f"Could not save profile for {request.endpoint}: {e}")
+        return response
+
+    before_render_template.connect(_on_before_render, app)
+    template_rendered.connect(_on_rendered, app)
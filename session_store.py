@@ -0,0 +1,200 @@
+"""
+Server-Side Session Storage
+Keeps session data on the server so the browser cookie only carries an opaque session ID.
+
+Backends are selected with the SESSION_BACKEND environment variable:
+- sqlite: SQLite file shared by all workers on the host (SESSION_SQLITE_PATH, default)
+- memory: in-process LRU with TTL (single worker only; sessions are lost between workers)
+- cookie: Flask's built-in signed cookie session
+"""
+
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySessionStore:
+    """Thread-safe in-memory LRU of serialized sessions with per-entry expiry."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return data
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._entries[sid] = (time.time() + ttl, data)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+
+class SQLiteSessionStore:
+    """Session store backed by a SQLite file, usable from several worker processes."""
+
+    # Expired rows are purged once every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires_at >= ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, data, ttl):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+            (sid, data, time.time() + ttl),
+        )
+        with self._writes_lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, sid):
+        self._connection().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its server-side ID and whether it was modified."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface that keeps session data in a store and puts only the ID in the cookie."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def _new_sid():
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+        # Unknown or missing IDs always get a fresh one, never the one the client sent
+        return ServerSideSession(sid=self._new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        ttl = int(app.permanent_session_lifetime.total_seconds())
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), ttl)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=httponly,
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+
+
+def rotate_session_id(session):
+    """
+    Gives the session a new ID, dropping the old server-side entry.
+    Called on login so a session ID handed out before authentication can't be reused after it.
+    No-op for the cookie backend.
+    """
+    if not isinstance(session, ServerSideSession):
+        return
+    store = getattr(current_app.session_interface, 'store', None)
+    if store is not None and not session.new:
+        store.delete(session.sid)
+    session.sid = ServerSideSessionInterface._new_sid()
+    session.modified = True
+
+
+def init_session_store(app):
+    """Installs the session backend chosen by SESSION_BACKEND on the app."""
+    backend = os.getenv('SESSION_BACKEND', 'sqlite').lower()
+    if backend == 'cookie':
+        return
+    if backend == 'memory':
+        store = MemorySessionStore(max_entries=int(os.getenv('SESSION_MEMORY_MAX_ENTRIES', '10000')))
+    else:
+        if backend != 'sqlite':
+            logger.warning(f"Unknown SESSION_BACKEND '{backend}', using sqlite")
+        path = os.getenv('SESSION_SQLITE_PATH', os.path.join(app.instance_path, 'sessions.sqlite3'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        store = SQLiteSessionStore(path)
+    app.session_interface = ServerSideSessionInterface(store)
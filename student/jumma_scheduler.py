@@ -4,6 +4,10 @@ Generates automatic passes for male Muslim students during configured Jumma pray
 """
 
 from firebase_admin import firestore
+from db import get_db
+from metrics import instrument_job
+from pass_summaries import get_summary, has_pass_today, record_pass_created
+from pass_tokens import issue_token
 from datetime import datetime, timedelta
 import uuid
 import logging
@@ -21,7 +25,7 @@ def generate_automatic_jumma_passes():
     - No existing pass for today
     """
     try:
-        db = firestore.client()
+        db = get_db()
         
         # Get system settings to check if Jumma pass automation is enabled
         settings_ref = db.collection('settings').document('system').get()
@@ -57,25 +61,15 @@ def generate_automatic_jumma_passes():
         # Create passes for eligible students
         generated_count = 0
         failed_count = 0
-        today = datetime.now().date()
         
         for student in eligible_students:
             try:
                 student_id = student['id']
                 student_data = student['data']
                 
-                # Check if student already has a pass for today (any type)
-                today_start = datetime.combine(today, datetime.min.time())
-                today_end = datetime.combine(today, datetime.max.time())
-                
-                existing_passes = db.collection('passes').where('applicant_id', '==', student_id).where('date', '>=', today_start).where('date', '<=', today_end).stream()
-                
-                has_existing_pass = False
-                for _ in existing_passes:
-                    has_existing_pass = True
-                    break
-                
-                if has_existing_pass:
+                # The student's summary says whether they already have a pass for today (any type)
+                summary = get_summary(db, student_id)
+                if has_pass_today(summary):
                     logger.info(f"Student {student_id} already has a pass for today, skipping")
                     continue
                 
@@ -105,9 +99,13 @@ def generate_automatic_jumma_passes():
                     "created_at": firestore.SERVER_TIMESTAMP,
                     "auto_generated_at": datetime.now()
                 }
+                pass_data["gate_token"] = issue_token(pass_id, pass_data)
                 
-                # Save the pass
-                db.collection('passes').document(pass_id).set(pass_data)
+                # Save the pass together with the student's summary
+                batch = db.batch()
+                batch.set(db.collection('passes').document(pass_id), pass_data)
+                record_pass_created(batch, db, pass_id, pass_data, summary)
+                batch.commit()
                 generated_count += 1
                 logger.info(f"Generated automatic Jumma pass for student {student_id}")
                 
@@ -142,7 +140,7 @@ def schedule_jumma_pass_generation(scheduler, jumma_time_str="12:00"):
         hours, minutes = map(int, jumma_time_str.split(':'))
         
         scheduler.add_job(
-            func=generate_automatic_jumma_passes,
+            func=instrument_job('jumma_pass_generation', generate_automatic_jumma_passes),
             trigger="cron",
             day_of_week=4,  # 4 = Friday (0 = Monday, 6 = Sunday)
             hour=hours,
@@ -1,9 +1,17 @@
-from flask import Blueprint, render_template, session, redirect, url_for, request, flash
+from flask import Blueprint, render_template, session, redirect, url_for, request, flash, Response
 from functools import wraps
-from firebase_admin import firestore, auth
+from firebase_admin import firestore
+from db import get_db, get_system_settings
 from datetime import datetime
+import logging
 import uuid
 from .jumma_scheduler import generate_automatic_jumma_passes
+from notifications import inbox_keys, list_notifications, mark_all_read, unread_count
+from approval_routing import approval_router, first_pending
+from pass_escalation import escalation_deadline
+from pass_events import pass_watcher, sse_stream
+from pass_summaries import get_summary, get_todays_pass, list_approved_passes, record_pass_created, todays_stub
+from pass_tokens import issue_token, qr_svg
 
 student_bp = Blueprint('student', __name__, url_prefix='/student', template_folder='templates')
 
@@ -18,13 +26,28 @@ def login_required(f):
     return decorated_function
 
 
+# Full pages that show the unread badge; fragments and the (just read) notifications page skip the read
+BADGE_ENDPOINTS = frozenset(('student.dashboard', 'student.gate_pass', 'student.profile'))
+
+
+@student_bp.context_processor
+def inject_unread_notifications():
+    """Unread badge for the sidebar: one read of the student's inbox counter."""
+    if 'user_id' not in session or request.endpoint not in BADGE_ENDPOINTS:
+        return {}
+    try:
+        return {'unread_notifications': unread_count(get_db(), session['user_id'])}
+    except Exception:
+        return {'unread_notifications': 0}
+
+
 # --- Routes ---
 
 @student_bp.route('/dashboard')
 @login_required
 def dashboard():
     user_uid = session['user_id']
-    db = firestore.client()
+    db = get_db()
     student_data = {}
     system_settings = {}
     is_open = False
@@ -43,9 +66,7 @@ def dashboard():
         return redirect(url_for('auth.logout'))
 
     try:
-        settings_ref = db.collection('settings').document('system').get()
-        if settings_ref.exists:
-            system_settings = settings_ref.to_dict()
+        system_settings = get_system_settings()
         
         # Check if pass application is open
         start_time_str = system_settings.get('student_pass_start_time', '00:00')
@@ -70,8 +91,17 @@ def dashboard():
     except Exception as e:
         flash(f"Error fetching system settings: {e}", "danger")
 
+    # Pass counts and today's pass come from the student's summary document: one read
+    try:
+        summary = get_summary(db, user_uid)
+    except Exception as e:
+        logging.error(f"Error fetching pass summary: {e}")
+        summary = {}
+
     return render_template('student/dashboard.html', 
                              student=student_data, 
+                             summary=summary,
+                             todays_pass=todays_stub(summary),
                              settings=system_settings,
                              is_pass_application_open=is_open,
                              closed_reason=closed_reason)
@@ -81,7 +111,7 @@ def dashboard():
 @login_required
 def gate_pass():
     user_uid = session['user_id']
-    db = firestore.client()
+    db = get_db()
     student_data = {}
     existing_pass = None
     is_open = False
@@ -99,34 +129,18 @@ def gate_pass():
         flash(f"Error fetching your profile: {e}", "danger")
         return redirect(url_for('auth.logout'))
 
-    approved_passes = []
+    # Today's pass comes from the student's summary document rather than a query over their passes
     try:
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        passes_ref = db.collection('passes').where('applicant_id', '==', user_uid).where('date', '>=', today_start).stream()
-        for p in passes_ref:
-            existing_pass = p.to_dict()
-            existing_pass['id'] = p.id
-            break
+        summary = get_summary(db, user_uid)
+        existing_pass = get_todays_pass(db, summary)
     except Exception as e:
+        summary = {}
         flash(f"Error checking for existing passes: {e}", "danger")
-    
-    # Fetch all approved passes (all time) for this student
-    try:
-        all_passes = db.collection('passes').where('applicant_id', '==', user_uid).where('status', '==', 'approved').order_by('date', direction=firestore.Query.DESCENDING).stream()
-        for p in all_passes:
-            pass_data = p.to_dict()
-            pass_data['id'] = p.id
-            approved_passes.append(pass_data)
-    except Exception as e:
-        # Query might fail, which is fine
-        pass
 
     # Check if pass application is open (within working hours/days)
     try:
-        settings_ref = db.collection('settings').document('system').get()
-        if settings_ref.exists:
-            system_settings = settings_ref.to_dict()
-            
+        system_settings = get_system_settings()
+        if system_settings:
             start_time_str = system_settings.get('student_pass_start_time', '00:00')
             end_time_str = system_settings.get('student_pass_end_time', '23:59')
             working_days = system_settings.get('student_working_days', [])
@@ -158,6 +172,8 @@ def gate_pass():
             return redirect(url_for('student.dashboard'))
 
         try:
+            approvals = approval_router.student_chain(student_data)
+            current = first_pending(approvals)
             pass_data = {
                 "pass_id": str(uuid.uuid4()),
                 "applicant_id": user_uid,
@@ -171,32 +187,54 @@ def gate_pass():
                 "reason": request.form.get('reason'),
                 "date": firestore.SERVER_TIMESTAMP,
                 "out_time": datetime.now().strftime('%H:%M'),
-                "status": "pending",
-                "approvals": [
-                    {'role': f"mentor_{student_data.get('academic_year')}_{student_data.get('branch')}_{student_data.get('section')}", 'status': 'pending'},
-                    {'role': f"hod_{student_data.get('branch')}", 'status': 'pending'}
-                ],
-                "current_approver": f"mentor_{student_data.get('academic_year')}_{student_data.get('branch')}_{student_data.get('section')}"
+                # Every step auto-approved (all approvers absent) means the pass is approved outright
+                "status": "pending" if current is not None else "approved",
+                "approvals": approvals,
+                "current_approver": approvals[current]['role'] if current is not None else None,
+                "escalate_at": escalation_deadline(approvals[current]['role']) if current is not None else None
             }
-            db.collection('passes').document(pass_data['pass_id']).set(pass_data)
+            if current is None:
+                pass_data["gate_token"] = issue_token(pass_data['pass_id'], pass_data)
+            batch = db.batch()
+            batch.set(db.collection('passes').document(pass_data['pass_id']), pass_data)
+            record_pass_created(batch, db, pass_data['pass_id'], pass_data, summary)
+            batch.commit()
             flash("Your pass has been submitted successfully!", "success")
             return redirect(url_for('student.dashboard'))
         except Exception as e:
             flash(f"An error occurred while submitting your pass: {e}", "danger")
 
+    # Approved passes show their signed token as a QR code for the gate scanner
+    gate_qr = None
+    if existing_pass and existing_pass.get('gate_token'):
+        gate_qr = qr_svg(existing_pass['gate_token'])
+
     return render_template('student/gate_pass.html', 
                          student=student_data, 
                          existing_pass=existing_pass,
-                         approved_passes=approved_passes,
+                         gate_qr=gate_qr,
+                         summary=summary,
                          is_pass_application_open=is_open,
                          closed_reason=closed_reason)
 
 
+@student_bp.route('/pass-history')
+@login_required
+def pass_history():
+    """One page of the student's approved passes, loaded by the gate pass page after it renders."""
+    try:
+        passes, next_cursor = list_approved_passes(get_db(), session['user_id'], cursor=request.args.get('cursor'))
+    except Exception as e:
+        logging.error(f"Error fetching pass history: {e}")
+        passes, next_cursor = [], None
+    return render_template('student/_pass_history.html', approved_passes=passes, next_cursor=next_cursor)
+
+
 @student_bp.route('/profile')
 @login_required
 def profile():
     user_uid = session['user_id']
-    db = firestore.client()
+    db = get_db()
     student_data = {}
 
     try:
@@ -214,6 +252,38 @@ def profile():
     return render_template('student/profile.html', student=student_data)
 
 
+@student_bp.route('/pass-events')
+@login_required
+def pass_events():
+    """Server-Sent Events stream of status changes for the student's own passes."""
+    user_uid = session['user_id']
+    subscription = pass_watcher.subscribe_applicant(user_uid)
+    stream = sse_stream(subscription, lambda: pass_watcher.unsubscribe_applicant(user_uid, subscription))
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@student_bp.route('/notifications')
+@login_required
+def notifications():
+    user_uid = session['user_id']
+    db = get_db()
+    user_info = session.get('user_info', {})
+    cursor = request.args.get('cursor')
+    next_cursor = None
+
+    try:
+        keys = inbox_keys(user_uid, 'student', user_info.get('branch'))
+        notifications, next_cursor = list_notifications(db, keys, cursor=cursor)
+        if not cursor:
+            mark_all_read(db, user_uid)
+    except Exception as e:
+        flash(f"Error fetching notifications: {e}", "danger")
+        notifications = []
+
+    return render_template('student/notifications.html', notifications=notifications, next_cursor=next_cursor)
+
+
 @student_bp.route('/generate-jumma-passes', methods=['POST'])
 @login_required
 def trigger_jumma_pass_generation():
@@ -223,7 +293,7 @@ def trigger_jumma_pass_generation():
     """
     # Check if user is admin (has access to this function)
     user_uid = session['user_id']
-    db = firestore.client()
+    db = get_db()
     
     try:
         user_ref = db.collection('users').document(user_uid).get()
@@ -0,0 +1,72 @@
+"""
+Shared fixtures. Every test runs against the in-memory backend (DB_BACKEND=memory)
+with a fresh store, and the listener singletons are stopped afterwards so the
+next test's store is watched from scratch.
+"""
+
+import os
+import sys
+
+# These must be set before the app modules load
+os.environ['DB_BACKEND'] = 'memory'
+os.environ['SESSION_BACKEND'] = 'memory'
+os.environ['SCHEDULER_BOOTSTRAP'] = 'off'
+os.environ['SETTINGS_CACHE_TTL'] = '0'
+os.environ['PASS_SEARCH_DB'] = ':memory:'
+os.environ.setdefault('PASS_TOKEN_SECRET', 'test-secret')
+os.environ.setdefault('GATE_API_KEY', 'test-gate-key')
+os.environ.pop('MEMORY_SEED_PATH', None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import db as db_module  # noqa: E402
+
+
+def _stop_listeners():
+    from approval_routing import approval_router
+    from pass_events import pass_watcher
+    from pass_revocations import revocation_index
+    from pass_search import pass_search_index
+    for listener in (approval_router, pass_watcher, revocation_index, pass_search_index):
+        listener.stop()
+
+
+@pytest.fixture
+def db():
+    with db_module._memory_lock:
+        db_module._memory_db = None
+        db_module._memory_auth = None
+    db_module.invalidate_system_settings()
+    yield db_module.get_db()
+    _stop_listeners()
+
+
+@pytest.fixture
+def auth(db):
+    return db_module.get_auth()
+
+
+@pytest.fixture
+def app(db):
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_user(auth, db, collection, email, profile, password='pw'):
+    """Creates an account and its profile document; returns the uid."""
+    user = auth.create_user(email=email, password=password, display_name=profile.get('name'))
+    db.collection(collection).document(user.uid).set({'email': email, **profile})
+    return user.uid
+
+
+def login(client, email, password='pw'):
+    return client.post('/auth/login', data={'email': email, 'password': password})
@@ -0,0 +1,46 @@
+import time
+
+import approval_routing
+from approval_routing import ApprovalRouter
+
+
+def test_chain_routes_to_present_mentor(db):
+    db.collection('faculty').document('f1').set({'name': 'F', 'assigned_student_roles': ['mentor_2_CSE_A']})
+    router = ApprovalRouter()
+    try:
+        chain = router.student_chain({'academic_year': '2', 'branch': 'CSE', 'section': 'A'})
+        assert chain[0] == {'role': 'mentor_2_CSE_A', 'status': 'pending'}
+        assert router.faculty_name('f1') == 'F'
+    finally:
+        router.stop()
+
+
+def test_failed_start_falls_back_at_once_and_is_not_retried(db, monkeypatch):
+    attempts = []
+
+    def unavailable():
+        attempts.append(1)
+        raise RuntimeError('firestore unavailable')
+    monkeypatch.setattr(approval_routing, 'get_db', unavailable)
+    router = ApprovalRouter()
+
+    started = time.monotonic()
+    assert router.wait_ready(timeout=5) is False
+    chain = router.student_chain({'academic_year': '2', 'branch': 'CSE', 'section': 'A'})
+    assert time.monotonic() - started < 1
+    assert [step['role'] for step in chain] == ['mentor_2_CSE_A', 'hod_CSE']
+    assert len(attempts) == 1
+
+
+def test_start_is_retried_after_the_retry_window(db, monkeypatch):
+    router = ApprovalRouter()
+    real_get_db = approval_routing.get_db
+    monkeypatch.setattr(approval_routing, 'get_db', lambda: (_ for _ in ()).throw(RuntimeError('down')))
+    assert router.wait_ready(timeout=1) is False
+
+    monkeypatch.setattr(approval_routing, 'get_db', real_get_db)
+    router._start_failed_at -= approval_routing.START_RETRY_SECONDS
+    try:
+        assert router.wait_ready(timeout=5) is True
+    finally:
+        router.stop()
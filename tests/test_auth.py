@@ -0,0 +1,46 @@
+from firebase_admin import auth as firebase_auth
+
+from conftest import create_user, login
+
+
+def test_wrong_password_flashes_invalid_credentials(client, auth, db):
+    create_user(auth, db, 'students', 's@x.com', {'name': 'S'})
+    response = client.post('/auth/login', data={'email': 's@x.com', 'password': 'bad'}, follow_redirects=True)
+    assert response.status_code == 200
+    assert b'Invalid email or password.' in response.data
+    with client.session_transaction() as session:
+        assert 'user_id' not in session
+
+
+def test_unknown_email_flashes_invalid_credentials(client, db):
+    response = client.post('/auth/login', data={'email': 'nobody@x.com', 'password': 'pw'}, follow_redirects=True)
+    assert b'Invalid email or password.' in response.data
+
+
+def test_rejected_id_token_flashes_invalid_token(client, auth, db, monkeypatch):
+    create_user(auth, db, 'students', 's@x.com', {'name': 'S'})
+
+    def reject(id_token, check_revoked=False):
+        raise firebase_auth.InvalidIdTokenError('Invalid ID token.')
+    monkeypatch.setattr(auth, 'verify_id_token', reject)
+
+    response = client.post('/auth/login', data={'email': 's@x.com', 'password': 'pw'}, follow_redirects=True)
+    assert response.status_code == 200
+    assert b'Invalid ID token.' in response.data
+
+
+def test_account_without_profile_is_not_logged_in(client, auth, db):
+    auth.create_user(email='ghost@x.com', password='pw')
+    response = client.post('/auth/login', data={'email': 'ghost@x.com', 'password': 'pw'}, follow_redirects=True)
+    assert b'not assigned a role' in response.data
+    with client.session_transaction() as session:
+        assert 'user_id' not in session
+
+
+def test_student_login_sets_session(client, auth, db):
+    uid = create_user(auth, db, 'students', 's@x.com', {'name': 'S'})
+    response = login(client, 's@x.com')
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session['user_id'] == uid
+        assert session['user_role'] == 'student'
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from gate_events import GateEventLog, _reconcile_exit, _update_passes
+
+
+@pytest.fixture
+def logs(db, tmp_path):
+    """Two workers ingesting into the same WAL location, as under gunicorn."""
+    path = str(tmp_path / 'gate_events.wal')
+    first = GateEventLog(path, flush_interval=3600, late_grace_minutes=0)
+    second = GateEventLog(path, flush_interval=3600, late_grace_minutes=0)
+    yield first, second
+    first.stop()
+    second.stop()
+
+
+def _create_pass(db, pass_id='p1'):
+    db.collection('passes').document(pass_id).set({'applicant_id': 's1', 'status': 'approved'})
+
+
+def _scan(log, direction, at, return_by=None, pass_id='p1', gate='main'):
+    log.append([{'p': pass_id, 'a': 's1', 'd': direction, 'at': at, 'g': gate, 'r': return_by}])
+    log._flush_once()
+
+
+def _pass(db, pass_id='p1'):
+    return db.collection('passes').document(pass_id).get().to_dict()
+
+
+def test_workers_claim_separate_wal_files(logs):
+    first, second = logs
+    first.recover()
+    second.recover()
+    assert first.path != second.path
+
+
+def test_return_on_another_worker_is_not_flagged_overdue(db, logs):
+    first, second = logs
+    _create_pass(db)
+    now = time.time()
+    _scan(first, 'out', now - 7200, return_by=now - 3600)
+    _scan(second, 'in', now - 3700, return_by=now - 3600)
+
+    first._flag_overdue()
+    second._flag_overdue()
+    pass_data = _pass(db)
+    assert 'overdue_return' not in pass_data
+    assert 'return_due_at' not in pass_data
+    assert first.summary()['overdue_returns'] == second.summary()['overdue_returns'] == 0
+
+
+def test_return_flushed_before_exit_is_not_flagged_overdue(db, logs):
+    first, second = logs
+    _create_pass(db)
+    now = time.time()
+    _scan(second, 'in', now - 3700, return_by=now - 3600)
+    _scan(first, 'out', now - 7200, return_by=now - 3600)
+
+    first._flag_overdue()
+    assert 'overdue_return' not in _pass(db)
+    assert 'return_due_at' not in _pass(db)
+
+
+def test_pass_still_out_is_flagged_overdue_once(db, logs):
+    first, second = logs
+    _create_pass(db)
+    now = time.time()
+    _scan(first, 'out', now - 7200, return_by=now - 3600)
+
+    first._flag_overdue()
+    second._flag_overdue()
+    pass_data = _pass(db)
+    assert pass_data['overdue_return'] is True
+    assert 'return_due_at' not in pass_data
+    assert first.summary()['overdue_returns'] + second.summary()['overdue_returns'] == 1
+
+
+def test_pass_not_yet_due_is_not_flagged(db, logs):
+    first, _ = logs
+    _create_pass(db)
+    now = time.time()
+    _scan(first, 'out', now - 60, return_by=now + 3600)
+    first._flag_overdue()
+    assert 'overdue_return' not in _pass(db)
+
+
+def test_duplicate_exit_on_another_worker_keeps_first_exit(db, logs):
+    first, second = logs
+    _create_pass(db)
+    now = time.time()
+    _scan(first, 'out', now - 600, gate='north')
+    stamped = _pass(db)['actual_out']
+    _scan(second, 'out', now - 300, gate='south')
+
+    pass_data = _pass(db)
+    assert pass_data['actual_out'] == stamped
+    assert pass_data['out_gate'] == 'north'
+    assert second.summary()['writes'] == 0
+
+
+def test_exit_stamped_between_read_and_write_is_kept(db):
+    _create_pass(db)
+    ref = db.collection('passes').document('p1')
+    read_at = ref.get().update_time
+    ref.update({'actual_out': 'first', 'out_gate': 'north'})
+
+    written, missing = _update_passes(db, [('p1', {'actual_out': 'second', 'out_gate': 'south'}, read_at)],
+                                      reconcile=_reconcile_exit)
+    assert (written, missing) == ([], 0)
+    assert _pass(db)['actual_out'] == 'first'
+
+
+def test_scan_for_deleted_pass_is_not_recreated(db, logs):
+    first, _ = logs
+    _scan(first, 'in', time.time(), pass_id='gone')
+    assert not db.collection('passes').document('gone').get().exists
+    assert first.summary()['missing_passes'] == 1
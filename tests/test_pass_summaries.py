@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pass_summaries
+from pass_summaries import get_global_stats, get_summary, record_pass_created
+
+
+def _old_pass(db, pass_id, status='approved', applicant_id='s1'):
+    """A pass written before summaries existed: no counters are touched."""
+    db.collection('passes').document(pass_id).set({
+        'applicant_id': applicant_id, 'status': status, 'pass_type': 'outing',
+        'date': datetime.now(timezone.utc) - timedelta(days=1),
+    })
+
+
+def _new_pass(db, pass_id, applicant_id='s1'):
+    pass_data = {'applicant_id': applicant_id, 'status': 'pending', 'pass_type': 'outing',
+                 'date': datetime.now(timezone.utc)}
+    batch = db.batch()
+    batch.set(db.collection('passes').document(pass_id), pass_data)
+    record_pass_created(batch, db, pass_id, pass_data)
+    batch.commit()
+
+
+def _during_first_scan(monkeypatch, action):
+    """Runs `action` right after the backfill's first scan, before it writes."""
+    real = pass_summaries.summarise
+    calls = []
+
+    def summarise(passes):
+        summary = real(passes)
+        if not calls:
+            calls.append(1)
+            action()
+        return summary
+    monkeypatch.setattr(pass_summaries, 'summarise', summarise)
+
+
+def test_global_backfill_counts_existing_passes(db):
+    _old_pass(db, 'p1')
+    _old_pass(db, 'p2', status='rejected')
+    stats = get_global_stats(db)
+    assert stats['total_passes'] == 2
+    assert stats['counts_by_status'] == {'approved': 1, 'rejected': 1}
+    assert stats['backfilled_at']
+    assert db.collection('pass_stats').document('global').get().to_dict()['total_passes'] == 2
+
+
+def test_global_backfill_keeps_increment_landing_mid_scan(db, monkeypatch):
+    _old_pass(db, 'p1')
+    _during_first_scan(monkeypatch, lambda: _new_pass(db, 'p2'))
+
+    get_global_stats(db)
+    stored = db.collection('pass_stats').document('global').get().to_dict()
+    assert stored['total_passes'] == 2
+    assert stored['counts_by_status'] == {'approved': 1, 'pending': 1}
+
+    # Later increments apply on top of the backfill
+    _new_pass(db, 'p3')
+    assert get_global_stats(db)['total_passes'] == 3
+
+
+def test_global_backfill_replaces_increments_written_before_it(db):
+    _old_pass(db, 'p1')
+    _new_pass(db, 'p2')  # counters exist, but only count p2
+    assert get_global_stats(db)['total_passes'] == 2
+
+
+def test_global_backfill_runs_once(db, monkeypatch):
+    _old_pass(db, 'p1')
+    first = get_global_stats(db)
+    monkeypatch.setattr(pass_summaries, 'summarise', lambda passes: (_ for _ in ()).throw(AssertionError('rescanned')))
+    assert get_global_stats(db)['backfilled_at'] == first['backfilled_at']
+
+
+def test_applicant_backfill_keeps_increment_landing_mid_scan(db, monkeypatch):
+    _old_pass(db, 'p1')
+    _during_first_scan(monkeypatch, lambda: _new_pass(db, 'p2'))
+
+    summary = get_summary(db, 's1')
+    stored = db.collection('pass_summaries').document('s1').get().to_dict()
+    assert stored['total_passes'] == summary['total_passes'] == 2
+    assert stored['counts_by_status'] == {'approved': 1, 'pending': 1}
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from conftest import create_user, login
+from pass_summaries import record_pass_created
+
+
+@pytest.fixture
+def faculty_client(client, auth, db):
+    create_user(auth, db, 'faculty', 'f@x.com',
+                {'name': 'F', 'department': 'CSE', 'assigned_roles': {'mentor_2_CSE_A': True}})
+    login(client, 'f@x.com')
+    return client
+
+
+def _create_pass(db, pass_id='p1', approvals=('mentor_2_CSE_A',)):
+    pass_data = {
+        'applicant_id': 'student1',
+        'applicant_type': 'student',
+        'pass_type': 'outing',
+        'reason': 'bank work',
+        'status': 'pending',
+        'date': datetime.now(timezone.utc),
+        'current_approver': approvals[0],
+        'approvals': [{'role': role, 'status': 'pending'} for role in approvals],
+    }
+    batch = db.batch()
+    batch.set(db.collection('passes').document(pass_id), pass_data)
+    record_pass_created(batch, db, pass_id, pass_data)
+    batch.commit()
+
+
+def _pass(db, pass_id='p1'):
+    return db.collection('passes').document(pass_id).get().to_dict()
+
+
+def _counts(db):
+    return db.collection('pass_summaries').document('student1').get().to_dict()['counts_by_status']
+
+
+def test_final_approval_issues_gate_token(faculty_client, db):
+    _create_pass(db)
+    faculty_client.post('/faculty/process_pass/p1/approved')
+    pass_data = _pass(db)
+    assert pass_data['status'] == 'approved'
+    assert pass_data['current_approver'] is None
+    assert pass_data['gate_token']
+    assert _counts(db) == {'pending': 0, 'approved': 1}
+
+
+def test_rejection_clears_current_approver(faculty_client, db):
+    _create_pass(db, approvals=('mentor_2_CSE_A', 'hod_CSE'))
+    faculty_client.post('/faculty/process_pass/p1/rejected')
+    pass_data = _pass(db)
+    assert pass_data['status'] == 'rejected'
+    assert pass_data['current_approver'] is None
+
+
+def test_approving_rejected_pass_changes_nothing(faculty_client, db):
+    _create_pass(db)
+    faculty_client.post('/faculty/process_pass/p1/rejected')
+    # A stale rejected pass that still names its approver, as written before the fix
+    db.collection('passes').document('p1').update({'current_approver': 'mentor_2_CSE_A'})
+
+    response = faculty_client.post('/faculty/process_pass/p1/approved', follow_redirects=True)
+    assert b'already been rejected' in response.data
+    pass_data = _pass(db)
+    assert pass_data['status'] == 'rejected'
+    assert 'gate_token' not in pass_data
+    assert _counts(db) == {'pending': 0, 'rejected': 1}
+
+
+@pytest.mark.parametrize('status', ['approved', 'auto_approved', 'revoked'])
+def test_non_pending_pass_is_refused(faculty_client, db, status):
+    _create_pass(db)
+    db.collection('passes').document('p1').update({'status': status})
+    before = _pass(db)
+    faculty_client.post('/faculty/process_pass/p1/rejected')
+    assert _pass(db) == before
+
+
+def test_unknown_action_is_refused(faculty_client, db):
+    _create_pass(db)
+    before = _pass(db)
+    faculty_client.post('/faculty/process_pass/p1/escalated')
+    assert _pass(db) == before
+
+
+def test_pass_changed_after_read_is_not_overwritten(faculty_client, db, monkeypatch):
+    _create_pass(db)
+
+    def escalate_meanwhile(pass_id, pass_data):
+        # The escalation sweep auto-approves the pass between the faculty read and write
+        db.collection('passes').document(pass_id).update({'status': 'auto_approved', 'current_approver': None})
+        return 'token'
+    monkeypatch.setattr('faculty.routes.issue_token', escalate_meanwhile)
+
+    response = faculty_client.post('/faculty/process_pass/p1/approved', follow_redirects=True)
+    assert b'changed while you were reviewing it' in response.data
+    pass_data = _pass(db)
+    assert pass_data['status'] == 'auto_approved'
+    assert 'gate_token' not in pass_data
+    assert _counts(db) == {'pending': 1}
@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import create_user, login
+from notifications import send_notification
+
+
+@pytest.fixture
+def counted_reads(monkeypatch):
+    """Counts unread-counter reads made by the blueprints' context processors."""
+    calls = []
+    import faculty.routes
+    import student.routes
+    for module in (student.routes, faculty.routes):
+        real = module.unread_count
+        monkeypatch.setattr(module, 'unread_count', lambda db, uid, real=real: calls.append(uid) or real(db, uid))
+    return calls
+
+
+def test_student_fragment_skips_unread_read(client, auth, db, counted_reads):
+    create_user(auth, db, 'students', 's@x.com', {'name': 'S', 'branch': 'CSE'})
+    login(client, 's@x.com')
+    assert client.get('/student/pass-history').status_code == 200
+    assert counted_reads == []
+
+
+def test_student_page_shows_unread_badge(client, auth, db, counted_reads):
+    uid = create_user(auth, db, 'students', 's@x.com', {'name': 'S', 'branch': 'CSE'})
+    send_notification(db, 'students', 'Hostel closes early today')
+    login(client, 's@x.com')
+    response = client.get('/student/profile')
+    assert response.status_code == 200
+    assert counted_reads == [uid]
+    assert b'rounded-full px-2 py-0.5">1</span>' in response.data
+
+
+def test_faculty_fragments_skip_unread_read(client, auth, db, counted_reads):
+    create_user(auth, db, 'faculty', 'f@x.com', {'name': 'F', 'department': 'CSE', 'assigned_roles': {}})
+    login(client, 'f@x.com')
+    assert client.get('/faculty/personal-passes').status_code == 200
+    assert client.get('/faculty/queue').status_code == 200
+    assert counted_reads == []
+    assert client.get('/faculty/dashboard').status_code == 200
+    assert len(counted_reads) == 1